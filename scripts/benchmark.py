@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import os
+import time
+import json
+import uuid
+import shutil
+import subprocess
+import numpy as np
+import pyslow5
+
+"""
+Generate a synthetic BLOW5 file and run the full buttery-eel pipeline against
+the mock basecall server (--mock_server) for a set of scenarios, reporting
+reads/s, samples/s, peak RSS per process and queue occupancy.
+This measures the python side overhead of buttery-eel, not basecalling.
+"""
+
+# extra buttery-eel args and output extension for each scenario
+SCENARIOS = {
+    "simplex": ([], "fastq"),
+    "duplex": (["--duplex"], "fastq"),
+    "qscore": (["--qscore", "10"], "fastq"),
+    "barcode": (["--barcode_kits", "SQK-NBD114-24"], "fastq"),
+    "moves": (["--moves_out"], "sam"),
+    "seq_sum": (["--seq_sum"], "fastq"),
+}
+
+
+class MyParser(argparse.ArgumentParser):
+    def error(self, message):
+        sys.stderr.write('error: %s\n' % message)
+        self.print_help()
+        sys.exit(2)
+
+
+def get_lengths(args, rng):
+    '''
+    draw signal lengths from the chosen distribution
+    '''
+    if args.length_dist == "fixed":
+        lengths = np.full(args.reads, args.mean_length)
+    elif args.length_dist == "uniform":
+        lengths = rng.integers(args.min_length, args.max_length, args.reads, endpoint=True)
+    else:
+        # lognormal with the given mean, sigma controls the long tail
+        mu = np.log(args.mean_length) - (args.length_sigma ** 2) / 2
+        lengths = rng.lognormal(mu, args.length_sigma, args.reads)
+    return np.clip(lengths, args.min_length, args.max_length).astype(np.int64)
+
+
+def generate_blow5(args, filename):
+    '''
+    write a synthetic blow5 file, returns number of reads and samples
+    '''
+    rng = np.random.default_rng(args.seed)
+    lengths = get_lengths(args, rng)
+    s5 = pyslow5.Open(filename, 'w')
+    header, end_reason_labels = s5.get_empty_header(aux=True)
+    for read_group in range(args.read_groups):
+        rg_header = {key: "." for key in header}
+        rg_header["run_id"] = "bench_run_{}".format(read_group)
+        rg_header["protocol_run_id"] = "bench_protocol_run_{}".format(read_group)
+        rg_header["protocol_group_id"] = "bench"
+        rg_header["sample_id"] = "bench_sample"
+        rg_header["sample_frequency"] = "5000"
+        s5.write_header(rg_header, read_group=read_group, end_reason_labels=end_reason_labels)
+
+    read_numbers = [0] * args.channels
+    records = {}
+    auxs = {}
+    start_time = 0
+    for i in range(args.reads):
+        record, aux = s5.get_empty_record(aux=True)
+        read_id = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+        channel = i % args.channels
+        read_numbers[channel] += 1
+        length = int(lengths[i])
+        record["read_id"] = read_id
+        record["read_group"] = i % args.read_groups
+        record["digitisation"] = 8192.0
+        record["offset"] = 10.0
+        record["range"] = 1400.0
+        record["sampling_rate"] = 5000.0
+        record["len_raw_signal"] = length
+        record["signal"] = rng.integers(300, 700, length, dtype=np.int16)
+        aux["channel_number"] = str(channel + 1)
+        aux["median_before"] = 200.0
+        aux["read_number"] = read_numbers[channel]
+        aux["start_mux"] = 1 + (i % 4)
+        aux["start_time"] = start_time
+        aux["end_reason"] = 4
+        aux["tracked_scaling_shift"] = 0.0
+        aux["tracked_scaling_scale"] = 1.0
+        aux["predicted_scaling_shift"] = 0.0
+        aux["predicted_scaling_scale"] = 1.0
+        aux["num_reads_since_mux_change"] = 0
+        aux["time_since_mux_change"] = 0.0
+        aux["num_minknow_events"] = 1
+        aux["open_pore_level"] = 0.0
+        aux["expected_open_pore_level"] = 0.0
+        aux["selected_read_level"] = 0.0
+        start_time += length
+        records[read_id] = record
+        auxs[read_id] = aux
+        if len(records) >= 1000:
+            s5.write_record_batch(records, threads=args.slow5_threads, batchsize=1000, aux=auxs)
+            records = {}
+            auxs = {}
+    if len(records) > 0:
+        s5.write_record_batch(records, threads=args.slow5_threads, batchsize=1000, aux=auxs)
+    s5.close()
+    return args.reads, int(lengths.sum())
+
+
+def parse_stats(stdout):
+    '''
+    pull samples/s and [STATS] key=value lines out of buttery-eel output
+    '''
+    stats = {"procs": {}, "queues": {}}
+    for line in stdout.splitlines():
+        if line.startswith("Basecalled @ Samples/s:"):
+            stats["samples_per_sec"] = float(line.split(":")[1])
+        elif "[STATS]" in line:
+            # worker prints can share a line, so only take what follows the tag
+            fields = line.split("[STATS]")[1].split()
+            if "=" in fields[0]:
+                for field in fields:
+                    key, value = field.split("=")
+                    stats[key] = float(value)
+                continue
+            name = fields[0]
+            values = {}
+            for field in fields[1:]:
+                key, value = field.split("=")
+                values[key] = float(value)
+            if "queue_max" in values:
+                stats["queues"][name] = values
+            else:
+                stats["procs"][name] = values
+    return stats
+
+
+def run_scenario(args, name, input_file, num_reads):
+    '''
+    run buttery-eel on one scenario, returns a results dic
+    '''
+    extra, ext = SCENARIOS[name]
+    outdir = os.path.join(args.outdir, name)
+    # buttery-eel won't overwrite outputs, so start each run clean
+    if os.path.isdir(outdir):
+        shutil.rmtree(outdir)
+    os.makedirs(outdir)
+    cmd = args.eel.split() + ["-i", input_file, "-o", os.path.join(outdir, "reads.{}".format(ext)),
+                              "--mock_server", "--stats", "--quiet",
+                              "--procs", str(args.procs),
+                              "--slow5_threads", str(args.slow5_threads),
+                              "--slow5_batchsize", str(args.slow5_batchsize),
+                              "--max_read_queue_size", str(args.max_read_queue_size),
+                              "--slow5_batch_samples", str(args.slow5_batch_samples),
+                              "--max_queue_samples", str(args.max_queue_samples),
+                              "--mock_latency", str(args.mock_latency),
+                              "--mock_batch_size", str(args.mock_batch_size),
+                              "--mock_reject_rate", str(args.mock_reject_rate),
+                              "--mock_fail_rate", str(args.mock_fail_rate),
+                              "--log", os.path.join(outdir, "logs")] + extra
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    wall_time = time.perf_counter() - start
+    with open(os.path.join(outdir, "eel.log"), 'w') as f:
+        f.write(proc.stdout)
+
+    result = {"scenario": name, "exitcode": proc.returncode, "wall_time": wall_time}
+    if proc.returncode != 0:
+        return result
+    stats = parse_stats(proc.stdout)
+    result.update(stats)
+    basecall_time = stats.get("basecall_time", wall_time)
+    result["reads_per_sec"] = num_reads / basecall_time if basecall_time > 0 else 0.0
+    return result
+
+
+def print_results(results):
+    '''
+    print a table of results
+    '''
+    cols = ["scenario", "wall_s", "reads/s", "samples/s", "main_rss_kb", "reader_rss_kb", "writer_rss_kb",
+            "max_worker_rss_kb", "in_q_max", "in_q_mean", "out_q_max", "out_q_mean"]
+    print("\t".join(cols))
+    for res in results:
+        if res["exitcode"] != 0:
+            print("{}\tFAILED exitcode={}".format(res["scenario"], res["exitcode"]))
+            continue
+        procs = res["procs"]
+        queues = res["queues"]
+        reader = [v["peak_rss_kb"] for k, v in procs.items() if "read_worker" in k]
+        workers = [v["peak_rss_kb"] for k, v in procs.items() if k.startswith("basecall_worker")]
+        in_q = [v for k, v in queues.items() if k != "result_queue"]
+        out_q = queues.get("result_queue", {"queue_max": 0, "queue_mean": 0})
+        row = [res["scenario"],
+               "{:.2f}".format(res["wall_time"]),
+               "{:.1f}".format(res["reads_per_sec"]),
+               "{:.6e}".format(res.get("samples_per_sec", 0)),
+               int(procs.get("main", {}).get("peak_rss_kb", 0)),
+               int(max(reader)) if reader else 0,
+               int(procs.get("write_worker", {}).get("peak_rss_kb", 0)),
+               int(max(workers)) if workers else 0,
+               int(max([q["queue_max"] for q in in_q])) if in_q else 0,
+               "{:.2f}".format(sum([q["queue_mean"] for q in in_q]) / len(in_q)) if in_q else 0,
+               int(out_q["queue_max"]),
+               "{:.2f}".format(out_q["queue_mean"])]
+        print("\t".join([str(i) for i in row]))
+
+
+def main():
+    # ==========================================================================
+    # Software ARGS
+    # ==========================================================================
+    """
+    Example:
+
+    python3 scripts/benchmark.py -o bench --reads 20000 --procs 8 --scenarios simplex,seq_sum,moves
+
+    """
+
+    parser = MyParser(description="Benchmark buttery-eel python overhead using synthetic blow5 data and the mock basecall server",
+    epilog="Citation:...",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    # Args
+    parser.add_argument("-o", "--outdir", required=True,
+                        help="working directory for generated data and outputs")
+    parser.add_argument("-i", "--input",
+                        help="use an existing blow5 file instead of generating one")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS.keys()),
+                        help="comma separated list of scenarios to run: {}".format(",".join(SCENARIOS.keys())))
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="number of times to run each scenario")
+    parser.add_argument("--json",
+                        help="write full results to this json file")
+    parser.add_argument("--eel", default="{} -m buttery_eel.buttery_eel".format(sys.executable),
+                        help="command used to run buttery-eel")
+
+    data = parser.add_argument_group("Synthetic data Options")
+    data.add_argument("--reads", type=int, default=10000,
+                        help="number of reads to generate")
+    data.add_argument("--length_dist", choices=["lognormal", "uniform", "fixed"], default="lognormal",
+                        help="signal length distribution")
+    data.add_argument("--mean_length", type=int, default=40000,
+                        help="mean signal length in samples (lognormal and fixed)")
+    data.add_argument("--length_sigma", type=float, default=0.8,
+                        help="sigma of the lognormal length distribution, larger gives a longer tail")
+    data.add_argument("--min_length", type=int, default=200,
+                        help="minimum signal length in samples")
+    data.add_argument("--max_length", type=int, default=2000000,
+                        help="maximum signal length in samples")
+    data.add_argument("--channels", type=int, default=512,
+                        help="number of channels to spread reads over")
+    data.add_argument("--read_groups", type=int, default=1,
+                        help="number of read groups")
+    data.add_argument("--seed", type=int, default=1,
+                        help="random seed")
+
+    run = parser.add_argument_group("buttery-eel Options")
+    run.add_argument("--procs", type=int, default=4,
+                        help="--procs passed to buttery-eel")
+    run.add_argument("--slow5_threads", type=int, default=4,
+                        help="--slow5_threads passed to buttery-eel, also used to write the blow5")
+    run.add_argument("--slow5_batchsize", type=int, default=4000,
+                        help="--slow5_batchsize passed to buttery-eel")
+    run.add_argument("--max_read_queue_size", type=int, default=20000,
+                        help="--max_read_queue_size passed to buttery-eel")
+    run.add_argument("--slow5_batch_samples", type=int, default=0,
+                        help="--slow5_batch_samples passed to buttery-eel")
+    run.add_argument("--max_queue_samples", type=int, default=0,
+                        help="--max_queue_samples passed to buttery-eel")
+    run.add_argument("--mock_latency", type=float, default=0.0,
+                        help="--mock_latency passed to buttery-eel")
+    run.add_argument("--mock_batch_size", type=int, default=1000,
+                        help="--mock_batch_size passed to buttery-eel")
+    run.add_argument("--mock_reject_rate", type=float, default=0.0,
+                        help="--mock_reject_rate passed to buttery-eel")
+    run.add_argument("--mock_fail_rate", type=float, default=0.0,
+                        help="--mock_fail_rate passed to buttery-eel")
+
+    args = parser.parse_args()
+
+    scenarios = [i.strip() for i in args.scenarios.split(",")]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            sys.stderr.write("ERROR: unknown scenario: {}\n".format(name))
+            sys.exit(1)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    if args.input:
+        input_file = args.input
+        s5 = pyslow5.Open(input_file, 'r')
+        num_reads = 0
+        num_samples = 0
+        for read in s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, pA=False):
+            num_reads += 1
+            num_samples += read["len_raw_signal"]
+        s5.close()
+    else:
+        input_file = os.path.join(args.outdir, "bench.blow5")
+        sys.stderr.write("Generating {} reads to {}\n".format(args.reads, input_file))
+        num_reads, num_samples = generate_blow5(args, input_file)
+    sys.stderr.write("Input: {} reads, {} samples\n".format(num_reads, num_samples))
+
+    results = []
+    for name in scenarios:
+        for i in range(args.repeats):
+            sys.stderr.write("Running scenario: {} ({}/{})\n".format(name, i + 1, args.repeats))
+            res = run_scenario(args, name, input_file, num_reads)
+            res["repeat"] = i
+            if res["exitcode"] != 0:
+                sys.stderr.write("ERROR: scenario {} failed, see {}\n".format(name, os.path.join(args.outdir, name, "eel.log")))
+            results.append(res)
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"reads": num_reads, "samples": num_samples, "results": results}, f, indent=2)
+
+    if any([res["exitcode"] != 0 for res in results]):
+        sys.exit(1)
+
+    sys.stderr.write("Done!\n")
+
+if __name__ == '__main__':
+    main()
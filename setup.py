@@ -33,7 +33,8 @@ setuptools.setup(
     python_requires=">=3.9",
     install_requires=install_requires,
     setup_requires=["numpy"],
-    entry_points={"console_scripts":["buttery-eel=buttery_eel.buttery_eel:main"],},
+    entry_points={"console_scripts":["buttery-eel=buttery_eel.buttery_eel:main",
+                                      "buttery-eel-lookup=buttery_eel.index:main"],},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
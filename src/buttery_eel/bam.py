@@ -0,0 +1,184 @@
+import sys
+import re
+import gzip
+import struct
+import numpy as np
+
+from .encode import bam_array_tag
+
+# encoding of unaligned sam records to bam, and reading parent read ids back for --resume
+
+BAM_MAGIC = b"BAM\x01"
+# 4 bit codes of bases, anything else is N
+SEQ_CODES = "=ACMGRSVTWYHKDBN"
+SEQ_TABLE = bytes(SEQ_CODES.index(chr(c).upper()) if chr(c).upper() in SEQ_CODES else 15 for c in range(256))
+# phred+33 to phred
+QUAL_TABLE = bytes((c - 33) % 256 for c in range(256))
+CIGAR_OPS = "MIDNSHP=X"
+CIGAR_RE = re.compile(r"(\d+)([MIDNSHP=X])")
+# bytes per value of each tag/B array type
+TAG_SIZES = {"A": 1, "c": 1, "C": 1, "s": 2, "S": 2, "i": 4, "I": 4, "f": 4}
+
+
+def reg2bin(beg, end):
+    """
+    bam bin of a 0-based [beg, end) region, from the sam spec
+    """
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+def bam_int_tag(tag, value):
+    """
+    binary i tag, in the smallest type that holds the value, as htslib does
+    """
+    if value < 0:
+        if value >= -128:
+            return tag + struct.pack("<cb", b"c", value)
+        if value >= -32768:
+            return tag + struct.pack("<ch", b"s", value)
+        return tag + struct.pack("<ci", b"i", value)
+    if value <= 255:
+        return tag + struct.pack("<cB", b"C", value)
+    if value <= 65535:
+        return tag + struct.pack("<cH", b"S", value)
+    return tag + struct.pack("<cI", b"I", value)
+
+
+def bam_header(text):
+    """
+    binary bam header of a sam header, with no references as the records are unaligned
+    """
+    data = text.encode()
+    return BAM_MAGIC + struct.pack("<i", len(data)) + data + struct.pack("<i", 0)
+
+
+def sam_to_bam(line, arrays=None):
+    """
+    binary bam record of an unaligned sam record (no newline)
+    arrays is {tag: (subtype, array)} of B array tags to pack straight from numpy, eg, the move
+    table, rather than from their text in the record
+    """
+    fields = line.split("\t")
+    read_name, flag, rname, pos, mapq, cigar, rnext, pnext, tlen, seq, qual = fields[:11]
+    if rname != "*" or rnext != "*":
+        raise ValueError("only unaligned records can be written to bam")
+    cigar_ops = []
+    ref_len = 0
+    if cigar != "*":
+        for length, op in CIGAR_RE.findall(cigar):
+            cigar_ops.append(int(length) << 4 | CIGAR_OPS.index(op))
+            if op in "MDN=X":
+                ref_len += int(length)
+    if seq == "*":
+        seq = ""
+    l_seq = len(seq)
+    codes = np.frombuffer(seq.encode().translate(SEQ_TABLE), dtype=np.uint8)
+    if l_seq % 2 == 1:
+        codes = np.append(codes, np.uint8(0))
+    packed_seq = ((codes[0::2] << 4) | codes[1::2]).astype(np.uint8).tobytes()
+    if qual == "*":
+        packed_qual = b"\xff" * l_seq
+    else:
+        packed_qual = qual.encode().translate(QUAL_TABLE)
+    beg = int(pos) - 1
+    end = beg + ref_len if ref_len > 0 else beg + 1
+    name = read_name.encode() + b"\x00"
+    tags = []
+    for field in fields[11:]:
+        tag, tag_type, value = field[:2], field[3], field[5:]
+        btag = tag.encode()
+        if arrays is not None and tag in arrays:
+            subtype, array = arrays[tag]
+            tags.append(bam_array_tag(tag, subtype, array))
+        elif tag_type == "i":
+            tags.append(bam_int_tag(btag, int(value)))
+        elif tag_type == "f":
+            tags.append(btag + struct.pack("<cf", b"f", float(value)))
+        elif tag_type == "A":
+            tags.append(btag + b"A" + value.encode())
+        elif tag_type in "ZH":
+            tags.append(btag + tag_type.encode() + value.encode() + b"\x00")
+        elif tag_type == "B":
+            subtype = value[0]
+            dtype = np.float64 if subtype == "f" else np.int64
+            values = np.array(value[2:].split(","), dtype=dtype) if len(value) > 2 else np.array([], dtype=dtype)
+            tags.append(bam_array_tag(tag, subtype, values))
+        else:
+            raise ValueError("unknown sam tag type {} in {}".format(tag_type, field))
+    record = b"".join([struct.pack("<iiBBHHHiiii", -1, beg, len(name), int(mapq), reg2bin(beg, end), len(cigar_ops),
+                                   int(flag), l_seq, -1, int(pnext) - 1, int(tlen)),
+                       name,
+                       struct.pack("<{}I".format(len(cigar_ops)), *cigar_ops),
+                       packed_seq,
+                       packed_qual] + tags)
+    return struct.pack("<i", len(record)) + record
+
+
+def _find_z_tag(data, start, want):
+    """
+    value of a Z tag in the aux data of a bam record, None if it's not there
+    """
+    i = start
+    while i < len(data):
+        tag = data[i:i + 2]
+        tag_type = chr(data[i + 2])
+        i += 3
+        if tag_type in "ZH":
+            end = data.index(b"\x00", i)
+            if tag == want:
+                return data[i:end].decode()
+            i = end + 1
+        elif tag_type == "B":
+            subtype = chr(data[i])
+            count = struct.unpack_from("<i", data, i + 1)[0]
+            i += 5 + count * TAG_SIZES[subtype]
+        else:
+            i += TAG_SIZES[tag_type]
+    return None
+
+
+def bam_parent_ids(path):
+    """
+    parent read ids of the records in a bam file, from the pi tag, or the read name if there isn't one
+    a file cut short by a run that was killed mid write ends at the last whole record
+    """
+    with gzip.open(path, 'rb') as f:
+        try:
+            if f.read(4) != BAM_MAGIC:
+                print("ERROR: resume file {} is not a bam file".format(path))
+                sys.exit(1)
+            l_text = struct.unpack("<i", f.read(4))[0]
+            f.read(l_text)
+            n_ref = struct.unpack("<i", f.read(4))[0]
+            for _ in range(n_ref):
+                l_name = struct.unpack("<i", f.read(4))[0]
+                f.read(l_name + 4)
+            while True:
+                size = f.read(4)
+                if len(size) < 4:
+                    break
+                block_size = struct.unpack("<i", size)[0]
+                data = f.read(block_size)
+                if len(data) < block_size:
+                    print("WARN: last record of {} is incomplete, skipping it".format(path))
+                    break
+                l_read_name = data[8]
+                n_cigar_op, flag, l_seq = struct.unpack_from("<HHi", data, 12)
+                aux_start = 32 + l_read_name + 4 * n_cigar_op + (l_seq + 1) // 2 + l_seq
+                parent_id = _find_z_tag(data, aux_start, b"pi")
+                if parent_id is None:
+                    parent_id = data[32:32 + l_read_name - 1].decode()
+                yield parent_id
+        except EOFError:
+            print("WARN: {} is cut short, skipping the last incomplete block".format(path))
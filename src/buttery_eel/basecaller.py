@@ -2,6 +2,8 @@ import sys
 from io import StringIO
 import numpy as np
 import time
+import queue
+import threading
 from contextlib import contextmanager, redirect_stdout
 import re
 
@@ -21,6 +23,26 @@ except ImportError:
 
 import cProfile, pstats, io
 
+from .mock_server import MockBasecallClient
+from .stats import print_proc_stats
+from .signal_arena import SignalArenaView
+from .metadata import MetaRegistryView
+from .inflight import InflightController
+from .submit import RetryQueue
+from .render import render_reads
+from .summary import set_summary
+
+
+def get_client(args, address, config):
+    """
+    Create a basecall client, or a mock client when --mock_server is used
+    """
+    if args.mock_server:
+        return MockBasecallClient(address=address, config=config, latency=args.mock_latency,
+                                  batch_size=args.mock_batch_size, max_queued=args.mock_max_queued,
+                                  reject_rate=args.mock_reject_rate, fail_rate=args.mock_fail_rate)
+    return pclient(address=address, config=config)
+
 # region start basecaller
 @contextmanager
 def start_guppy_server_and_client(args, server_args):
@@ -53,7 +75,7 @@ def start_guppy_server_and_client(args, server_args):
             continue
         tmp_args.append(arg)
     
-    if basecaller_bin is None:
+    if basecaller_bin is None and not args.mock_server:
         print("-g/--basecaller_bin/--guppy_bin is a required argument")
         sys.exit(1)
 
@@ -74,6 +96,9 @@ def start_guppy_server_and_client(args, server_args):
             mod_path = True
     elif args.config:
         server_args.extend(["--config", args.config])
+    elif args.mock_server:
+        # mock server doesn't load a model, so any name will do
+        args.config = "mock_model"
     else:
         print("ERROR: No model or config detected. Exiting")
         sys.exit(1)
@@ -138,17 +163,22 @@ def start_guppy_server_and_client(args, server_args):
         else:
             raise RuntimeError("Duplex calling not avilable for versions lower than dorado-server 7.4.12")
 
-    # This function has it's own prints that may want to be suppressed
-    with redirect_stdout(StringIO()) as fh:
-        server, port = helper_functions.run_server(server_args, bin_path=basecaller_bin)
+    if args.mock_server:
+        # no server process, each client simulates its own
+        server = None
+        address = "mock"
+    else:
+        # This function has it's own prints that may want to be suppressed
+        with redirect_stdout(StringIO()) as fh:
+            server, port = helper_functions.run_server(server_args, bin_path=basecaller_bin)
 
-    if port == "ERROR":
-        raise RuntimeError("Server couldn't be started")
+        if port == "ERROR":
+            raise RuntimeError("Server couldn't be started")
 
-    if port.startswith("ipc"):
-        address = "{}".format(port)
-    else:
-        address = "localhost:{}".format(port)
+        if port.startswith("ipc"):
+            address = "{}".format(port)
+        else:
+            address = "localhost:{}".format(port)
     if model_path:
         # create the model set <simplex_model>|<mod_models>|<duplex_model> (must include the ||)
         # takes a single argument, but can be a comma sep list
@@ -164,9 +194,9 @@ def start_guppy_server_and_client(args, server_args):
         # excluding this given duplex is dead
         duplex_model = ""
         model_set = "{}|{}|{}".format(args.model, mod_models, duplex_model)
-        client = pclient(address=address, config=model_set)
+        client = get_client(args, address, model_set)
     else:
-        client = pclient(address=address, config=args.config)
+        client = get_client(args, address, args.config)
 
 
 
@@ -180,7 +210,8 @@ def start_guppy_server_and_client(args, server_args):
             else:
                 yield [client, address, args.config, params]
     finally:
-        server.terminate()
+        if server is not None:
+            server.terminate()
 
 
 def calibration(digitisation, range):
@@ -193,27 +224,61 @@ def calibration(digitisation, range):
     """
     return range / digitisation
 
+class StoredRead():
+    """
+    What get_reads2 needs of a read once it has been submitted, without the signal.
+    Fields are read like the read dicts, read["field"] or read.get("field", default),
+    and fields the read didn't have (aux fields not loaded) raise KeyError.
+    """
+    __slots__ = ("sampling_rate", "channel_number", "start_mux", "start_time", "end_reason", "meta")
+
+    def __init__(self, read):
+        for field in self.__slots__:
+            if field in read:
+                setattr(self, field, read[field])
+
+    def __getitem__(self, field):
+        if field not in self.__slots__ or not hasattr(self, field):
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and hasattr(self, field)
+
+    def get(self, field, default=None):
+        if field not in self.__slots__:
+            return default
+        return getattr(self, field, default)
+
+
 # region submit reads
-def submit_reads(args, client, sk, batch):
+def submit_reads(args, client, sk, batch, meta, retry, arena=None, inflight=None, wait=False):
     '''
     Submit batch of reads to basecaller
+    Reads the server refuses are put on the retry queue to be tried again after a backoff,
+    rather than holding up the rest of the batch. With wait=True, the retry queue is
+    worked through before returning, until every read is taken or has passed --submit_deadline
+    If the signals were passed through the shared memory arena, they are
+    read from there and the read is released once submitted
+    inflight is told about accepted and refused reads, to adjust the worker's in-flight target
     '''
     skipped = []
     read_counter = 0
     read_store = {}
-    for read in batch:
-        read_id = read['read_id']
-        # TODO: remove the signal from the read_store to reduce memory usage
-        # if args.seq_sum:
-        read_store[read_id] = read
-        # calculate scale
-        scale = calibration(read['digitisation'], read['range'])
-        result = False
-        tries = 0
-        while not result:
+    reads = batch
+    while True:
+        for read in reads:
+            read_id = read['read_id']
+            read_meta = meta.get(read)
+            if read.get('signal_shm') is not None:
+                raw_data = arena.get_signal(read)
+            else:
+                raw_data = np.frombuffer(read['signal'], np.int16)
+            # calculate scale
+            scale = calibration(read['digitisation'], read['range'])
             if args.above_7310:
                 result = client.pass_read(helper_functions.package_read(
-                            raw_data=np.frombuffer(read['signal'], np.int16),
+                            raw_data=raw_data,
                             read_id=read_id,
                             start_time=read['start_time'],
                             daq_offset=read['offset'],
@@ -221,27 +286,45 @@ def submit_reads(args, client, sk, batch):
                             sampling_rate=read['sampling_rate'],
                             mux=read['start_mux'],
                             channel=int(read["channel_number"]),
-                            run_id=read_store[read_id]["header_array"]["protocol_run_id"],
+                            run_id=read_meta["header"]["protocol_run_id"],
                             duration=read['len_raw_signal'],
-                            end_reason=read["aux_data"]["end_reason_labels"][read['end_reason']],
+                            end_reason=read_meta["end_reason_labels"][read['end_reason']],
                         ))
             else:
                 result = client.pass_read(helper_functions.package_read(
-                            raw_data=np.frombuffer(read['signal'], np.int16),
+                            raw_data=raw_data,
                             read_id=read_id,
                             daq_offset=read['offset'],
                             daq_scaling=scale,
                         ))
-            if tries > 1:
-                time.sleep(client.throttle)
-            tries += 1
-            if tries >= 20000:
-                if not result:
-                    print("Skipped a read: {}".format(read_id))
-                    skipped.append([read_id, "stage-0", "timed out trying to submit read to client"])
-                    break
-        if result:
-            read_counter += 1
+            if result:
+                if args.duplex:
+                    # the fake reads sent to flush a channel reuse a stored read's signal
+                    read_store[read_id] = read
+                else:
+                    # the server has its own copy of the signal now, so only keep what get_reads2 needs
+                    read_store[read_id] = StoredRead(read)
+                    read['signal'] = None
+                read_counter += 1
+                retry.done(read_id)
+                if inflight is not None:
+                    inflight.submitted(read_id)
+            else:
+                if inflight is not None:
+                    inflight.rejected()
+                if retry.defer(read):
+                    # still holds its arena space until it is taken
+                    continue
+                print("Skipped a read: {}".format(read_id))
+                skipped.append([read_id, "stage-0", "timed out trying to submit read to client"])
+            if read.get('signal_shm') is not None:
+                # server has its own copy now, so the arena space can be reused
+                del raw_data
+                arena.done(read)
+        if not wait or len(retry) == 0:
+            break
+        retry.wait()
+        reads = retry.due()
     if len(skipped) > 0:
         for i in skipped:
             sk.put(i)
@@ -249,7 +332,7 @@ def submit_reads(args, client, sk, batch):
 
 
 # region get reads
-def get_reads(args, client, read_counter, sk, read_store):
+def get_reads(args, client, read_counter, sk, read_store, meta):
     '''
     Get reads from the basecaller and process them
     '''
@@ -392,39 +475,39 @@ def get_reads(args, client, read_counter, sk, read_store):
                             bcalled_read["barcode_arrangement"] = call['metadata']["barcode_arrangement"]
                             
                         
-                        # create summary data
-                        # do it for every read now, but only write it if the flag is on
-                        # if args.seq_sum:
-                        minknow_events = call['metadata'].get('num_minknow_events', ".")
+                        # data used by the SAM tags as well as the summary
                         sample_rate = float(read_store[read_id]["sampling_rate"])
                         duration = round(float(call['metadata']['duration'] / sample_rate), 6)
                         bcalled_read["duration"] = duration
-                        num_events = call['metadata']['num_events']
-                        median = round(call['metadata']['median'], 6)
-                        med_abs_dev = round(call['metadata']['med_abs_dev'], 6)
                         bcalled_read["scaling_median"] = round(float(call['metadata']['scaling_median']), 3)
                         bcalled_read["scaling_med_abs_dev"] = round(float(call['metadata']['scaling_med_abs_dev']), 8)
                         bcalled_read["scaling_version"] = call['metadata']['scaling_version']
-                        # pore_type = read_store[read_id]["header_array"].get('pore_type', 'not_set')
-                        experiment_id = read_store[read_id]["header_array"].get('protocol_group_id', ".")
-                        run_id = read_store[read_id]["header_array"]["run_id"]
-                        sample_id = read_store[read_id]["header_array"].get("sample_id", ".")
-                        strand_score_template = round(call['metadata'].get('call_score', 0.0), 6)
                         sequence_length = call['metadata']['sequence_length']
                         bcalled_read["sequence_length"] = sequence_length
-                        channel = read_store[read_id]["aux_data"]['channel_number']
+                        channel = read_store[read_id]['channel_number']
                         bcalled_read["channel"] = channel
-                        mux = read_store[read_id]["aux_data"]['start_mux']
+                        mux = read_store[read_id]['start_mux']
                         bcalled_read["mux"] = int(mux)
-                        start_time = round(float(read_store[read_id]["aux_data"]['start_time']) / sample_rate, 6)
-                        end_reason_val = read_store[read_id]["aux_data"].get('end_reason', 0)
-                        end_reason = read_store[read_id]["aux_data"].get('end_reason_labels', ["unknown"])[end_reason_val]
-                        output_name = ""
-                        sum_out = "\t".join([str(i) for i in [read_store[read_id]["slow5_filename"], bcalled_read["parent_read_id"], bcalled_read["read_id"], run_id, channel, mux, minknow_events,
-                                start_time, duration, passes_filtering, ".", num_events, ".",
-                                sequence_length, round(bcalled_read["read_qscore"], 6), strand_score_template, median, med_abs_dev,
-                                experiment_id, sample_id, end_reason]])
-                        bcalled_read["sum_out"] = sum_out
+
+                        # create summary data
+                        if args.seq_sum:
+                            minknow_events = call['metadata'].get('num_minknow_events', ".")
+                            num_events = call['metadata']['num_events']
+                            median = round(call['metadata']['median'], 6)
+                            med_abs_dev = round(call['metadata']['med_abs_dev'], 6)
+                            read_meta = meta.get(read_store[read_id])
+                            # pore_type = read_meta["header"].get('pore_type', 'not_set')
+                            experiment_id = read_meta["header"].get('protocol_group_id', ".")
+                            run_id = read_meta["header"]["run_id"]
+                            sample_id = read_meta["header"].get("sample_id", ".")
+                            strand_score_template = round(call['metadata'].get('call_score', 0.0), 6)
+                            start_time = round(float(read_store[read_id]['start_time']) / sample_rate, 6)
+                            end_reason_val = read_store[read_id].get('end_reason', 0)
+                            end_reason = read_meta["end_reason_labels"][end_reason_val]
+                            set_summary(args, bcalled_read, [read_meta["slow5_filename"], bcalled_read["parent_read_id"], bcalled_read["read_id"], run_id, channel, mux, minknow_events,
+                                    start_time, duration, passes_filtering, ".", num_events, ".",
+                                    sequence_length, round(bcalled_read["read_qscore"], 6), strand_score_template, median, med_abs_dev,
+                                    experiment_id, sample_id, end_reason])
 
                         # create barcode summary data
                         if args.barcode_kits:
@@ -446,6 +529,9 @@ def get_reads(args, client, read_counter, sk, read_store):
     if len(skipped_list) > 0:
         for i in skipped_list:
             sk.put(i)
+
+    # the sam/fastq records, so the writer only has to write them out
+    render_reads(args, bcalled_list)
     
     read_counter = 0
     done = 0
@@ -453,7 +539,7 @@ def get_reads(args, client, read_counter, sk, read_store):
 
 
 # region get reads
-def get_reads2(args, client, bcalled, sk, read_store):
+def get_reads2(args, client, bcalled, sk, read_store, meta):
     '''
     Get reads from the basecaller and process them
     '''
@@ -573,39 +659,41 @@ def get_reads2(args, client, bcalled, sk, read_store):
                     bcalled_read["barcode_arrangement"] = call['metadata']["barcode_arrangement"]
                     
                 
-                # create summary data
-                # do it for every read now, but only write it if the flag is on
-                # if args.seq_sum:
-                minknow_events = call['metadata'].get('num_minknow_events', ".")
+                # data used by the SAM tags as well as the summary
                 sample_rate = float(read_store[read_id]["sampling_rate"])
                 duration = round(float(call['metadata']['duration'] / sample_rate), 6)
                 bcalled_read["duration"] = duration
-                num_events = call['metadata']['num_events']
-                median = round(call['metadata']['median'], 6)
-                med_abs_dev = round(call['metadata']['med_abs_dev'], 6)
                 bcalled_read["scaling_median"] = round(float(call['metadata']['scaling_median']), 3)
                 bcalled_read["scaling_med_abs_dev"] = round(float(call['metadata']['scaling_med_abs_dev']), 8)
                 bcalled_read["scaling_version"] = call['metadata']['scaling_version']
-                # pore_type = read_store[read_id]["header_array"].get('pore_type', 'not_set')
-                experiment_id = read_store[read_id]["header_array"].get('protocol_group_id', ".")
-                run_id = read_store[read_id]["header_array"]["protocol_run_id"]
-                sample_id = read_store[read_id]["header_array"].get("sample_id", ".")
-                strand_score_template = round(call['metadata'].get('call_score', 0.0), 6)
                 sequence_length = call['metadata']['sequence_length']
                 bcalled_read["sequence_length"] = sequence_length
-                channel = read_store[read_id]["aux_data"]['channel_number']
-                bcalled_read["channel"] = channel
-                mux = read_store[read_id]["aux_data"]['start_mux']
-                bcalled_read["mux"] = int(mux)
-                start_time = round(float(read_store[read_id]["aux_data"]['start_time']) / sample_rate, 6)
-                end_reason_val = read_store[read_id]["aux_data"].get('end_reason', 0)
-                end_reason = read_store[read_id]["aux_data"].get('end_reason_labels', ["unknown"])[end_reason_val]
-                output_name = ""
-                sum_out = "\t".join([str(i) for i in [read_store[read_id]["slow5_filename"], bcalled_read["parent_read_id"], bcalled_read["read_id"], run_id, channel, mux, minknow_events,
-                        start_time, duration, passes_filtering, ".", num_events, ".",
-                        sequence_length, round(bcalled_read["read_qscore"], 6), strand_score_template, median, med_abs_dev,
-                        experiment_id, sample_id, end_reason]])
-                bcalled_read["sum_out"] = sum_out
+                # channel/mux are only loaded by the reader when an output uses them, see get_aux_fields()
+                if args.aux_fields is None or "channel_number" in args.aux_fields:
+                    channel = read_store[read_id]['channel_number']
+                    bcalled_read["channel"] = channel
+                    mux = read_store[read_id]['start_mux']
+                    bcalled_read["mux"] = int(mux)
+
+                # create summary data
+                if args.seq_sum:
+                    minknow_events = call['metadata'].get('num_minknow_events', ".")
+                    num_events = call['metadata']['num_events']
+                    median = round(call['metadata']['median'], 6)
+                    med_abs_dev = round(call['metadata']['med_abs_dev'], 6)
+                    read_meta = meta.get(read_store[read_id])
+                    # pore_type = read_meta["header"].get('pore_type', 'not_set')
+                    experiment_id = read_meta["header"].get('protocol_group_id', ".")
+                    run_id = read_meta["header"]["protocol_run_id"]
+                    sample_id = read_meta["header"].get("sample_id", ".")
+                    strand_score_template = round(call['metadata'].get('call_score', 0.0), 6)
+                    start_time = round(float(read_store[read_id]['start_time']) / sample_rate, 6)
+                    end_reason_val = read_store[read_id].get('end_reason', 0)
+                    end_reason = read_meta["end_reason_labels"][end_reason_val]
+                    set_summary(args, bcalled_read, [read_meta["slow5_filename"], bcalled_read["parent_read_id"], bcalled_read["read_id"], run_id, channel, mux, minknow_events,
+                            start_time, duration, passes_filtering, ".", num_events, ".",
+                            sequence_length, round(bcalled_read["read_qscore"], 6), strand_score_template, median, med_abs_dev,
+                            experiment_id, sample_id, end_reason])
 
                 # create barcode summary data
                 if args.barcode_kits:
@@ -627,23 +715,191 @@ def get_reads2(args, client, bcalled, sk, read_store):
     if len(skipped_list) > 0:
         for i in skipped_list:
             sk.put(i)
+
+    # the sam/fastq records, so the writer only has to write them out
+    render_reads(args, bcalled_list)
     
     return bcalled_list, read_id_set
 
 # region entry point
-def basecaller_proc(args, iq, rq, sk, address, config, params, N):
+def dequeue_samples(queued_samples, batch):
+    '''
+    remove a batch taken off the input queue from the queued sample count
+    '''
+    if queued_samples is None or batch is None:
+        return
+    batch_samples = 0
+    for read in batch:
+        batch_samples += read['len_raw_signal']
+    with queued_samples.get_lock():
+        queued_samples.value -= batch_samples
+
+class SharedInput():
+    """
+    The input queue as seen by the client threads of a worker proc (--worker_threads).
+
+    With prefetch > 0, a background thread takes batches off the input queue ahead of time
+    and keeps up to prefetch of them unpickled and ready, so the clients don't stall on the
+    input queue when they need more reads. Their samples are only taken off the queued
+    sample count once a client gets them, so they stay inside --max_queue_samples.
+
+    Each worker proc gets one None from the reader/s to shut down, so only one thread (the
+    prefetch thread, or the client holding the lock) ever takes from the input queue, and
+    once the None is seen the input is finished for every thread of the proc.
+    """
+    def __init__(self, iq, queued_samples=None, prefetch=0):
+        self.iq = iq
+        self.queued_samples = queued_samples
+        self.lock = threading.Lock()
+        self.finished = False
+        self.ready = None
+        if prefetch > 0:
+            self.ready = queue.Queue(maxsize=prefetch)
+            threading.Thread(target=self._prefetch, daemon=True).start()
+
+    def _take(self, block=True):
+        if block:
+            batch = self.iq.get()
+        else:
+            batch = self.iq.get_nowait()
+        if batch is not None:
+            self.iq.task_done()
+        return batch
+
+    def _prefetch(self):
+        while True:
+            batch = self._take()
+            self.ready.put(batch)
+            if batch is None:
+                break
+
+    def get(self, block=True):
+        """
+        next batch, or None once the input is finished
+        raises queue.Empty if block is False and no batch is ready
+        """
+        if self.ready is not None:
+            if self.finished:
+                return None
+            batch = self.ready.get(block=block)
+            if batch is None:
+                self.finished = True
+                # wake any other thread waiting on the prefetch buffer
+                self.ready.put(None)
+            # prefetched batches count towards --max_queue_samples until a client takes them
+            dequeue_samples(self.queued_samples, batch)
+            return batch
+        if not self.lock.acquire(blocking=block):
+            raise queue.Empty
+        try:
+            if self.finished:
+                return None
+            batch = self._take(block)
+            if batch is None:
+                self.finished = True
+            dequeue_samples(self.queued_samples, batch)
+            return batch
+        finally:
+            self.lock.release()
+
+def basecall_client(args, address, config, params, inp, rq, sk, meta, arena, read_store, name, submit_stats=None):
+    """
+    basecall reads from the input over one client connection, until the input is finished
+    a worker proc runs one of these, or one per thread with --worker_threads
+    """
+    client_sub = get_client(args, address, config)
+    client_sub.set_params(params)
+    with client_sub as client:
+        # reads refused by the server, waiting to be tried again
+        retry = RetryQueue(client.throttle, args.submit_deadline)
+        # the number of reads kept submitted to the server is set by the in-flight controller
+        inflight = InflightController(args.slow5_batchsize, args.max_inflight, adaptive=args.adaptive_inflight)
+        pending = [] # reads taken off the input queue but not submitted yet
+        read_counter = 0 # reads submitted but not returned yet
+        none_batch = False # this detects when a None comes in from the queue to trigger shut down
+        queue_wait = 0.0 # seconds spent with nothing to do, waiting on the input
+        while True:
+            # reads the server refused earlier, now past their backoff
+            due = retry.due()
+            if len(due) > 0:
+                sub_read_counter, sub_read_store = submit_reads(args, client, sk, due, meta, retry, arena, inflight)
+                read_store.update(sub_read_store)
+                read_counter += sub_read_counter
+            # top up the reads in flight to the target
+            want = inflight.target - read_counter - len(retry)
+            while len(pending) < want and not none_batch:
+                # only block on the queue when there is nothing else to do, otherwise
+                # completed reads wait, and unsubmitted reads hold their arena region
+                block = len(pending) == 0 and read_counter == 0 and len(retry) == 0
+                wait_start = time.perf_counter()
+                try:
+                    batch = inp.get(block=block)
+                except queue.Empty:
+                    break
+                finally:
+                    if block:
+                        queue_wait += time.perf_counter() - wait_start
+                if batch is None:
+                    none_batch = True
+                    break
+                pending.extend(batch)
+                del batch
+            if want > 0 and len(pending) > 0:
+                sub_batch = pending[:want]
+                pending = pending[want:]
+                sub_read_counter, sub_read_store = submit_reads(args, client, sk, sub_batch, meta, retry, arena, inflight)
+                read_store.update(sub_read_store)
+                read_counter += sub_read_counter
+            if none_batch and len(pending) == 0 and read_counter == 0 and len(retry) == 0:
+                break
+            bcalled = client.get_completed_reads()
+            if not bcalled:
+                time.sleep(client.throttle)
+                continue
+            bcalled_count = len(bcalled)
+            # process basecalled reads
+            bcalled_list, read_id_set = get_reads2(args, client, bcalled, sk, read_store, meta)
+            # push to write queue
+            rq.put(bcalled_list)
+            if bcalled_count != len(read_id_set):
+                print("bcalled_count != len(read_id_set): {} vs {}".format(bcalled_count, len(read_id_set)))
+            read_counter -= bcalled_count
+            inflight.completed(read_id_set)
+            # remove read_store values already basecalled
+            for key in read_id_set:
+                del read_store[key]
+
+    retry.add_stats(submit_stats)
+    if args.stats:
+        print_proc_stats(name, queue_wait_s=round(queue_wait, 3), **inflight.counters())
+
+def basecaller_proc(args, iq, rq, sk, address, config, params, N, mq, sq=None, queued_samples=None, submit_stats=None):
     """
     submit a read to the basecall server
+    mq is the queue file/read group metadata is received on from the reader/s
+    sq is the list of queues used to release shared memory arena regions back to the reader/s
+    queued_samples is the count of signal samples in the input queue, used with --max_queue_samples
+    submit_stats is the shared array of submission counters for the run summary (see submit.py)
+    with --worker_threads, each thread has its own client connection, and they share the
+    input, metadata, arena and read_store of the proc
     """
     if args.profile:
         pr = cProfile.Profile()
         pr.enable()
-    
-    client_sub = pclient(address=address, config=config)
-    client_sub.set_params(params)
-    # submit a batch of reads to be basecalled
-    with client_sub as client:
-        if args.duplex:
+
+    meta = MetaRegistryView(mq)
+
+    arena = None
+    if args.shm_arena_name is not None and not args.duplex:
+        arena = SignalArenaView(args.shm_arena_name, sq)
+
+    if args.duplex:
+        client_sub = get_client(args, address, config)
+        client_sub.set_params(params)
+        # submit a batch of reads to be basecalled
+        with client_sub as client:
+            # reads refused by the server, waiting to be tried again
+            retry = RetryQueue(client.throttle, args.submit_deadline)
             fake_channel_start = 90000  # we are going to increment this so it doesn't try storing the same channels
             read_counter = 0
             read_store = {}
@@ -667,7 +923,7 @@ def basecaller_proc(args, iq, rq, sk, address, config, params, N):
                                 sampling_rate=read['sampling_rate'],
                                 mux=read['start_mux'],
                                 channel=int(chhh),
-                                run_id=read_store[read_id]["header_array"]["run_id"],
+                                run_id=meta.get(read_store[read_id])["header"]["run_id"],
                                 duration=read['len_raw_signal'],
                             ))
                         # if result:
@@ -677,7 +933,7 @@ def basecaller_proc(args, iq, rq, sk, address, config, params, N):
                         #     print("failed to stuff in fake reads")
                         #     sys.exit(1)
                     # increase counter by 1 to get the 1 fake read but not the other 10
-                    bcalled_list = get_reads(args, client, read_counter, sk, read_store)
+                    bcalled_list = get_reads(args, client, read_counter, sk, read_store, meta)
                     print("[BASECALLER] - writing channel: {}".format(ch))
                     rq.put(bcalled_list)
                     read_counter = 0
@@ -686,91 +942,45 @@ def basecaller_proc(args, iq, rq, sk, address, config, params, N):
                 else:
                     print("[BASECALLER] - submitting channel: {}".format(batch[0]["channel_number"]))
                     # Submit to be basecalled
-                    rc, rs = submit_reads(args, client, sk, batch)
+                    rc, rs = submit_reads(args, client, sk, batch, meta, retry, wait=True)
                     read_counter += rc
                     read_store.update(rs)
                     # now collect the basecalled reads
                     print("[BASECALLER] - getting basecalled channel: {}".format(batch[0]["channel_number"]))
                     ch = batch[0]["channel_number"]
                     iq.task_done()
+        retry.add_stats(submit_stats)
+        if args.stats:
+            print_proc_stats("basecall_worker_{}".format(N))
+    else:
+        inp = SharedInput(iq, queued_samples, prefetch=args.worker_prefetch)
+        read_store = {}
+        if args.worker_threads <= 1:
+            basecall_client(args, address, config, params, inp, rq, sk, meta, arena, read_store, "basecall_worker_{}".format(N), submit_stats)
         else:
-            # get and submit first batch
-            batch = iq.get()
-            if batch is None:
-                return
-            
-            bcalled_count = 0
-            batch_left = 0
-            none_batch = False # this detects when a None comes in from the queue to trigger shut down
-            last_submited = False # this checks for the last batch being submitted for basecalling
-            # Submit to be basecalled
-            read_counter, read_store = submit_reads(args, client, sk, batch)
-            while True:
-                bcalled = client.get_completed_reads()
-                if not bcalled:
-                    time.sleep(client.throttle)
-                    continue
-                else:
-                    bcalled_count = len(bcalled)
-                    # process basecalled reads
-                    bcalled_list, read_id_set = get_reads2(args, client, bcalled, sk, read_store)
-                    # push to write queue
-                    rq.put(bcalled_list)
-                    if bcalled_count != len(read_id_set):
-                        print("bcalled_count != len(read_id_set): {} vs {}".format(bcalled_count, len(read_id_set)))
-                    read_counter -= bcalled_count
-                    # remove read_store values already basecalled
-                    for key in read_id_set:
-                        del read_store[key]
-                    # if number of reads basecalled > reads left in batch, get another batch
-                    sub_batch = []
-                    if batch_left < bcalled_count and not none_batch:
-                        # store left over reads
-                        if batch_left > 0:
-                            sub_batch = [i for i in batch]
-                        # mark old batch as done
-                        iq.task_done()
-                        # get new batch
-                        batch = iq.get()
-                        if batch is None:
-                            none_batch = True
-                    if not none_batch:
-                        # pull same number of reads that were just basecalled
-                        for _ in range(bcalled_count-len(sub_batch)):
-                            if batch:  # Check if the list is not empty before popping
-                                sub_batch.append(batch.pop())
-                            # else:
-                                # print("Batch is empty?!?!")
-                                # print("batch:", batch)
-                        if batch:
-                            batch_left = len(batch)
-                        else:
-                            batch_left = 0
-                    # handle last batch
-                    elif none_batch and not last_submited:
-                        for _ in range(batch_left):
-                            if batch:  # Check if the list is not empty before popping
-                                sub_batch.append(batch.pop())
-                            # else:
-                                # print("Batch is empty?!?!")
-                        last_submited = True
-                        if batch:
-                            batch_left = len(batch)
-                        else:
-                            batch_left = 0
-                    else:
-                        # we are on the last batch, waiting for it to be completed
-                        if read_counter == 0:
-                            break
-                        else:
-                            continue
-                    # get sub batch from batch and submit reads, update read_store and adjust counter
-                    sub_read_counter, sub_read_store = submit_reads(args, client, sk, sub_batch)
-                    read_store.update(sub_read_store)
-                    read_counter += sub_read_counter
-                    
+            errors = []
+            def _run(name):
+                try:
+                    basecall_client(args, address, config, params, inp, rq, sk, meta, arena, read_store, name, submit_stats)
+                except Exception as error:
+                    errors.append(error)
+                    raise
+            threads = []
+            for t in range(args.worker_threads):
+                thread = threading.Thread(target=_run, args=("basecall_worker_{}_{}".format(N, t),), daemon=True)
+                thread.start()
+                threads.append(thread)
+            # a failed thread can leave the others waiting forever, so don't just join them
+            while len(errors) == 0 and any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.1)
+            if len(errors) > 0:
+                print("ERROR: basecall_worker_{} client thread failed: {} - {}".format(N, type(errors[0]).__name__, errors[0]))
+                sys.exit(1)
+
+    if arena is not None:
+        arena.close()
 
-        
     if args.profile:
         pr.disable()
         s = io.StringIO()
@@ -0,0 +1,190 @@
+import struct
+import zlib
+from bisect import bisect_right
+from collections import deque
+
+# BGZF, the blocked gzip format used by BAM
+# each block is a gzip member of at most 64KB, with its size in the header, so blocks can be
+# compressed on their own, by a pool of threads (zlib releases the GIL), and the file can be indexed
+
+# uncompressed bytes per block, same as htslib
+BGZF_BLOCK_SIZE = 0xff00
+# gzip header with the BC extra subfield, followed by the block size - 1
+BGZF_HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+# empty block marking the end of the file
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def compress_block(data, level=6):
+    """
+    compress up to BGZF_BLOCK_SIZE bytes into a single bgzf block
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    return BGZF_HEADER + struct.pack("<H", len(cdata) + 25) + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def bgzf_compress(data, level=6):
+    """
+    compress any amount of data into bgzf blocks, without the EOF block
+    """
+    return b"".join(compress_block(data[i:i + BGZF_BLOCK_SIZE], level) for i in range(0, len(data), BGZF_BLOCK_SIZE))
+
+
+class BGZFWriter():
+    """
+    Write a bgzf file, compressing full blocks in a thread pool shared by all the files of a writer.
+
+    Blocks are written out in order as they are compressed, with at most max_pending blocks
+    waiting at a time. flush() compresses whatever is buffered as a short block, and waits until
+    everything is written, so the file is complete up to that point (used before journaling reads).
+    With pool=None, blocks are compressed as they fill. With eof=False, the EOF block is left off,
+    for parts of a file that are joined together later.
+    With track=True, utell() is the uncompressed position, and virtual_offsets() turns uncompressed
+    positions that have been flushed into bgzf virtual offsets, for the read index (see index.py).
+    """
+    def __init__(self, path, pool=None, max_pending=16, level=6, mode='xb', eof=True, track=False):
+        self.f = open(path, mode)
+        self.name = path
+        self.eof = eof
+        self.track = track
+        self.pool = pool
+        self.max_pending = max_pending
+        self.level = level
+        self.buffer = bytearray()
+        self.pending = deque()
+        # uncompressed bytes taken so far, and the start of the next block
+        self.upos = 0
+        self.ublock = 0
+        # (uncompressed start, compressed start) of blocks written out, since the last virtual_offsets()
+        self.ustarts = []
+        self.cstarts = []
+
+    def write(self, data):
+        self.buffer += data
+        self.upos += len(data)
+        if len(self.buffer) < BGZF_BLOCK_SIZE:
+            return
+        full = len(self.buffer) // BGZF_BLOCK_SIZE * BGZF_BLOCK_SIZE
+        for i in range(0, full, BGZF_BLOCK_SIZE):
+            self._submit(bytes(self.buffer[i:i + BGZF_BLOCK_SIZE]))
+        del self.buffer[:full]
+
+    def _submit(self, block):
+        ustart = self.ublock
+        self.ublock += len(block)
+        if self.pool is None:
+            self._write_block(ustart, compress_block(block, self.level))
+            return
+        self.pending.append((ustart, self.pool.submit(compress_block, block, self.level)))
+        # write out what's done, and wait on the oldest block if too many are waiting
+        while len(self.pending) > 0 and (len(self.pending) > self.max_pending or self.pending[0][1].done()):
+            ustart, future = self.pending.popleft()
+            self._write_block(ustart, future.result())
+
+    def _write_block(self, ustart, cdata):
+        if self.track:
+            self.ustarts.append(ustart)
+            self.cstarts.append(self.f.tell())
+        self.f.write(cdata)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while len(self.pending) > 0:
+            ustart, future = self.pending.popleft()
+            self._write_block(ustart, future.result())
+        self.f.flush()
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def tell(self):
+        """
+        compressed bytes written so far, eg, to see if a file opened to append to is empty
+        """
+        return self.f.tell()
+
+    def utell(self):
+        """
+        uncompressed bytes written so far
+        """
+        return self.upos
+
+    def virtual_offsets(self, positions):
+        """
+        bgzf virtual offsets (compressed block start << 16 | offset in block) of sorted uncompressed positions
+        the blocks holding them have to be written out, by flush(). blocks before the last one used are
+        forgotten, so positions have to keep going up from one call to the next
+        """
+        offsets = []
+        for upos in positions:
+            i = bisect_right(self.ustarts, upos) - 1
+            offsets.append(self.cstarts[i] << 16 | (upos - self.ustarts[i]))
+        if len(positions) > 0:
+            i = bisect_right(self.ustarts, positions[-1]) - 1
+            del self.ustarts[:i]
+            del self.cstarts[:i]
+        return offsets
+
+    def close(self):
+        self.flush()
+        if self.eof:
+            self.f.write(BGZF_EOF)
+        self.f.close()
+
+
+class BGZFReader():
+    """
+    Read a bgzf file from a virtual offset, eg, to fetch a record through the read index
+    """
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.block = b""
+        self.pos = 0
+
+    def _read_block(self):
+        header = self.f.read(18)
+        if len(header) < 18:
+            self.block = b""
+            self.pos = 0
+            return False
+        bsize = struct.unpack_from("<H", header, 16)[0]
+        data = self.f.read(bsize + 1 - 18)
+        self.block = zlib.decompress(data[:-8], -15)
+        self.pos = 0
+        return True
+
+    def seek_virtual(self, voffset):
+        self.f.seek(voffset >> 16)
+        self._read_block()
+        self.pos = voffset & 0xffff
+
+    def read(self, n):
+        out = bytearray()
+        while len(out) < n:
+            if self.pos >= len(self.block) and not self._read_block():
+                break
+            chunk = self.block[self.pos:self.pos + n - len(out)]
+            self.pos += len(chunk)
+            out += chunk
+        return bytes(out)
+
+    def readline(self):
+        out = bytearray()
+        while True:
+            if self.pos >= len(self.block) and not self._read_block():
+                break
+            end = self.block.find(b"\n", self.pos)
+            if end == -1:
+                out += self.block[self.pos:]
+                self.pos = len(self.block)
+                continue
+            out += self.block[self.pos:end + 1]
+            self.pos = end + 1
+            break
+        return bytes(out)
+
+    def close(self):
+        self.f.close()
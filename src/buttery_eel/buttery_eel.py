@@ -8,6 +8,10 @@ import multiprocessing as mp
 import platform
 import time
 import json
+import threading
+import copy
+import signal
+from multiprocessing.connection import wait
 
 try:
     import pybasecall_client_lib
@@ -22,9 +26,15 @@ except ImportError:
 
 from ._version import __version__
 from .cli import get_args
-from .reader import read_worker, duplex_read_worker, duplex_read_worker_single
-from .writer import write_worker
+from .reader import read_worker, duplex_read_worker, duplex_read_worker_single, get_slow5_files, retry_read_worker, get_resume_ids
+from .skipped import SkipLog, RETRY_DEADLINE_FACTOR
+from .writer import write_worker, merge_shards, split_output, get_shard_path
+from .journal import find_journal, get_journal_path
 from .basecaller import start_guppy_server_and_client, basecaller_proc
+from .stats import queue_monitor, print_queue_stats, print_proc_stats
+from .signal_arena import create_arena, close_arena
+from .metadata import get_aux_fields
+from .submit import SUBMIT_STATS_SIZE, SUBMIT_REJECTED, SUBMIT_DEFERRED, SUBMIT_BACKOFF_TIME, SUBMIT_TIMED_OUT
 
 # region constants
 # total_reads = 0
@@ -57,7 +67,78 @@ from .basecaller import start_guppy_server_and_client, basecaller_proc
 #
 #     return model_version_id
 
+def start_writers(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name):
+    """
+    start the writer proc, or with --writers N, N writer procs taking batches off the same result queue,
+    each writing its own shard of the outputs
+    """
+    if args.writers == 1:
+        out_writer = mp.Process(target=write_worker, args=(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name), name='write_worker')
+        out_writer.start()
+        return [out_writer]
+    out_writers = []
+    for i in range(args.writers):
+        out_writer = mp.Process(target=write_worker, args=(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name, i), name='write_worker_{}'.format(i))
+        out_writer.start()
+        out_writers.append(out_writer)
+    return out_writers
+
+
 # region main
+def exit_reason(exitcode):
+    """
+    why a proc exited, from its exit code
+    """
+    if exitcode < 0:
+        try:
+            return "killed by {}".format(signal.Signals(-exitcode).name)
+        except ValueError:
+            return "killed by signal {}".format(-exitcode)
+    return "exitcode: {}".format(exitcode)
+
+
+def abort_run(shm_arena, skip_log):
+    """
+    after a proc has failed, terminate all the children, release the shared memory arena
+    and close the skipped reads file, then exit
+    """
+    for child in mp.active_children():
+        child.terminate()
+    if shm_arena is not None:
+        close_arena(shm_arena)
+    skip_log.close()
+    sys.exit(1)
+
+
+def start_retry_pass(args, read_ids, input_queue, result_queue, skip_queue, address, config, params, total_samples, queued_samples, submit_stats):
+    """
+    basecall the reads skipped at stage-0 again, once the main pass is done, in the same server session
+    a reader fetches them by read_id, and new workers submit them with a longer --submit_deadline
+    returns the reader and workers, for the supervisor to watch, and the metadata queues,
+    which have to be kept until the procs are done with them
+    """
+    print("Retrying {} skipped reads".format(len(read_ids)))
+    retry_args = copy.copy(args)
+    retry_args.submit_deadline = args.submit_deadline * RETRY_DEADLINE_FACTOR
+    # the reads are few, so no shared memory arena and nothing to resume
+    retry_args.shm_arena_name = None
+    retry_args.resume_run = False
+    # fresh metadata queues, as the retry reader numbers its files from 0 again
+    if platform.system() == "Darwin":
+        mqm = mp.Manager()
+        meta_queues = [mqm.Queue() for _ in range(args.procs)]
+    else:
+        meta_queues = [mp.Queue() for _ in range(args.procs)]
+    reader = mp.Process(target=retry_read_worker, args=(retry_args, input_queue, total_samples, meta_queues, read_ids, queued_samples, skip_queue), name='retry_read_worker')
+    reader.start()
+    processes = []
+    for i in range(args.procs):
+        basecall_worker = mp.Process(target=basecaller_proc, args=(retry_args, input_queue, result_queue, skip_queue, address, config, params, i, meta_queues[i], None, queued_samples, submit_stats), daemon=True, name='retry_basecall_worker_{}'.format(i))
+        basecall_worker.start()
+        processes.append(basecall_worker)
+    return [reader], processes, meta_queues
+
+
 def main():
     # ==========================================================================
     # Software ARGS
@@ -104,6 +185,32 @@ def main():
         print("slow5_batchsize > max_read_queue_size, please alter args so max_read_queue_size is the larger value")
         arg_error(sys.stderr)
         sys.exit(1)
+
+    if args.max_queue_samples > 0 and args.slow5_batch_samples > args.max_queue_samples:
+        print("slow5_batch_samples > max_queue_samples, please alter args so max_queue_samples is the larger value")
+        arg_error(sys.stderr)
+        sys.exit(1)
+
+    if args.length_bins is not None:
+        try:
+            args.length_bins = sorted([int(i) for i in args.length_bins.split(",")])
+        except ValueError:
+            print("--length_bins must be a comma separated list of signal sample lengths, eg, 20000,200000")
+            arg_error(sys.stderr)
+            sys.exit(1)
+
+    if args.writers < 1:
+        print("--writers must be at least 1")
+        arg_error(sys.stderr)
+        sys.exit(1)
+
+    if args.max_inflight <= 0:
+        args.max_inflight = 4 * args.slow5_batchsize
+
+    if (args.length_bins is not None or args.ultra_long_samples > 0) and args.reorder_window < args.slow5_batchsize:
+        print("reorder_window < slow5_batchsize, please alter args so reorder_window is the larger value")
+        arg_error(sys.stderr)
+        sys.exit(1)
     
     # region start of pipeline
     print()
@@ -141,14 +248,24 @@ def main():
     if args.resume is not None:
         files = [i.strip() for i in args.resume.split(",")]
         for file in files:
-            if file.split(".")[-1] not in ["fastq", "sam"]:
-                print("ERROR: resume file {} is not a fastq or sam file".format(file))
+            if split_output(file)[1] not in ["fastq", "fastq.gz", "sam", "bam", "journal"]:
+                print("ERROR: resume file {} is not a fastq, fastq.gz, sam, bam or journal file".format(file))
                 arg_error(sys.stderr)
                 sys.exit(1)
             elif not os.path.isfile(file):
                 print("ERROR: resume file {} is does not exist".format(file))
                 arg_error(sys.stderr)
                 sys.exit(1)
+        if args.journal and not args.duplex:
+            # the journals of this run are created empty, so they can't be the ones being resumed from
+            shards = [None] if args.writers == 1 else [None] + list(range(args.writers))
+            out_journals = [os.path.realpath(get_journal_path(get_shard_path(args.output, shard))) for shard in shards]
+            for file in files:
+                journal = find_journal(file)
+                if journal is not None and os.path.realpath(journal) in out_journals:
+                    print("ERROR: resume journal {} would be overwritten by the journal of this run, use a different -o/--output".format(journal))
+                    arg_error(sys.stderr)
+                    sys.exit(1)
            
         args.resume_run = True
 
@@ -210,8 +327,8 @@ def main():
         print("Reading from: {}".format(args.input))
         
         print("Output: {}".format(args.output))
-        if args.output.split(".")[-1] not in ["fastq", "sam"]:
-            print("ERROR: output file is not a fastq or sam file")
+        if split_output(args.output)[1] not in ["fastq", "fastq.gz", "sam", "bam"]:
+            print("ERROR: output file is not a fastq, fastq.gz, sam or bam file")
             arg_error(sys.stderr)
             sys.exit(1)
 
@@ -224,14 +341,17 @@ def main():
                 print("{} does not exist, creating it".format(output_path))
                 os.makedirs(output_path)
         
-        if args.call_mods or args.output.split(".")[-1]=="sam":
+        if args.call_mods or args.output.split(".")[-1] in ["sam", "bam"]:
             SAM_OUT = True
+            # bam is the sam records, encoded and bgzf compressed
+            args.bam_out = args.output.split(".")[-1] == "bam"
+        # .fastq.gz, all the outputs and summaries are bgzf compressed
+        args.gz_out = args.output.endswith(".gz")
+        if SAM_OUT:
             if args.qscore:
-                file = args.output.split(".")
-                # doing [-1:] rather than [-1] gives a list back
-                name, ext = [".".join(file[:-1])], file[-1:]
-                pass_file = ".".join(name + ["pass"] + ext)
-                fail_file = ".".join(name + ["fail"] + ext)
+                name, ext = split_output(args.output)
+                pass_file = ".".join([name, "pass", ext])
+                fail_file = ".".join([name, "fail", ext])
                 OUT = {"pass": pass_file, "fail": fail_file}
                 print("Writing to: {}".format(pass_file))
                 print("Writing to: {}".format(fail_file))
@@ -243,11 +363,9 @@ def main():
             # if args.output.split(".")[-1] not in ["fastq", "fq"]:
             #   some error!
             if args.qscore:
-                file = args.output.split(".")
-                # doing [-1:] rather than [-1] gives a list back
-                name, ext = [".".join(file[:-1])], file[-1:]
-                pass_file = ".".join(name + ["pass"] + ext)
-                fail_file = ".".join(name + ["fail"] + ext)
+                name, ext = split_output(args.output)
+                pass_file = ".".join([name, "pass", ext])
+                fail_file = ".".join([name, "fail", ext])
                 OUT = {"pass": pass_file, "fail": fail_file}
                 print("Writing to: {}".format(pass_file))
                 print("Writing to: {}".format(fail_file))
@@ -255,6 +373,20 @@ def main():
                 OUT = {"single": args.output}
                 print("Writing to: {}".format(args.output))
         
+        # with --writers N, the outputs are only made when the shards are merged at the end, so check now they don't exist
+        if args.writers > 1:
+            for out_file in OUT.values():
+                if os.path.exists(out_file):
+                    print("ERROR: output file {} already exists".format(out_file))
+                    sys.exit(1)
+
+        # only load the aux fields the outputs use
+        args.aux_fields = get_aux_fields(args, SAM_OUT)
+        # the workers render the output records
+        args.sam_out = SAM_OUT
+        args.gpu_name = gpu_name
+        print("Loading aux fields: {}".format(", ".join(args.aux_fields) if len(args.aux_fields) > 0 else "none"))
+
         print()
 
         # ==========================================================================
@@ -288,12 +420,43 @@ def main():
             input_queue = mp.JoinableQueue()
             result_queue = mp.JoinableQueue()
             skip_queue = mp.JoinableQueue()
+        # writes skipped reads out as they come in
+        skip_log = SkipLog(args, skip_queue)
+
+        # a pool of readers is only used for directories, with files shared out through file_queue
+        reader_procs = 1
+        if os.path.isdir(args.input) and not args.duplex:
+            reader_procs = max(1, args.reader_procs)
+        # one arena release queue per reader
+        if platform.system() == "Darwin":
+            signal_queues = [sm.Queue() for _ in range(reader_procs)]
+            meta_queues = [sm.Queue() for _ in range(args.procs)]
+        else:
+            signal_queues = [mp.Queue() for _ in range(reader_procs)]
+            # one queue per worker, for the reader/s to send file/read group metadata
+            meta_queues = [mp.Queue() for _ in range(args.procs)]
+
+        # shared memory for passing signals from the reader to the workers
+        # not used for duplex, as the fake reads reuse the signal of a stored read
+        shm_arena = None
+        if args.shm_arena_size > 0 and not args.duplex:
+            shm_arena = create_arena(args.shm_arena_size)
+            if shm_arena is not None:
+                args.shm_arena_name = shm_arena.name
+                print("Using a {} MB shared memory arena for signal transport".format(args.shm_arena_size))
         
         # track total samples for samples/s calculation
         total_samples = mp.Value('Q', 0)
+        # signal samples currently in the input queue, for --max_queue_samples
+        queued_samples = mp.Value('q', 0)
+        # pass_read refusals/backoff counters from the workers, for the summary
+        submit_stats = mp.Array('d', SUBMIT_STATS_SIZE)
         sample_time_start = time.perf_counter()
 
         processes = []
+        readers = []
+        # the readers of a pool, the workers are sent their None by the supervisor once they have all exited
+        pool_readers = []
 
         if args.duplex:
             if platform.system() == "Darwin":
@@ -309,14 +472,15 @@ def main():
                 # queue_names = range(args.procs)
                 # duplex_queues = {name: mp.JoinableQueue() for name in queue_names}
                 duplex_queue = mp.JoinableQueue()
-                reader = mp.Process(target=duplex_read_worker_single, args=(args, duplex_queue, duplex_pre_queue), name='duplex_read_worker_single')
+                reader = mp.Process(target=duplex_read_worker_single, args=(args, duplex_queue, duplex_pre_queue, total_samples, meta_queues[:1]), name='duplex_read_worker_single')
                 reader.start()
-                out_writer = mp.Process(target=write_worker, args=(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name), name='write_worker')
-                out_writer.start()
+                readers.append(reader)
+                out_writers = start_writers(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name)
                 # set up each worker to have a unique queue, so it only processes 1 channel at a time
-                basecall_worker = mp.Process(target=basecaller_proc, args=(args, duplex_queue, result_queue, skip_queue, address, config, params, 0), daemon=True, name='basecall_worker_{}'.format(0))
+                basecall_worker = mp.Process(target=basecaller_proc, args=(args, duplex_queue, result_queue, skip_queue, address, config, params, 0, meta_queues[0], None, None, submit_stats), daemon=True, name='basecall_worker_{}'.format(0))
                 basecall_worker.start()
                 processes.append(basecall_worker)
+                monitor_queues = {"duplex_queue": duplex_queue, "result_queue": result_queue}
 
             else:
                 print("Duplex mode active - a duplex model must be used to output duplex reads")
@@ -326,65 +490,102 @@ def main():
                 # create the same number of queues as there are worker processes so each has its own queue
                 queue_names = range(args.procs)
                 duplex_queues = {name: mp.JoinableQueue() for name in queue_names}
-                reader = mp.Process(target=duplex_read_worker, args=(args, duplex_queues, duplex_pre_queue), name='duplex_read_worker')
+                reader = mp.Process(target=duplex_read_worker, args=(args, duplex_queues, duplex_pre_queue, total_samples, meta_queues), name='duplex_read_worker')
                 reader.start()
-                out_writer = mp.Process(target=write_worker, args=(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name), name='write_worker')
-                out_writer.start()
+                readers.append(reader)
+                out_writers = start_writers(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name)
                 # set up each worker to have a unique queue, so it only processes 1 channel at a time
                 for name in queue_names:
-                    basecall_worker = mp.Process(target=basecaller_proc, args=(args, duplex_queues[name], result_queue, skip_queue, address, config, params, name), daemon=True, name='basecall_worker_{}'.format(name))
+                    basecall_worker = mp.Process(target=basecaller_proc, args=(args, duplex_queues[name], result_queue, skip_queue, address, config, params, name, meta_queues[name], None, None, submit_stats), daemon=True, name='basecall_worker_{}'.format(name))
                     basecall_worker.start()
                     processes.append(basecall_worker)
+                monitor_queues = {"duplex_queue_{}".format(name): duplex_queues[name] for name in queue_names}
+                monitor_queues["result_queue"] = result_queue
         else:
-            reader = mp.Process(target=read_worker, args=(args, input_queue, total_samples), name='read_worker')
-            reader.start()
-            out_writer = mp.Process(target=write_worker, args=(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name), name='write_worker')
-            out_writer.start()
+            # if --resume, create the set of parent read IDs to skip in the blow5 files once, for all the readers
+            p_IDs = None
+            if args.resume_run:
+                p_IDs = get_resume_ids(args)
+            if reader_procs > 1:
+                file_queue = mp.Queue()
+                for sfile in get_slow5_files(args):
+                    file_queue.put(sfile)
+                for _ in range(reader_procs):
+                    file_queue.put(None)
+                for i in range(reader_procs):
+                    reader = mp.Process(target=read_worker, args=(args, input_queue, total_samples, meta_queues, signal_queues[i], queued_samples, file_queue, i, p_IDs), name='read_worker_{}'.format(i))
+                    reader.start()
+                    readers.append(reader)
+                pool_readers = list(readers)
+            else:
+                reader = mp.Process(target=read_worker, args=(args, input_queue, total_samples, meta_queues, signal_queues[0], queued_samples, None, 0, p_IDs), name='read_worker')
+                reader.start()
+                readers.append(reader)
+            out_writers = start_writers(args, result_queue, OUT, SAM_OUT, model_version_id, model_config_name, gpu_name)
             for i in range(args.procs):
-                basecall_worker = mp.Process(target=basecaller_proc, args=(args, input_queue, result_queue, skip_queue, address, config, params, i), daemon=True, name='basecall_worker_{}'.format(i))
+                basecall_worker = mp.Process(target=basecaller_proc, args=(args, input_queue, result_queue, skip_queue, address, config, params, i, meta_queues[i], signal_queues, queued_samples, submit_stats), daemon=True, name='basecall_worker_{}'.format(i))
                 basecall_worker.start()
                 processes.append(basecall_worker)
+            monitor_queues = {"input_queue": input_queue, "result_queue": result_queue}
+
+        # sample queue sizes in the background to report occupancy
+        if args.stats:
+            queue_samples = {}
+            monitor_stop = threading.Event()
+            monitor = threading.Thread(target=queue_monitor, args=(monitor_queues, queue_samples, monitor_stop), daemon=True)
+            monitor.start()
 
         sample_time_start = time.perf_counter()
 
+        # passes left to retry reads skipped at stage-0, not for duplex where reads go by channel
+        retry_passes = 0 if args.duplex else args.retry_skipped
+
         # Anakin, the Process supervisor
-        # Monitors all procs for a non-zero exit code. If found, it termintates all the children.
-        # If all the exitcodes are 0, it breaks the while loop and continues to join() calls.
+        # Waits on the sentinels of all the procs, so each exit is seen as soon as it happens, and logged.
+        # A non-zero exit terminates all the children. A pool reader's last batches are only certain to be on the
+        # input queue once it has exited (puts are flushed in the background), so with --reader_procs the workers
+        # are sent their None here, once all the pool readers have exited cleanly. Once the readers and workers
+        # have all exited cleanly, the writers are sent their None, and it breaks the while loop when they have exited too.
+        pool_stopped = len(pool_readers) == 0
+        writers_stopped = False
+        exited = set()
         while True:
-            # print("reader exit code:", reader.exitcode)
-            if reader.exitcode is not None:
-                if reader.exitcode != 0:
-                    print("ERROR: Reader process encountered an error. exitcode: ", reader.exitcode)
-                    for child in mp.active_children():
-                        child.terminate()
-                    sys.exit(1)
-            # print("writer exit code:", out_writer.exitcode)
-            if out_writer.exitcode is not None:
-                if out_writer.exitcode != 0:
-                    print("ERROR: Writer process encountered an error. exitcode: ", out_writer.exitcode)
-                    for child in mp.active_children():
-                        child.terminate()
-                    sys.exit(1)
-            for p in processes:
-                # print("proc exit code:", p.exitcode)
-                if p.exitcode is not None:
-                    if p.exitcode != 0:
-                        print("ERROR: Worker client encountered an error. exitcode: ", p.exitcode)
-                        for child in mp.active_children():
-                            child.terminate()
-                        sys.exit(1)
-            if reader.exitcode == 0:
-                p_sum = 0
-                for p in processes:
+            for procs, role in [(readers, "Reader process"), (out_writers, "Writer process"), (processes, "Worker client")]:
+                for p in procs:
+                    if p.exitcode is None or p in exited:
+                        continue
+                    exited.add(p)
                     if p.exitcode != 0:
-                        p_sum += 1
-                if p_sum == 0:
+                        print("ERROR: {} {} encountered an error. {}".format(role, p.name, exit_reason(p.exitcode)))
+                        abort_run(shm_arena, skip_log)
+                    if not args.quiet:
+                        print("Proc supervisor: {} finished".format(p.name))
+            if not pool_stopped and all(p.exitcode == 0 for p in pool_readers):
+                for _ in range(args.procs):
+                    input_queue.put(None)
+                pool_stopped = True
+            if not writers_stopped and all(p.exitcode == 0 for p in readers + processes):
+                if retry_passes > 0:
+                    # the writers are still running, so the retried reads go to the same outputs
+                    retry_passes -= 1
+                    retry_ids = skip_log.retry_ids()
+                    if len(retry_ids) > 0:
+                        retry_readers, retry_procs, retry_queues = start_retry_pass(args, retry_ids, input_queue, result_queue, skip_queue, address, config, params,
+                                                                      total_samples, queued_samples, submit_stats)
+                        readers += retry_readers
+                        processes += retry_procs
+                        meta_queues += retry_queues
+                        continue
+                # one None per writer, each stops at the first it gets
+                for _ in out_writers:
                     result_queue.put(None)
-                    time.sleep(3)
-                    if out_writer.exitcode == 0:
-                        print("\n\nProc supervisor: all processes completed without detected error")
-                        break
-            time.sleep(5)
+                writers_stopped = True
+            if writers_stopped and all(out_writer.exitcode == 0 for out_writer in out_writers):
+                print("\n\nProc supervisor: all processes completed without detected error")
+                break
+            # wait on every proc not handled above, rather than those still running, so one that exits
+            # after the checks above wakes the wait straight away, instead of being missed
+            wait([p.sentinel for p in readers + processes + out_writers if p not in exited])
 
         sample_time_end = time.perf_counter()
         final_total_samples = 0
@@ -398,57 +599,47 @@ def main():
         
         #Basecalled @ Samples/s: 3.450401e+07
         print("\nBasecalled @ Samples/s:", "{0:.6e}".format(samples_per_sec))
+        if submit_stats[SUBMIT_REJECTED] > 0:
+            print("Reads refused by server: {} times, {} reads retried, {:.1f}s of backoff, {} reads timed out".format(
+                int(submit_stats[SUBMIT_REJECTED]), int(submit_stats[SUBMIT_DEFERRED]), submit_stats[SUBMIT_BACKOFF_TIME], int(submit_stats[SUBMIT_TIMED_OUT])))
+
+        if args.stats:
+            monitor_stop.set()
+            monitor.join()
+            print_queue_stats(queue_samples)
+            print("[STATS] total_samples={} basecall_time={:.3f}".format(final_total_samples, total_time))
 
         # Join() calls for all procs
-        reader.join()
-        if reader.exitcode != 0:
-            print("ERROR: Reader process encountered an error. exitcode: ", reader.exitcode)
-            for child in mp.active_children():
-                child.terminate()
-            sys.exit(1)
+        for reader in readers:
+            reader.join()
+            if reader.exitcode != 0:
+                print("ERROR: Reader process encountered an error. exitcode: ", reader.exitcode)
+                abort_run(shm_arena, skip_log)
         for p in processes:
             p.join()
             if p.exitcode != 0:
                 print("ERROR: Worker client encountered an error. exitcode: ", p.exitcode)
-                for child in mp.active_children():
-                    child.terminate()
-                sys.exit(1)
+                abort_run(shm_arena, skip_log)
         # result_queue.put(None)
-        out_writer.join()
-        if out_writer.exitcode != 0:
-            print("ERROR: Writer process encountered an error. exitcode: ", out_writer.exitcode)
-            for child in mp.active_children():
-                child.terminate()
-            sys.exit(1)
-        
+        for out_writer in out_writers:
+            out_writer.join()
+            if out_writer.exitcode != 0:
+                print("ERROR: Writer process encountered an error. exitcode: ", out_writer.exitcode)
+                abort_run(shm_arena, skip_log)
 
-        if skip_queue.qsize() > 0:
-            # print("1")
-            skipped = 0
-            skip_queue.put(None)
-            if "/" in args.output:
-                SKIPPED = open("{}/skipped_reads.txt".format("/".join(args.output.split("/")[:-1])), "a")
-                print("Skipped reads detected, writing details to file: {}/skipped_reads.txt".format("/".join(args.output.split("/")[:-1])))
-            else:
-                SKIPPED = open("./skipped_reads.txt", "a")
-                print("Skipped reads detected, writing details to file: ./skipped_reads.txt")
-            # if the read pointer is at the start of the file, write a header, otherwise skip it cause we are appending
-            if SKIPPED is not None and SKIPPED.tell() == 0 :
-                SKIPPED.write("read_id\tstage\terror\n")
-            # print("2")
-
-            while True:
-                read = skip_queue.get()
-                if read is None:
-                    break
-                read_id, stage, error = read
-                skipped += 1
-                SKIPPED.write("{}\t{}\t{}\n".format(read_id, stage, error))
-
-            # print("3")
-            SKIPPED.close()
-            print("Skipped reads total: {}".format(skipped))
+        # released before the merge, which can exit on a file error
+        if shm_arena is not None:
+            close_arena(shm_arena)
+
+        skip_log.close()
+
+        if args.writers > 1:
+            print("Merging the output of {} writers".format(args.writers))
+            merge_shards(args, OUT, args.writers, SAM_OUT, model_version_id, model_config_name)
         
+        if args.stats:
+            print_proc_stats("main")
+
         print("\n")
         print("Basecalling complete!\n")
 
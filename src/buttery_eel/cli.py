@@ -32,7 +32,7 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
         run_options.add_argument("-i", "--input", required=True,
                             help="input blow5 file or directory for basecalling")
         run_options.add_argument("-o", "--output", required=True,
-                            help="output .fastq or unaligned .sam file to write")
+                            help="output .fastq, .fastq.gz, unaligned .sam or unaligned .bam file to write")
         run_options.add_argument("-g", "--basecaller_bin", type=Path,
                             help="path to basecaller bin folder, eg: ont-dorado-server/bin")
         run_options.add_argument("--config",
@@ -47,22 +47,58 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
                             help="A mean q-score to split fastq/sam files into pass/fail output")
         run_options.add_argument("--slow5_threads", type=int, default=4,
                             help="Number of threads to use reading slow5 file")
+        run_options.add_argument("--reader_procs", type=int, default=1,
+                            help="Number of reader processes when --input is a directory, each reading different files with --slow5_threads threads")
         run_options.add_argument("--procs", type=int, default=4,
                             help="Number of worker processes to use processing reads")
+        run_options.add_argument("--worker_threads", type=int, default=1,
+                            help="Number of client connections per worker process, each in its own thread, sharing the process's memory. Use with fewer --procs to cut process count and RAM. Not used with --duplex")
+        run_options.add_argument("--worker_prefetch", type=int, default=1,
+                            help="Number of batches each worker process takes off the input queue ahead of time in a background thread, so the next batch is ready when needed. 0 disables. Not used with --duplex")
+        run_options.add_argument("--writers", type=int, default=1,
+                            help="Number of writer processes. Each writes its own shard of every output file, and the shards are merged into the usual files at the end of the run")
+        run_options.add_argument("--compress_threads", type=int, default=4,
+                            help="Number of threads each writer process uses to compress .bam and .fastq.gz output")
+        run_options.add_argument("--read_index", action="store_true",
+                            help="Write <output>.idx, an index of the file and offset of each read_id and parent_read_id, to fetch reads with buttery-eel-lookup")
         run_options.add_argument("--slow5_batchsize", type=int, default=4000,
                             help="Number of reads to process at a time reading slow5")
+        run_options.add_argument("--slow5_batch_samples", type=int, default=0,
+                            help="Also cut batches once they hold this many signal samples, so batches of long reads carry a similar amount of work to batches of short reads. 0 disables (batches by --slow5_batchsize only). Not used with --duplex")
         run_options.add_argument("--quiet", action="store_true",
                             help="Don't print progress")
         run_options.add_argument("--max_read_queue_size", type=int, default=20000,
                             help="Number of reads to process at a time reading slow5")
+        run_options.add_argument("--max_queue_samples", type=int, default=0,
+                            help="Limit the input queue by total signal samples instead of by --max_read_queue_size reads, for predictable RAM usage with ultra long reads. 0 disables. Not used with --duplex")
+        run_options.add_argument("--length_bins", default=None,
+                            help="Comma separated signal sample lengths (eg, 20000,200000) to bin reads by, so each batch sent to the server holds reads of a similar length. Not used with --duplex")
+        run_options.add_argument("--reorder_window", type=int, default=20000,
+                            help="Number of reads held while binning with --length_bins/--ultra_long_samples. Larger windows give fuller bins but use more RAM")
+        run_options.add_argument("--ultra_long_samples", type=int, default=0,
+                            help="Reads with at least this many signal samples are sent in their own batches of --ultra_long_batchsize reads. 0 disables. Not used with --duplex")
+        run_options.add_argument("--ultra_long_batchsize", type=int, default=100,
+                            help="Number of reads in each batch of ultra long reads, see --ultra_long_samples")
         run_options.add_argument("--log", default="buttery_basecaller_logs",
                             help="basecaller log folder path")
         run_options.add_argument("--moves_out", action="store_true",
                             help="output move table (sam format only)")
+        run_options.add_argument("--adaptive_inflight", action="store_true",
+                            help="Let each worker proc grow or shrink how many reads it keeps submitted to the server, based on server rejections and completion latency, starting from --slow5_batchsize. Not used with --duplex")
+        run_options.add_argument("--max_inflight", type=int, default=0,
+                            help="Upper limit on the reads each worker proc keeps submitted with --adaptive_inflight. 0 = 4 x --slow5_batchsize")
+        run_options.add_argument("--submit_deadline", type=float, default=300,
+                            help="Seconds to keep retrying a read the server refuses, with exponential backoff, before skipping it")
+        run_options.add_argument("--retry_skipped", type=int, default=0,
+                            help="Number of passes, at the end of the run, retrying reads skipped at stage-0 (not taken by the server before --submit_deadline), with 4x the --submit_deadline")
         run_options.add_argument("--max_batch_time", type=int, default=5000,
                             help="Maximum seconds to wait for batch to be basecalled before killing basecalling. Used to detect locked states/hung servers. Default=5000 (~1h20m)")
         run_options.add_argument("--resume", default=None,
-                            help="Resume a sequencing run. fastq or sam input.")
+                            help="Resume a sequencing run. fastq, fastq.gz, sam, bam or .journal input. If a fastq/sam/bam file has a <file>.journal next to it (from a run with --journal), it is used instead of parsing the file")
+        run_options.add_argument("--journal", action="store_true",
+                            help="Write a binary journal of the completed read ids, <output>.journal, for a faster --resume. The outputs are fsynced after every batch before the journal, which can slow down writing on network filesystems")
+        run_options.add_argument("--shm_arena_size", type=int, default=0,
+                            help="Size in MB of a shared memory arena used to pass raw signals from the reader to the worker procs, instead of pickling them through the input queue. Should hold more than max_read_queue_size reads of signal. 0 disables")
 
 
         # read splitting
@@ -84,6 +120,8 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
         # Sequencing Summary file
         seq_sum.add_argument("--seq_sum", action="store_true",
                             help="Write out sequencing_summary.txt file")
+        seq_sum.add_argument("--seq_sum_format", choices=["txt", "npz", "both"], default="txt",
+                            help="Format of the --seq_sum summary: sequencing_summary.txt, a columnar sequencing_summary.npz of typed numpy arrays, or both")
         
         # barcode demultiplexing/trimming
         barcode_dmux.add_argument("--barcode_kits", action="append",
@@ -92,6 +130,10 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
                             help="Flag indicating that barcodes should be trimmed.")
         barcode_dmux.add_argument("--require_barcodes_both_ends", action="store_true",
                             help="Flag indicating that barcodes must be at both ends.")
+        barcode_dmux.add_argument("--barcode_max_open", type=int, default=64,
+                            help="Maximum number of barcode files each writer keeps open at once. The least recently written is closed when another is needed")
+        barcode_dmux.add_argument("--barcode_split_only", action="store_true",
+                            help="Only write the per barcode files, not the combined output file/s as well")
         # barcode_dmux.add_argument("--detect_mid_strand_barcodes", action="store_true",
         #                     help="Flag indicating that read will be marked as unclassified if barcodes appear within the strand itself.")
         # barcode_dmux.add_argument("--min_score_barcode_front", type=float, default=60.0,
@@ -134,7 +176,7 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
         run_options.add_argument("-i", "--input", required=True,
                             help="input blow5 file or directory for basecalling")
         run_options.add_argument("-o", "--output", required=True,
-                            help="output .fastq or unaligned .sam file to write")
+                            help="output .fastq, .fastq.gz, unaligned .sam or unaligned .bam file to write")
         run_options.add_argument("-g", "--basecaller_bin", type=Path,
                             help="path to basecaller bin folder, eg: ont-dorado-server/bin")
         run_options.add_argument("--config", default="dna_r9.4.1_450bps_fast.cfg", required=True,
@@ -145,22 +187,58 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
                             help="A mean q-score to split fastq/sam files into pass/fail output")
         run_options.add_argument("--slow5_threads", type=int, default=4,
                             help="Number of threads to use reading slow5 file")
+        run_options.add_argument("--reader_procs", type=int, default=1,
+                            help="Number of reader processes when --input is a directory, each reading different files with --slow5_threads threads")
         run_options.add_argument("--procs", type=int, default=4,
                             help="Number of worker processes to use processing reads")
+        run_options.add_argument("--worker_threads", type=int, default=1,
+                            help="Number of client connections per worker process, each in its own thread, sharing the process's memory. Use with fewer --procs to cut process count and RAM. Not used with --duplex")
+        run_options.add_argument("--worker_prefetch", type=int, default=1,
+                            help="Number of batches each worker process takes off the input queue ahead of time in a background thread, so the next batch is ready when needed. 0 disables. Not used with --duplex")
+        run_options.add_argument("--writers", type=int, default=1,
+                            help="Number of writer processes. Each writes its own shard of every output file, and the shards are merged into the usual files at the end of the run")
+        run_options.add_argument("--compress_threads", type=int, default=4,
+                            help="Number of threads each writer process uses to compress .bam and .fastq.gz output")
+        run_options.add_argument("--read_index", action="store_true",
+                            help="Write <output>.idx, an index of the file and offset of each read_id and parent_read_id, to fetch reads with buttery-eel-lookup")
         run_options.add_argument("--slow5_batchsize", type=int, default=4000,
                             help="Number of reads to process at a time reading slow5")
+        run_options.add_argument("--slow5_batch_samples", type=int, default=0,
+                            help="Also cut batches once they hold this many signal samples, so batches of long reads carry a similar amount of work to batches of short reads. 0 disables (batches by --slow5_batchsize only). Not used with --duplex")
         run_options.add_argument("--quiet", action="store_true",
                             help="Don't print progress")
         run_options.add_argument("--max_read_queue_size", type=int, default=20000,
                             help="Number of reads to process at a time reading slow5")
+        run_options.add_argument("--max_queue_samples", type=int, default=0,
+                            help="Limit the input queue by total signal samples instead of by --max_read_queue_size reads, for predictable RAM usage with ultra long reads. 0 disables. Not used with --duplex")
+        run_options.add_argument("--length_bins", default=None,
+                            help="Comma separated signal sample lengths (eg, 20000,200000) to bin reads by, so each batch sent to the server holds reads of a similar length. Not used with --duplex")
+        run_options.add_argument("--reorder_window", type=int, default=20000,
+                            help="Number of reads held while binning with --length_bins/--ultra_long_samples. Larger windows give fuller bins but use more RAM")
+        run_options.add_argument("--ultra_long_samples", type=int, default=0,
+                            help="Reads with at least this many signal samples are sent in their own batches of --ultra_long_batchsize reads. 0 disables. Not used with --duplex")
+        run_options.add_argument("--ultra_long_batchsize", type=int, default=100,
+                            help="Number of reads in each batch of ultra long reads, see --ultra_long_samples")
         run_options.add_argument("--log", default="buttery_basecaller_logs",
                             help="basecaller log folder path")
         run_options.add_argument("--moves_out", action="store_true",
                             help="output move table (sam format only)")
+        run_options.add_argument("--adaptive_inflight", action="store_true",
+                            help="Let each worker proc grow or shrink how many reads it keeps submitted to the server, based on server rejections and completion latency, starting from --slow5_batchsize. Not used with --duplex")
+        run_options.add_argument("--max_inflight", type=int, default=0,
+                            help="Upper limit on the reads each worker proc keeps submitted with --adaptive_inflight. 0 = 4 x --slow5_batchsize")
+        run_options.add_argument("--submit_deadline", type=float, default=300,
+                            help="Seconds to keep retrying a read the server refuses, with exponential backoff, before skipping it")
+        run_options.add_argument("--retry_skipped", type=int, default=0,
+                            help="Number of passes, at the end of the run, retrying reads skipped at stage-0 (not taken by the server before --submit_deadline), with 4x the --submit_deadline")
         run_options.add_argument("--max_batch_time", type=int, default=5000,
                             help="Maximum seconds to wait for batch to be basecalled before killing basecalling. Used to detect locked states/hung servers. Default=5000 (~1h20m)")
         run_options.add_argument("--resume", default=None,
-                            help="Resume a sequencing run. fastq or sam input.")
+                            help="Resume a sequencing run. fastq, fastq.gz, sam, bam or .journal input. If a fastq/sam/bam file has a <file>.journal next to it (from a run with --journal), it is used instead of parsing the file")
+        run_options.add_argument("--journal", action="store_true",
+                            help="Write a binary journal of the completed read ids, <output>.journal, for a faster --resume. The outputs are fsynced after every batch before the journal, which can slow down writing on network filesystems")
+        run_options.add_argument("--shm_arena_size", type=int, default=0,
+                            help="Size in MB of a shared memory arena used to pass raw signals from the reader to the worker procs, instead of pickling them through the input queue. Should hold more than max_read_queue_size reads of signal. 0 disables")
 
         # read splitting
         read_splitting.add_argument("--do_read_splitting", action="store_true",
@@ -181,6 +259,8 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
         # Sequencing Summary file
         seq_sum.add_argument("--seq_sum", action="store_true",
                             help="Write out sequencing_summary.txt file")
+        seq_sum.add_argument("--seq_sum_format", choices=["txt", "npz", "both"], default="txt",
+                            help="Format of the --seq_sum summary: sequencing_summary.txt, a columnar sequencing_summary.npz of typed numpy arrays, or both")
         
         # barcode demultiplexing/trimming
         barcode_dmux.add_argument("--barcode_kits", action="append",
@@ -189,6 +269,10 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
                             help="Flag indicating that barcodes should be trimmed.")
         barcode_dmux.add_argument("--require_barcodes_both_ends", action="store_true",
                             help="Flag indicating that barcodes must be at both ends.")
+        barcode_dmux.add_argument("--barcode_max_open", type=int, default=64,
+                            help="Maximum number of barcode files each writer keeps open at once. The least recently written is closed when another is needed")
+        barcode_dmux.add_argument("--barcode_split_only", action="store_true",
+                            help="Only write the per barcode files, not the combined output file/s as well")
         barcode_dmux.add_argument("--detect_mid_strand_barcodes", action="store_true",
                             help="Flag indicating that read will be marked as unclassified if barcodes appear within the strand itself.")
         barcode_dmux.add_argument("--min_score_barcode_front", type=float, default=60.0,
@@ -216,6 +300,23 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
     #                     help="signal chunk size, lower this for lower VRAM GPUs")
     parser.add_argument("--profile", action="store_true",
                         help="run cProfile on all processes - for debugging benchmarking")
+    parser.add_argument("--stats", action="store_true",
+                        help="print peak RSS of each process and input/output queue occupancy - for debugging benchmarking")
+
+    # Mock server, for benchmarking the pipeline without a GPU
+    mock = parser.add_argument_group("Mock server Options")
+    mock.add_argument("--mock_server", action="store_true",
+                        help="use a built-in mock basecall server that returns synthetic basecalls - no GPU or guppy/dorado needed - for debugging benchmarking")
+    mock.add_argument("--mock_latency", type=float, default=0.0,
+                        help="seconds between submitting a read and it being returned as basecalled by the mock server")
+    mock.add_argument("--mock_batch_size", type=int, default=1000,
+                        help="maximum number of reads returned by each get_completed_reads call of the mock server")
+    mock.add_argument("--mock_max_queued", type=int, default=20000,
+                        help="number of reads in flight per client before the mock server refuses reads as queue full")
+    mock.add_argument("--mock_reject_rate", type=float, default=0.0,
+                        help="fraction of read submissions randomly refused by the mock server")
+    mock.add_argument("--mock_fail_rate", type=float, default=0.0,
+                        help="fraction of reads returned with an empty sequence by the mock server")
     parser.add_argument("-v", "--version", action='version', version="buttery-eel - wrapping ONT basecallers (guppy/dorado) for SLOW5 basecalling version: {}".format(VERSION),
                         help="Prints version")
     # parser.add_argument("--debug", action="store_true",
@@ -239,6 +340,12 @@ def get_args(above_7310_flag, above_7412_flag, above_768_flag, above_798_flag):
         above_768=above_768_flag,
         above_798=above_798_flag,
         resume_run=False,
+        shm_arena_name=None,
+        aux_fields=None,
+        sam_out=False,
+        bam_out=False,
+        gz_out=False,
+        gpu_name="",
         dorado_model_path_flag=dorado_model_path_flag,
     )
 
@@ -0,0 +1,83 @@
+import os
+from collections import OrderedDict
+
+# buffer size of each open barcode file
+DEMUX_BUFFER_SIZE = 1024 * 1024
+
+
+class BarcodeFiles():
+    """
+    The per barcode output files of a writer proc (--barcode_kits).
+
+    Records are grouped by file as a batch is read through, and each group is written with
+    a single write once the batch is done. At most max_open files are kept open, and when
+    another is needed, the one written to least recently is closed. It is opened again, to
+    append to, if more reads come in for its barcode.
+
+    open_file(path, new) opens a file, creating it (with any header) when new is True.
+    With index set (a ReadIndex, --read_index), the records are added to it as they are written,
+    so add() takes the read of each record as well. With sync set (a resume journal is kept),
+    files are fsynced when flushed or closed to make room, so they are on disk before the journal.
+    """
+    def __init__(self, open_file, max_open):
+        self.open_file = open_file
+        self.max_open = max(1, max_open)
+        # path: open file, least recently written first
+        self.handles = OrderedDict()
+        self.created = set()
+        # path: records of the current batch
+        self.groups = {}
+        self.reads = {}
+        self.opens = 0
+        self.index = None
+        self.sync = False
+
+    def add(self, path, record, read=None):
+        """
+        queue a record for a barcode file
+        """
+        if path not in self.groups:
+            self.groups[path] = []
+            self.reads[path] = []
+        self.groups[path].append(record)
+        self.reads[path].append(read)
+
+    def write(self):
+        """
+        write out the records of the batch, one write per file
+        """
+        for path, records in self.groups.items():
+            handle = self._get(path)
+            if self.index is not None:
+                self.index.add(handle.name, handle, records, self.reads[path])
+            handle.write(b"".join(records))
+        self.groups = {}
+        self.reads = {}
+
+    def _get(self, path):
+        handle = self.handles.get(path)
+        if handle is not None:
+            self.handles.move_to_end(path)
+            return handle
+        if len(self.handles) >= self.max_open:
+            _, oldest = self.handles.popitem(last=False)
+            if self.sync:
+                oldest.flush()
+                os.fsync(oldest.fileno())
+            oldest.close()
+        handle = self.open_file(path, path not in self.created)
+        self.created.add(path)
+        self.handles[path] = handle
+        self.opens += 1
+        return handle
+
+    def flush(self):
+        for handle in self.handles.values():
+            handle.flush()
+            if self.sync:
+                os.fsync(handle.fileno())
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
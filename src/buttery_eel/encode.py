@@ -0,0 +1,95 @@
+import numpy as np
+
+# encoding of numpy array tags (move tables etc) for sam/bam output
+# done with numpy over whole arrays, rather than making a python int and str for every value
+
+COMMA = ord(",")
+MINUS = ord("-")
+ZERO = ord("0")
+
+# sam/bam B array subtypes
+BAM_ARRAY_TYPES = {"c": "<i1", "C": "<u1", "s": "<i2", "S": "<u2", "i": "<i4", "I": "<u4", "f": "<f4"}
+
+
+def encode_digits(array):
+    """
+    comma separated text of an array of values 0-9, eg, a move table
+    each value is one byte, so the digits and commas are just interleaved
+    """
+    out = np.full(2 * len(array) - 1, COMMA, dtype=np.uint8)
+    out[::2] = array
+    out[::2] += ZERO
+    return out.tobytes()
+
+
+def encode_ints(arrays):
+    """
+    comma separated text of integer arrays with any values, all encoded together
+    """
+    lengths = [len(a) for a in arrays]
+    values = np.concatenate(arrays).astype(np.int64)
+    negative = values < 0
+    values = np.abs(values)
+    # number of digits of each value
+    digits = np.ones(len(values), dtype=np.int64)
+    max_digits = len(str(int(values.max())))
+    for k in range(1, max_digits):
+        digits += values >= 10 ** k
+    # each value is followed by a comma, the last of each array is dropped below
+    widths = digits + negative + 1
+    ends = np.cumsum(widths)
+    out = np.full(int(ends[-1]), COMMA, dtype=np.uint8)
+    out[(ends - widths)[negative]] = MINUS
+    # fill in the digits from the last, ones first
+    for k in range(max_digits):
+        mask = digits > k
+        out[ends[mask] - 2 - k] = ZERO + (values[mask] // 10 ** k) % 10
+    data = out.tobytes()
+    # slice out each array, without its trailing comma
+    encoded = []
+    start = 0
+    last = 0
+    for length in lengths:
+        last += length
+        stop = int(ends[last - 1]) - 1
+        encoded.append(data[start:stop])
+        start = stop + 1
+    return encoded
+
+
+def encode_int_arrays(arrays):
+    """
+    comma separated decimal text of a list of integer arrays, eg, the move tables of a batch of reads
+    returns a list of bytes, one per array
+    """
+    encoded = [b""] * len(arrays)
+    # move tables are 0/1, so most arrays take the fast path, the rest are encoded together
+    rest = []
+    for i, array in enumerate(arrays):
+        array = np.asarray(array).ravel()
+        if len(array) == 0:
+            continue
+        if array.dtype.kind in "biu" and array.min() >= 0 and array.max() <= 9:
+            encoded[i] = encode_digits(array)
+        else:
+            rest.append((i, array))
+    if len(rest) > 0:
+        for (i, _), text in zip(rest, encode_ints([array for _, array in rest])):
+            encoded[i] = text
+    return encoded
+
+
+def encode_int_array(array):
+    """
+    comma separated decimal text of a single integer array
+    """
+    return encode_int_arrays([array])[0]
+
+
+def bam_array_tag(tag, subtype, array):
+    """
+    binary bam B array tag, eg, bam_array_tag("mv", "c", moves)
+    """
+    dtype = BAM_ARRAY_TYPES[subtype]
+    values = np.asarray(array).astype(dtype, copy=False)
+    return tag.encode() + b"B" + subtype.encode() + np.array([len(values)], dtype="<i4").tobytes() + values.tobytes()
@@ -0,0 +1,281 @@
+import os, sys
+import argparse
+import gzip
+import struct
+import numpy as np
+
+from .read_ids import UUID_DTYPE, uuids_to_array
+from .bgzf import BGZFWriter, BGZFReader
+from .bam import bam_header, BAM_MAGIC
+
+# read index, --read_index
+# maps each read_id, and each parent_read_id, to the output file and offset of its record, so reads can be
+# fetched without scanning the outputs. The offset is a byte offset for fastq/sam, and a bgzf virtual offset
+# for bam and .fastq.gz.
+#
+# <output>.idx:
+#   8 byte magic
+#   uint32 number of files, then for each: uint8 1 if bgzf, uint32 name length, name (relative to the index)
+#   uint64 number of entries n
+#   n UUIDs (UUID_DTYPE), sorted, n uint32 file numbers, n uint64 offsets
+INDEX_MAGIC = b"EELIDX01"
+INDEX_EXT = ".idx"
+
+
+def get_index_path(output):
+    """
+    index filename for a run, based on the -o/--output filename
+    """
+    return output + INDEX_EXT
+
+
+class ReadIndex():
+    """
+    Writer side of the read index.
+
+    add() is called with the records of a batch just before they are written to a file, and works out
+    where each one starts. flush() is called once the batch is flushed, as a bgzf virtual offset is only
+    known once its block is written, and keeps the entries in memory as packed arrays (~28 bytes an entry).
+    close() sorts them by UUID and writes the index. Like the resume journal, no index is written if a
+    read id is not a UUID.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.dir = os.path.dirname(os.path.abspath(path))
+        # output path: file number
+        self.files = {}
+        self.bgzf = []
+        self.pending = []
+        self.ids = []
+        self.file_codes = []
+        self.offsets = []
+        self.enabled = True
+
+    def add(self, path, OUT, records, reads):
+        if not self.enabled or len(records) == 0:
+            return
+        if path not in self.files:
+            self.files[path] = len(self.files)
+            self.bgzf.append(isinstance(OUT, BGZFWriter))
+        start = OUT.utell() if isinstance(OUT, BGZFWriter) else OUT.tell()
+        lengths = np.fromiter((len(record) for record in records), dtype=np.int64, count=len(records))
+        positions = start + np.concatenate(([0], np.cumsum(lengths[:-1])))
+        self.pending.append((self.files[path], OUT, positions, reads))
+
+    def flush(self):
+        if not self.enabled:
+            self.pending = []
+            return
+        for code, OUT, positions, reads in self.pending:
+            if isinstance(OUT, BGZFWriter):
+                offsets = np.array(OUT.virtual_offsets(positions.tolist()), dtype=np.uint64)
+            else:
+                offsets = positions.astype(np.uint64)
+            read_ids = [read["read_id"] for read in reads]
+            # split reads are found by their parent_read_id as well
+            split = [i for i, read in enumerate(reads) if read["parent_read_id"] != read["read_id"]]
+            keys = read_ids + [reads[i]["parent_read_id"] for i in split]
+            ids, valid = uuids_to_array(keys)
+            if not np.all(valid):
+                bad = keys[int(np.flatnonzero(~valid)[0])]
+                print("WARNING: read_id {} is not a UUID, no read index will be written".format(bad))
+                self.enabled = False
+                self.pending = []
+                self.ids, self.file_codes, self.offsets = [], [], []
+                return
+            self.ids.append(ids)
+            self.file_codes.append(np.full(len(keys), code, dtype="<u4"))
+            self.offsets.append(np.concatenate((offsets, offsets[split])))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if not self.enabled:
+            return
+        names = [None] * len(self.files)
+        for path, code in self.files.items():
+            names[code] = os.path.relpath(os.path.abspath(path), self.dir)
+        write_index(self.path, names, self.bgzf,
+                    np.concatenate(self.ids) if len(self.ids) > 0 else np.zeros(0, dtype=UUID_DTYPE),
+                    np.concatenate(self.file_codes) if len(self.file_codes) > 0 else np.zeros(0, dtype="<u4"),
+                    np.concatenate(self.offsets) if len(self.offsets) > 0 else np.zeros(0, dtype=np.uint64))
+
+
+def write_index(path, names, bgzf, ids, file_codes, offsets):
+    """
+    sort the entries by UUID and write an index file
+    entries with the same UUID keep their order, the order they were written in
+    """
+    order = np.argsort(ids, kind="stable")
+    try:
+        with open(path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack("<I", len(names)))
+            for name, is_bgzf in zip(names, bgzf):
+                data = name.encode()
+                f.write(struct.pack("<BI", int(is_bgzf), len(data)) + data)
+            f.write(struct.pack("<Q", len(ids)))
+            f.write(ids[order].astype(UUID_DTYPE).tobytes())
+            f.write(file_codes[order].astype("<u4").tobytes())
+            f.write(offsets[order].astype("<u8").tobytes())
+    except Exception as error:
+        # handle the exception
+        print("ERROR: An exception occurred writing the read index:", type(error).__name__, "-", error)
+        sys.exit(1)
+
+
+def load_index(path, mmap=True):
+    """
+    file names, bgzf flags, and the UUID, file number and offset arrays of an index
+    the arrays are memory mapped, so a lookup only reads the pages it needs
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            print("ERROR: {} is not a buttery-eel read index".format(path))
+            sys.exit(1)
+        n_files = struct.unpack("<I", f.read(4))[0]
+        names = []
+        bgzf = []
+        for _ in range(n_files):
+            is_bgzf, length = struct.unpack("<BI", f.read(5))
+            bgzf.append(bool(is_bgzf))
+            names.append(f.read(length).decode())
+        n = struct.unpack("<Q", f.read(8))[0]
+        start = f.tell()
+    if n == 0:
+        return names, bgzf, np.zeros(0, dtype=UUID_DTYPE), np.zeros(0, dtype="<u4"), np.zeros(0, dtype="<u8")
+    mode = 'r' if mmap else 'c'
+    ids = np.memmap(path, dtype=UUID_DTYPE, mode=mode, offset=start, shape=(n,))
+    file_codes = np.memmap(path, dtype="<u4", mode=mode, offset=start + 16 * n, shape=(n,))
+    offsets = np.memmap(path, dtype="<u8", mode=mode, offset=start + 20 * n, shape=(n,))
+    return names, bgzf, ids, file_codes, offsets
+
+
+def merge_indexes(path, shards, bases):
+    """
+    join the indexes of --writers N into one, removing them
+    bases is {(file path, shard): offset} of where each shard of a file starts in the merged file,
+    in bytes, which is added to the compressed part of the virtual offsets of bgzf files
+    """
+    index_dir = os.path.dirname(os.path.abspath(path))
+    names = []
+    bgzf = []
+    ids, file_codes, offsets = [], [], []
+    for shard, shard_path in enumerate(shards):
+        if not os.path.isfile(shard_path):
+            continue
+        shard_names, shard_bgzf, shard_ids, shard_codes, shard_offsets = load_index(shard_path, mmap=False)
+        mapping = []
+        shift = []
+        for name, is_bgzf in zip(shard_names, shard_bgzf):
+            # the shard index names the shard files, eg, reads.fastq.shard0
+            merged_name = name[:-len(".shard{}".format(shard))]
+            if merged_name not in names:
+                names.append(merged_name)
+                bgzf.append(is_bgzf)
+            mapping.append(names.index(merged_name))
+            base = bases.get((os.path.join(index_dir, merged_name), shard), 0)
+            shift.append(base << 16 if is_bgzf else base)
+        mapping = np.array(mapping, dtype="<u4")
+        shift = np.array(shift, dtype=np.uint64)
+        ids.append(np.array(shard_ids))
+        file_codes.append(mapping[shard_codes] if len(mapping) > 0 else np.array(shard_codes))
+        offsets.append(np.array(shard_offsets) + (shift[shard_codes] if len(shift) > 0 else 0))
+        os.remove(shard_path)
+    if len(ids) == 0:
+        return
+    write_index(path, names, bgzf, np.concatenate(ids), np.concatenate(file_codes), np.concatenate(offsets))
+
+
+def find_reads(index, read_ids):
+    """
+    (read_id, file number, offset) of each record of a list of read ids, by binary search of the index
+    a parent_read_id finds all the reads split from it
+    """
+    names, bgzf, ids, file_codes, offsets = index
+    keys, valid = uuids_to_array(read_ids)
+    lo = np.searchsorted(ids, keys, side="left")
+    hi = np.searchsorted(ids, keys, side="right")
+    found = []
+    for read_id, ok, start, end in zip(read_ids, valid, lo, hi):
+        if not ok or start == end:
+            print("WARNING: read {} not found in the index".format(read_id), file=sys.stderr)
+            continue
+        for i in range(start, end):
+            found.append((read_id, int(file_codes[i]), int(offsets[i])))
+    return found
+
+
+def read_record(f, ext):
+    """
+    the record at the current position of an output file
+    """
+    if ext == "bam":
+        size = f.read(4)
+        return size + f.read(struct.unpack("<i", size)[0])
+    if ext == "sam":
+        return f.readline()
+    return b"".join(f.readline() for _ in range(4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fetch basecalled reads through the read index (--read_index) of a buttery-eel run")
+    parser.add_argument("-x", "--index", required=True,
+                        help="read index, <output>.idx")
+    parser.add_argument("-r", "--read_ids", nargs="*", default=[],
+                        help="read_ids or parent_read_ids to fetch")
+    parser.add_argument("-l", "--read_id_list",
+                        help="file of read_ids or parent_read_ids, one per line, eg, from scripts/get_bad_reads.py")
+    parser.add_argument("-o", "--output",
+                        help="output file, needed for bam. Default is stdout")
+    args = parser.parse_args()
+
+    read_ids = list(args.read_ids)
+    if args.read_id_list:
+        with open(args.read_id_list) as f:
+            read_ids += [line.strip() for line in f if line.strip() != ""]
+    if len(read_ids) == 0:
+        print("ERROR: no read ids given, use -r and/or -l")
+        sys.exit(1)
+
+    index = load_index(args.index)
+    names, bgzf = index[0], index[1]
+    found = find_reads(index, read_ids)
+    index_dir = os.path.dirname(os.path.abspath(args.index))
+    paths = [os.path.join(index_dir, name) for name in names]
+    exts = [name[:-len(".gz")].split(".")[-1] if name.endswith(".gz") else name.split(".")[-1] for name in names]
+
+    bam = any(exts[code] == "bam" for _, code, _ in found)
+    if bam and (args.output is None or not args.output.endswith(".bam")):
+        print("ERROR: records from bam files are written as bam, use -o <file>.bam")
+        sys.exit(1)
+    if bam:
+        # the header of the first bam file the reads come from
+        with gzip.open(paths[found[0][1]], 'rb') as f:
+            f.read(len(BAM_MAGIC))
+            text = f.read(struct.unpack("<i", f.read(4))[0]).decode()
+        OUT = BGZFWriter(args.output, mode='wb')
+        OUT.write(bam_header(text))
+    elif args.output:
+        OUT = open(args.output, 'wb')
+    else:
+        OUT = sys.stdout.buffer
+
+    handles = {}
+    for read_id, code, offset in found:
+        if code not in handles:
+            handles[code] = BGZFReader(paths[code]) if bgzf[code] else open(paths[code], 'rb')
+        f = handles[code]
+        if bgzf[code]:
+            f.seek_virtual(offset)
+        else:
+            f.seek(offset)
+        OUT.write(read_record(f, exts[code]))
+    for f in handles.values():
+        f.close()
+    if OUT is not sys.stdout.buffer:
+        OUT.close()
+
+
+if __name__ == '__main__':
+    main()
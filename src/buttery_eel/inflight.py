@@ -0,0 +1,95 @@
+import time
+
+# growth is held while completion latency is this many times the lowest seen
+LATENCY_SLACK = 2.0
+# weight of the newest completions in the latency average
+LATENCY_ALPHA = 0.2
+
+
+class InflightController():
+    """
+    AIMD control of how many reads a worker keeps submitted to the server at once.
+
+    Each round is one target's worth of completed reads. If the server didn't refuse a read
+    in the round, and completion latency hasn't climbed well above the lowest seen (the
+    server queueing reads rather than calling them), the target grows by step reads.
+    When pass_read refuses a read, the target is halved, at most once per round.
+    With adaptive=False the target stays at start, ie, one batch in flight.
+    """
+    def __init__(self, start, max_target, adaptive=True):
+        self.adaptive = adaptive
+        self.target = start
+        self.start = start
+        self.step = max(1, start // 4)
+        self.min_target = self.step
+        self.max_target = max(start, max_target)
+        self.peak = start
+        self.sent = {}
+        self.latency = None
+        self.base_latency = None
+        self.round_done = 0
+        self.round_rejected = False
+        self.rejections = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def submitted(self, read_id):
+        """
+        a read was accepted by the server
+        """
+        self.sent[read_id] = time.perf_counter()
+
+    def rejected(self):
+        """
+        pass_read refused a read, the server is full
+        """
+        self.rejections += 1
+        if not self.adaptive or self.round_rejected:
+            return
+        self.round_rejected = True
+        self.target = max(self.min_target, self.target // 2)
+        self.decreases += 1
+
+    def completed(self, read_ids):
+        """
+        a set of read_ids came back from the server
+        """
+        now = time.perf_counter()
+        total = 0.0
+        n = 0
+        for read_id in read_ids:
+            sent = self.sent.pop(read_id, None)
+            if sent is not None:
+                total += now - sent
+                n += 1
+        if n == 0:
+            return
+        mean = total / n
+        if self.latency is None:
+            self.latency = mean
+        else:
+            self.latency = (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * mean
+        if self.base_latency is None or self.latency < self.base_latency:
+            self.base_latency = self.latency
+        self.round_done += n
+        if self.round_done < self.target:
+            return
+        # end of round
+        if self.adaptive and not self.round_rejected and self.latency <= LATENCY_SLACK * self.base_latency:
+            if self.target < self.max_target:
+                self.target = min(self.max_target, self.target + self.step)
+                self.peak = max(self.peak, self.target)
+                self.increases += 1
+        self.round_done = 0
+        self.round_rejected = False
+
+    def counters(self):
+        """
+        values for the --stats line of the worker
+        """
+        return {"inflight_target": self.target,
+                "inflight_peak": self.peak,
+                "inflight_increases": self.increases,
+                "inflight_decreases": self.decreases,
+                "pass_read_rejections": self.rejections,
+                "completion_latency_s": round(self.latency, 3) if self.latency is not None else 0}
@@ -0,0 +1,83 @@
+import os, sys
+
+from .read_ids import uuids_to_array
+
+# binary resume journal
+# 8 byte magic, then one 16 byte UUID per completed parent read id, appended as reads are written
+JOURNAL_MAGIC = b"EELJNL01"
+JOURNAL_EXT = ".journal"
+UUID_SIZE = 16
+
+
+def get_journal_path(output):
+    """
+    journal filename for a run, based on the -o/--output filename
+    """
+    return output + JOURNAL_EXT
+
+
+def find_journal(resume_file):
+    """
+    find the journal written alongside a fastq/sam file from a previous run, returns None if there isn't one
+    only <file>.journal is used, it holds the same reads as the file. The journal of a run with pass/fail
+    files (<output>.journal) holds the reads of both, so it is only used when given to --resume itself
+    """
+    if resume_file.endswith(JOURNAL_EXT):
+        return resume_file
+    if os.path.isfile(resume_file + JOURNAL_EXT):
+        return resume_file + JOURNAL_EXT
+    return None
+
+
+def open_journal(path):
+    """
+    create a new journal for writing
+    the outputs it tracks were just created, so any old journal with the same name is stale
+    (a run refuses to start if it is resuming from it)
+    """
+    try:
+        journal = open(path, 'wb')
+        journal.write(JOURNAL_MAGIC)
+        journal.flush()
+    except Exception as error:
+        print("WARNING: could not create resume journal {}, --resume will need to parse the output files: {} - {}".format(path, type(error).__name__, error))
+        return None
+    return journal
+
+
+def write_journal(journal, read_ids):
+    """
+    append a batch of parent read ids to the journal and fsync it
+    called once the reads are written and fsynced to the outputs, so the journal never gets ahead of them
+    returns None, closing and removing the journal, if a read id is not a UUID in the form --resume
+    looks them up in (see uuids_to_array)
+    """
+    read_ids = list(read_ids)
+    ids, valid = uuids_to_array(read_ids)
+    if not all(valid):
+        read_id = read_ids[int(valid.argmin())]
+        print("WARNING: read_id {} is not a UUID, no resume journal will be written, --resume will need to parse the output files".format(read_id))
+        journal.close()
+        os.remove(journal.name)
+        return None
+    journal.write(ids.tobytes())
+    journal.flush()
+    os.fsync(journal.fileno())
+    return journal
+
+
+def read_journal(path):
+    """
+    load the packed 16 byte parent read ids in a journal
+    an incomplete record at the end, from a run that was killed mid write, is ignored
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(JOURNAL_MAGIC))
+        # killed before anything was written
+        if len(magic) == 0:
+            return b""
+        if magic != JOURNAL_MAGIC:
+            print("ERROR: {} is not a buttery-eel resume journal".format(path))
+            sys.exit(1)
+        data = f.read()
+    return data[:len(data) // UUID_SIZE * UUID_SIZE]
@@ -0,0 +1,117 @@
+import threading
+
+# read group header fields used by the workers, the rest of the header is not sent to them
+HEADER_FIELDS = ["run_id", "protocol_run_id", "protocol_group_id", "sample_id"]
+# aux fields packaged with each read for servers >= 7.3.*
+AUX_SUBMIT_FIELDS = ["channel_number", "start_mux", "start_time", "end_reason"]
+# aux fields used in the sequencing summary
+AUX_SUMMARY_FIELDS = ["channel_number", "start_mux", "start_time", "end_reason"]
+# aux fields used in the SAM tags for servers >= 7.4.12
+AUX_SAM_FIELDS = ["channel_number", "start_mux"]
+# aux fields used to pair up reads for duplex calling
+AUX_DUPLEX_FIELDS = ["channel_number", "start_mux", "start_time", "end_reason", "read_number"]
+
+
+def get_aux_fields(args, sam_out):
+    """
+    the aux fields the enabled outputs need, so the readers don't decode the rest
+    """
+    fields = []
+    if args.above_7310:
+        fields += AUX_SUBMIT_FIELDS
+    if args.seq_sum:
+        fields += AUX_SUMMARY_FIELDS
+    if sam_out and args.above_7412:
+        fields += AUX_SAM_FIELDS
+    if args.duplex:
+        fields += AUX_DUPLEX_FIELDS
+    # keep the order, drop the repeats
+    return list(dict.fromkeys(fields))
+
+
+def get_file_aux_fields(slow5_obj, fields):
+    """
+    the aux fields of a slow5 file to load, out of fields
+    fields missing from the file are left out, as they would be with aux='all'
+    """
+    if fields is None:
+        return 'all'
+    try:
+        names = slow5_obj.get_aux_names()
+    except:
+        return []
+    if names is None:
+        return []
+    return [field for field in fields if field in names]
+
+
+def get_end_reason_labels(slow5_obj):
+    """
+    end_reason enum labels of a slow5 file, ["unknown"] if it has no end_reason field
+    """
+    try:
+        labels = slow5_obj.get_aux_enum_labels('end_reason')
+    except:
+        return ["unknown"]
+    if type(labels) != type(["a", "b"]):
+        return ["unknown"]
+    return labels
+
+
+class MetaRegistry():
+    """
+    Reader side of the per file/read group metadata table.
+
+    The read group header (only HEADER_FIELDS), slow5 filename and end_reason labels are the same for every read
+    of a file/read group, so they are worked out once per file and each entry is sent once to
+    every worker, on its own queue in mqs. Reads only carry the small int key, in read["meta"].
+    With more than one reader, each uses keys index, index+stride, ... so they never clash.
+    """
+    def __init__(self, mqs, index=0, stride=1):
+        self.mqs = mqs
+        self.next_key = index
+        self.stride = stride
+
+    def register(self, slow5_obj, slow5_filename):
+        """
+        add all read groups of an open slow5 file, returns {read_group: key}
+        """
+        end_reason_labels = get_end_reason_labels(slow5_obj)
+        keys = {}
+        for read_group in range(slow5_obj.get_num_read_groups()):
+            header = slow5_obj.get_all_headers(read_group=read_group)
+            entry = {"header": {k: header[k] for k in HEADER_FIELDS if k in header},
+                     "slow5_filename": slow5_filename,
+                     "end_reason_labels": end_reason_labels}
+            key = self.next_key
+            self.next_key += self.stride
+            for mq in self.mqs:
+                mq.put((key, entry))
+            keys[read_group] = key
+        return keys
+
+
+class MetaRegistryView():
+    """
+    Worker side of the per file/read group metadata table.
+    Entries are pulled off the worker's queue as they are needed.
+    """
+    def __init__(self, mq):
+        self.mq = mq
+        self.entries = {}
+        # the client threads of a worker (--worker_threads) share the view
+        self.lock = threading.Lock()
+
+    def get(self, read):
+        """
+        metadata entry for a read
+        the reader sends an entry before any reads using it, but the queues are separate,
+        so wait for it if it's not here yet
+        """
+        key = read["meta"]
+        if key not in self.entries:
+            with self.lock:
+                while key not in self.entries:
+                    k, entry = self.mq.get()
+                    self.entries[k] = entry
+        return self.entries[key]
@@ -0,0 +1,209 @@
+import json
+import time
+import zlib
+import random
+from collections import deque
+
+import numpy as np
+
+try:
+    import pybasecall_client_lib as client_lib
+except ImportError:
+    try:
+        import pyguppy_client_lib as client_lib
+    except ImportError:
+        client_lib = None
+
+# region mock client
+class MockBasecallClient():
+    """
+    Stand-in for PyBasecallClient/PyGuppyClient that needs no GPU or basecall server.
+
+    Implements the parts of the pclient API buttery-eel uses (pass_read, get_completed_reads,
+    get_basecalling_config, get_server_information, throttle, set_params) and returns
+    synthetic sequences, qstrings, move tables and metadata. Each client acts as its own
+    server, so every basecaller_proc gets an independent queue.
+
+    latency:        seconds from pass_read() until a read can be returned as completed
+    batch_size:     max number of reads returned by a single get_completed_reads() call
+    max_queued:     number of reads in flight before pass_read() refuses reads (queue full)
+    reject_rate:    fraction of pass_read() calls randomly refused, to exercise the retry path
+    fail_rate:      fraction of reads returned with an empty sequence, to exercise the skip path
+    """
+    # status values, mirroring the real client attributes
+    connected = "connected"
+    disconnected = "disconnected"
+    model_stride = 5
+
+    def __init__(self, address="mock", config=None, throttle=0.01, latency=0.0, batch_size=1000,
+                 max_queued=20000, reject_rate=0.0, fail_rate=0.0, **kwargs):
+        self.address = address
+        if config is None:
+            config = "mock_model"
+        if config.endswith(".cfg"):
+            config = config[:-len(".cfg")]
+        self.config = config
+        self.throttle = throttle
+        self.latency = latency
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self.reject_rate = reject_rate
+        self.fail_rate = fail_rate
+        self.params = {}
+        self.set_params(kwargs)
+        self.status = self.disconnected
+        self.pending = deque()
+        self.stats = {"reads_accepted": 0, "reads_rejected": 0, "reads_completed": 0}
+        # model set is <simplex_model>|<mod_models>|<duplex_model>
+        self.model_version_id = self.config.split("|")[0]
+        self.modbase_model_version_id = self.config.split("|")[1] if "|" in self.config else ""
+        self.rna = "rna" in self.model_version_id.lower()
+
+    def __repr__(self):
+        return "{}(address={!r}, config={!r}, latency={}, batch_size={}, max_queued={}, reject_rate={}, fail_rate={}, {})".format(
+            self.__class__.__name__, self.address, self.config, self.latency, self.batch_size,
+            self.max_queued, self.reject_rate, self.fail_rate, self.status)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def connect(self):
+        self.status = self.connected
+
+    def disconnect(self):
+        self.status = self.disconnected
+        self.pending.clear()
+
+    def get_status(self):
+        return self.status
+
+    def get_error_message(self):
+        return ""
+
+    def set_params(self, params):
+        self.params.update(params)
+
+    def get_software_version(self):
+        if client_lib is None:
+            return (0, 0, 0)
+        return tuple(int(i) for i in client_lib.__version__.split("."))
+
+    def get_basecalling_config(self):
+        return [{"model_version_id": self.model_version_id, "config_name": self.config}]
+
+    def get_server_information(self, address, timeout):
+        info = {"CUDA Devices": {"device_0": {"name": "mock basecall device"}}}
+        return [json.dumps(info)]
+
+    def get_server_stats(self, address, timeout):
+        return dict(self.stats)
+
+    def pass_read(self, read):
+        """
+        Queue a packaged read, returns False when refused, like a full server queue
+        """
+        if self.status != self.connected:
+            raise ConnectionError("Not connected to server. status code: {!r}. {!r}".format(self.status, self))
+        if len(self.pending) >= self.max_queued or (self.reject_rate > 0 and random.random() < self.reject_rate):
+            self.stats["reads_rejected"] += 1
+            return False
+        # the server keeps its own copy of the signal, so callers can reuse their buffer
+        read = dict(read)
+        read["raw_data"] = np.array(read["raw_data"], dtype=np.int16)
+        self.pending.append((time.perf_counter() + self.latency, read))
+        self.stats["reads_accepted"] += 1
+        return True
+
+    def get_completed_reads(self):
+        """
+        Return up to batch_size reads whose latency has elapsed, as a list of [call] lists
+        """
+        if self.status != self.connected:
+            raise ConnectionError("Not connected to server. status code: {!r}. {!r}".format(self.status, self))
+        now = time.perf_counter()
+        completed = []
+        # reads are queued in submission order with a fixed latency, so ready times are sorted
+        while self.pending and len(completed) < self.batch_size:
+            ready_time, read = self.pending[0]
+            if ready_time > now:
+                break
+            self.pending.popleft()
+            completed.append([self._basecall(read)])
+        self.stats["reads_completed"] += len(completed)
+        return completed
+
+    def _basecall(self, read):
+        """
+        build a synthetic basecall result for a packaged read
+        """
+        read_id = read["read_id"]
+        raw_data = read["raw_data"]
+        num_samples = len(raw_data)
+        # seed from the read_id so repeated runs produce identical output
+        seed = zlib.crc32(read_id.encode())
+        rng = np.random.default_rng(seed)
+        fail = self.fail_rate > 0 and (seed % 10000) < self.fail_rate * 10000
+
+        # one base every second move, reads under 100 samples come back empty like the real server
+        moves = np.zeros(num_samples // self.model_stride, dtype=np.uint8)
+        if num_samples >= 100 and not fail:
+            moves[::2] = 1
+        seq_len = int(moves.sum())
+        bases = np.frombuffer(b"ACGU" if self.rna else b"ACGT", dtype=np.uint8)
+        sequence = bases[rng.integers(0, 4, seq_len)].tobytes().decode()
+        quals = rng.integers(2, 40, seq_len, dtype=np.uint8)
+        qstring = (quals + 33).tobytes().decode()
+        mean_qscore = float(quals.mean()) if seq_len > 0 else 0.0
+
+        head = raw_data[:4000].astype(np.float32) * read["daq_scaling"] + read["daq_offset"]
+        median = float(np.median(head)) if len(head) > 0 else 0.0
+        med_abs_dev = float(np.median(np.abs(head - median))) if len(head) > 0 else 0.0
+
+        metadata = {
+            "read_id": read_id,
+            "strand_id": read_id,
+            "split_point": 0,
+            "model_version_id": self.model_version_id,
+            "modbase_model_version_id": self.modbase_model_version_id,
+            "mean_qscore": mean_qscore,
+            "sequence_length": seq_len,
+            "model_stride": self.model_stride,
+            "trimmed_samples": 0,
+            "trimmed_duration": num_samples,
+            "duration": num_samples,
+            "num_events": len(moves),
+            "num_minknow_events": 0,
+            "median": median,
+            "med_abs_dev": med_abs_dev,
+            "scaling_median": median,
+            "scaling_med_abs_dev": med_abs_dev,
+            "scaling_version": "mock",
+            "call_score": mean_qscore,
+            "channel": read.get("channel", 0),
+            "is_duplex_parent": False,
+            "duplex_strand_1": None,
+            "duplex_strand_2": None,
+        }
+        if self.params.get("barcode_kits"):
+            bc = seed % 13
+            arrangement = "barcode{:02d}".format(bc) if bc > 0 else "unclassified"
+            metadata["barcode_arrangement"] = arrangement
+            metadata["barcode_full_arrangement"] = arrangement
+            metadata["barcode_kit"] = self.params["barcode_kits"][0]
+            metadata["barcode_score"] = 100.0 if bc > 0 else 0.0
+        if self.params.get("estimate_poly_a"):
+            metadata["poly_tail_length"] = int(seed % 120)
+        if self.params.get("move_enabled") or self.params.get("move_and_trace_enabled"):
+            metadata["alignment_sam_record"] = "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tMM:Z:\tML:B:C".format(read_id, sequence, qstring)
+
+        datasets = {
+            "sequence": sequence,
+            "qstring": qstring,
+            "movement": moves,
+            "raw_data": raw_data,
+        }
+        return {"metadata": metadata, "datasets": datasets}
@@ -0,0 +1,100 @@
+import numpy as np
+
+# a UUID as a 128 bit unsigned int, stored as big endian (hi, lo) so the sort order is numeric
+UUID_DTYPE = np.dtype([('hi', '>u8'), ('lo', '>u8')])
+
+# hex character -> value, anything else -> 255
+_HEX = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX[_c] = _i + 10
+# positions of the 32 hex characters in a 36 character UUID string
+_HEX_COLS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+_DASH_COLS = np.array([8, 13, 18, 23])
+
+
+def uuids_to_array(read_ids):
+    """
+    convert a list of UUID read_id strings to a UUID_DTYPE array
+    returns the array and a bool mask of which read_ids were valid UUIDs
+    """
+    n = len(read_ids)
+    if n == 0:
+        return np.zeros(0, dtype=UUID_DTYPE), np.zeros(0, dtype=bool)
+    # anything that isn't 36 characters is truncated or padded here, and caught by the checks below
+    raw = np.array(read_ids, dtype='S37')
+    chars = raw.view(np.uint8).reshape(n, 37)
+    valid = (chars[:, 36] == 0) & (chars[:, 35] != 0)
+    valid &= np.all(chars[:, _DASH_COLS] == ord("-"), axis=1)
+    nibbles = _HEX[chars[:, _HEX_COLS]]
+    valid &= np.all(nibbles != 255, axis=1)
+    packed = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+    return np.ascontiguousarray(packed).view(UUID_DTYPE).reshape(n), valid
+
+
+class ReadIDSet():
+    """
+    Compact set of read_ids, ~16 bytes per UUID instead of 100+ for a python set of strings.
+
+    UUIDs are kept in a sorted UUID_DTYPE array and looked up with np.searchsorted, a
+    whole batch at a time with contains(). read_ids that are not UUIDs go in a normal set.
+    New ids are buffered and merged into the sorted array on the next lookup.
+    """
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=UUID_DTYPE)
+        self.other = set()
+        self.pending = []
+
+    def update(self, read_ids):
+        """
+        add a list of read_id strings
+        """
+        arr, valid = uuids_to_array(read_ids)
+        self.pending.append(arr[valid])
+        if not np.all(valid):
+            for read_id, ok in zip(read_ids, valid):
+                if not ok:
+                    self.other.add(read_id)
+
+    def update_bytes(self, data):
+        """
+        add packed 16 byte UUIDs, eg, from a resume journal
+        """
+        self.pending.append(np.frombuffer(data, dtype=UUID_DTYPE))
+
+    def _merge(self):
+        if len(self.pending) > 0:
+            self.ids = np.unique(np.concatenate([self.ids] + self.pending))
+            self.pending = []
+
+    def contains(self, read_ids):
+        """
+        bool mask of which of a list of read_id strings are in the set
+        """
+        self._merge()
+        arr, valid = uuids_to_array(read_ids)
+        found = np.zeros(len(read_ids), dtype=bool)
+        if len(self.ids) > 0 and len(arr) > 0:
+            idx = np.searchsorted(self.ids, arr)
+            idx[idx == len(self.ids)] = 0
+            found = (self.ids[idx] == arr) & valid
+        if len(self.other) > 0 and not np.all(valid):
+            for i in np.flatnonzero(~valid):
+                found[i] = read_ids[i] in self.other
+        return found
+
+    def __getstate__(self):
+        # merged before pickling, so the set is sent to other procs as one packed array
+        self._merge()
+        return self.__dict__
+
+    def __contains__(self, read_id):
+        return bool(self.contains([read_id])[0])
+
+    def __len__(self):
+        self._merge()
+        return len(self.ids) + len(self.other)
+
+    def __bool__(self):
+        return len(self) > 0
@@ -1,10 +1,21 @@
 import os, sys
+import gzip
 import pyslow5
 from itertools import chain
 import time
+import queue
+import threading
+import bisect
 
 import cProfile, pstats, io
 
+from .stats import print_proc_stats
+from .signal_arena import SignalArena
+from .journal import find_journal, read_journal
+from .read_ids import ReadIDSet
+from .bam import bam_parent_ids
+from .metadata import MetaRegistry, get_file_aux_fields
+
 def get_data_by_channel(args, dq):
     """
     Go through the the slow5 and group readIDs by channel and read_number
@@ -47,7 +58,7 @@ def get_data_by_channel(args, dq):
         # dq.put(None)
     else:
         s5 = pyslow5.Open(args.input, 'r')
-        reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
+        reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=get_file_aux_fields(s5, args.aux_fields))
 
         # get all the channel data and stick it into duplex dic
         for read in reads:
@@ -70,196 +81,351 @@ def get_data_by_channel(args, dq):
         dq.put(None)
 
 
-def _get_slow5_batch(args, slow5_obj, reads, size=4096, slow5_filename=None, header_array=None, IDs=None):
+def _skip_reads(reads, IDs, size=4096):
+    """
+    drop reads already in IDs (eg, basecalled in the run being resumed)
+    reads are checked against the set a chunk at a time, rather than one by one
+    """
+    chunk = []
+    for read in reads:
+        chunk.append(read)
+        if len(chunk) >= size:
+            found = IDs.contains([r["read_id"] for r in chunk])
+            for r, done in zip(chunk, found):
+                if not done:
+                    yield r
+            chunk = []
+    if len(chunk) > 0:
+        found = IDs.contains([r["read_id"] for r in chunk])
+        for r, done in zip(chunk, found):
+            if not done:
+                yield r
+
+def _get_slow5_batch(args, reads, size=4096, meta_keys=None, IDs=None, max_samples=0, tail=None):
     """
     re-batchify slow5 output
+    batches are cut at size reads, or at max_samples signal samples if set, whichever comes first
+    if tail is given, the first batch is topped up from it, and the last short batch is
+    returned (as the generator return value) instead of yielded, to be carried into the next file
+    meta_keys maps read groups to their MetaRegistry key, which is all each read carries
     """
     batch = []
-    no_end_reason = False
+    batch_samples = 0
+    if args.resume_run and IDs:
+        reads = _skip_reads(reads, IDs, size)
+    if tail is not None:
+        batch = tail
+        for read in batch:
+            batch_samples += read["len_raw_signal"]
     for read in reads:
-        if args.resume_run:
-            if read["read_id"] in IDs:
-                continue
-        # if args.seq_sum:
-        # get header once for each read group
-        read_group = read["read_group"]
-        # if read_group not in header_array:
-        #     header_array[read_group] = slow5_obj.get_all_headers(read_group=read_group)
-        # get aux data for ead read
-        
-
-        aux_data = {"channel_number": read["channel_number"], 
-                            "start_mux": read["start_mux"],
-                            "start_time": read["start_time"],
-                            "read_number": read["read_number"],
-                            "end_reason": read.get("end_reason", 0),
-                            "median_before": read["median_before"],
-                            }
-        if no_end_reason:
-            aux_data["end_reason_labels"] = ["unknown"]
-        else:
-            try:
-                aux_data["end_reason_labels"] = slow5_obj.get_aux_enum_labels('end_reason')
-            except:
-                no_end_reason = True
-            if type(aux_data["end_reason_labels"]) != type(["a", "b"]):
-                aux_data["end_reason_labels"] = ["unknown"]
-        
-        read["aux_data"] = aux_data
-        read["header_array"] = header_array[read_group]
-        read["slow5_filename"] = slow5_filename
-        
+        read["meta"] = meta_keys[read["read_group"]]
         batch.append(read)
-        if len(batch) >= size:
+        batch_samples += read["len_raw_signal"]
+        if len(batch) >= size or (max_samples > 0 and batch_samples >= max_samples):
             yield batch
             batch = []
+            batch_samples = 0
+    if tail is not None:
+        return batch
     if len(batch) > 0:
         yield batch
 
-def read_worker(args, iq, total_samples):
+def _put_batch(args, iq, batch, total_samples, max_limit, queued_samples=None):
+    """
+    put a batch on the input queue, waiting while the queue is full
+    the queue is full at max_limit batches, or at --max_queue_samples signal samples if set
+    """
+    batch_samples = 0
+    for rd in batch:
+        batch_samples += rd['len_raw_signal']
+    if args.max_queue_samples > 0:
+        # always let a batch through when the queue is empty, so a batch larger
+        # than the limit can't block forever. The check and the add are done under the
+        # lock together, so pool readers can't all pass the check before any of them adds
+        while True:
+            with queued_samples.get_lock():
+                if queued_samples.value == 0 or queued_samples.value + batch_samples <= args.max_queue_samples:
+                    queued_samples.value += batch_samples
+                    break
+            time.sleep(0.01)
+    else:
+        while iq.qsize() >= max_limit:
+            time.sleep(0.01)
+    with total_samples.get_lock():
+        total_samples.value += batch_samples
+    iq.put(batch)
+
+def _length_binned(args, batches):
+    """
+    regroup batches so each one holds reads of a similar length
+    up to --reorder_window reads are held, split into bins by the --length_bins signal lengths.
+    A bin is sent once it is a full batch (--slow5_batchsize reads or --slow5_batch_samples samples),
+    and when the window is full, the bin holding the most reads is sent as it is.
+    Reads of --ultra_long_samples or more go in their own lane, sent --ultra_long_batchsize at a time.
+    Every bin is sent at the end, so no reads are lost.
+    """
+    edges = args.length_bins if args.length_bins is not None else []
+    # bins[len(edges)+1] is the ultra long lane
+    lane = len(edges) + 1
+    bins = [[] for _ in range(lane + 1)]
+    bin_samples = [0] * (lane + 1)
+    held = 0
+    for batch in batches:
+        for read in batch:
+            n = read["len_raw_signal"]
+            if args.ultra_long_samples > 0 and n >= args.ultra_long_samples:
+                b = lane
+                size = args.ultra_long_batchsize
+            else:
+                b = bisect.bisect_right(edges, n)
+                size = args.slow5_batchsize
+            bins[b].append(read)
+            bin_samples[b] += n
+            held += 1
+            if len(bins[b]) < size and not (args.slow5_batch_samples > 0 and bin_samples[b] >= args.slow5_batch_samples):
+                if held < args.reorder_window:
+                    continue
+                # window is full, make room
+                b = max(range(len(bins)), key=lambda i: len(bins[i]))
+            held -= len(bins[b])
+            yield bins[b]
+            bins[b] = []
+            bin_samples[b] = 0
+    for b in range(len(bins)):
+        if len(bins[b]) > 0:
+            yield bins[b]
+
+def _resume_lines(file):
+    '''
+    lines of a fastq/sam resume file, which may be gzipped
+    a gzipped file cut short by a run that was killed mid write ends at the last whole block
+    '''
+    if file.endswith(".gz"):
+        with gzip.open(file, 'rt') as f:
+            try:
+                for line in f:
+                    yield line
+            except EOFError:
+                print("WARN: {} is cut short, skipping the last incomplete block".format(file))
+    else:
+        with open(file, 'r') as f:
+            for line in f:
+                yield line
+
+def get_resume_ids(args):
+    '''
+    open the --resume file/s and create a set of parent read IDs to skip in the blow5 file
+    the fastq/sam files are only parsed when there is no journal from the previous run
+    '''
+    p_IDs = ReadIDSet()
+    # check if it's a single file or multiple by presence of a comma
+    files = []
+    if "," in args.resume:
+        files = [i.strip() for i in args.resume.split(",")]
+    else:
+        files = [args.resume]
+    print("INFO: Resuming run from:", files)
+    prev_count = 0
+    journals = set()
+    for file in files:
+        # use the binary journal the writer kept for the previous run if there is one,
+        # the same journal can be given directly and found next to its file, so only load it once
+        journal = find_journal(file)
+        if journal is not None:
+            if journal not in journals:
+                journals.add(journal)
+                p_IDs.update_bytes(read_journal(journal))
+                print("INFO: Read of resume journal {} complete. Number of reads detected:".format(journal), len(p_IDs)-prev_count)
+                prev_count = len(p_IDs)
+            continue
+        ext = file.split(".")[-1]
+        if ext == "gz":
+            ext = file.split(".")[-2]
+        if ext == "bam":
+            chunk = []
+            for parent_id in bam_parent_ids(file):
+                chunk.append(parent_id)
+                if len(chunk) >= 1000000:
+                    p_IDs.update(chunk)
+                    chunk = []
+            p_IDs.update(chunk)
+            print("INFO: Read of resume file {} complete. Number of reads detected:".format(file), len(p_IDs)-prev_count)
+            prev_count = len(p_IDs)
+            continue
+        count = 0
+        file_reads = 0
+        error_count = 0
+        insync = True
+        # IDs are added to the set in chunks, as converting them is vectorised
+        chunk = []
+        for line in _resume_lines(file):
+            if len(chunk) >= 1000000:
+                p_IDs.update(chunk)
+                chunk = []
+            if ext == "fastq":
+                # resync the fastq format if out of sync
+                if not insync:
+                    if line[0] == "@" and "parent_read_id" in line:
+                        count = 0
+                        insync = True
+                        print("INFO: fastq line has regained syncronisation")
+                    else:
+                        continue
+                if count == 0:
+                    if line[0] == "@" and "parent_read_id" in line:
+                        chunk.append(line.split("parent_read_id=")[1].split(' ')[0])
+                        file_reads += 1
+                    else:
+                        print("WARN: First line of read does not start with @ or does not have parent_read_id=, fastq file malformed")
+                        error_count += 1
+                        insync = False
+                count += 1
+                if count >= 4:
+                    count = 0
+            elif ext == "sam":
+                if line[0] == "@":
+                    continue
+                # split read, so get the parent ID not the read ID
+                if "pi:Z:" in line:
+                    chunk.append(line.split("pi:Z:")[1].split()[0])
+                    file_reads += 1
+                # not a split read, so just get the read_id
+                else:
+                    chunk.append(line.split("\t")[0])
+                    file_reads += 1
+                    print("RESUME: regular sam read_id:", line.split("\t")[0])
+                # else:
+                #     print("WARN: sam read does not contain pi:Z:, sam file malformed")
+                #     error_count += 1
+            else:
+                print("ERROR: filetype not recognised and parsed to read_worker, contact developers")
+                sys.exit(1)
+
+            if error_count >= 5:
+                print("ERROR: error count of 5 or more detected, please check or trim file and try again:", file)
+                sys.exit(1)
+
+        p_IDs.update(chunk)
+        print("INFO: Read of resume file {} complete. Number of reads detected:".format(file), len(p_IDs)-prev_count)
+        prev_count = len(p_IDs)
+    print("INFO: Total number of reads detected:", len(p_IDs))
+    return p_IDs
+
+def _get_dir_batches(args, files, meta, IDs=None):
+    """
+    batches for a set of slow5 files read one after the other
+    the short tail batch of each file is carried into the first batch of the next file
+    """
+    tail = []
+    for sfile in files:
+        s5 = pyslow5.Open(sfile, 'r')
+        reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=get_file_aux_fields(s5, args.aux_fields))
+        meta_keys = meta.register(s5, os.path.basename(sfile))
+        tail = yield from _get_slow5_batch(args, reads, size=args.slow5_batchsize, meta_keys=meta_keys, IDs=IDs, max_samples=args.slow5_batch_samples, tail=tail)
+    if len(tail) > 0:
+        yield tail
+
+def _prefetch(batches, depth=2):
+    """
+    run a batch generator in a background thread, keeping up to depth batches ready
+    so the next file is opened and decoded while the current batches are being queued
+    """
+    pq = queue.Queue(maxsize=depth)
+    def _fill():
+        try:
+            for batch in batches:
+                pq.put(batch)
+        except Exception as error:
+            pq.put(error)
+        pq.put(None)
+    t = threading.Thread(target=_fill, daemon=True)
+    t.start()
+    while True:
+        batch = pq.get()
+        if batch is None:
+            break
+        if isinstance(batch, Exception):
+            raise batch
+        yield batch
+    t.join()
+
+def get_slow5_files(args):
+    """
+    list the slow5/blow5 files in an input directory, recursively
+    """
+    slow5_files = []
+    for dirpath, _, files in os.walk(args.input):
+        for sfile in files:
+            if sfile.endswith(('.blow5', '.slow5')):
+                slow5_files.append(os.path.join(dirpath, sfile))
+    return slow5_files
+
+def read_worker(args, iq, total_samples, mqs, sq=None, queued_samples=None, fq=None, index=0, p_IDs=None):
     '''
     single threaded worker to read slow5 (with multithreading)
+    mqs are the worker queues file/read group metadata is sent on
+    queued_samples tracks the signal samples sitting in the input queue for --max_queue_samples
+    if a shared memory arena is used, signals are copied into it and
+    sq is the queue workers use to release arena regions
+    p_IDs is the set of parent read IDs to skip with --resume, built once by the main proc (get_resume_ids)
+
+    when part of a reader pool (--reader_procs), files are taken from the file queue fq
+    and the main proc's supervisor shuts down the workers once all the readers have exited
     '''
     if args.profile:
         pr = cProfile.Profile()
         pr.enable()
     
-    p_IDs = set()
-    # if --resume, open the file, create a set of parentIDs, and skip them in the blow5 file
-    if args.resume_run:
-        # check if it's a single file or multiple by presence of a comma
-        files = []
-        if "," in args.resume:
-            files = [i.strip() for i in args.resume.split(",")]
-        else:
-            files = [args.resume]
-        print("INFO: Resuming run from:", files)
-        prev_count = 0
-        for file in files:
-            ext = file.split(".")[-1]
-            count = 0
-            file_reads = 0
-            error_count = 0
-            insync = True
-            with open(file, 'r') as f:
-                for line in f:
-                    if ext == "fastq":
-                        # resync the fastq format if out of sync
-                        if not insync:
-                            if line[0] == "@" and "parent_read_id" in line:
-                                count = 0
-                                insync = True
-                                print("INFO: fastq line has regained syncronisation")
-                            else:
-                                continue
-                        if count == 0:
-                            if line[0] == "@" and "parent_read_id" in line:
-                                p_IDs.add(line.split("parent_read_id=")[1].split(' ')[0])
-                                file_reads += 1
-                            else:
-                                print("WARN: First line of read does not start with @ or does not have parent_read_id=, fastq file malformed")
-                                error_count += 1
-                                insync = False
-                        count += 1
-                        if count >= 4:
-                            count = 0
-                    elif ext == "sam":
-                        if line[0] == "@":
-                            continue
-                        # split read, so get the parent ID not the read ID
-                        if "pi:Z:" in line:
-                            p_IDs.add(line.split("pi:Z:")[1].split()[0])
-                            file_reads += 1
-                        # not a split read, so just get the read_id
-                        else:
-                            p_IDs.add(line.split("\t")[0])
-                            file_reads += 1
-                            print("RESUME: regular sam read_id:", line.split("\t")[0])
-                        # else:
-                        #     print("WARN: sam read does not contain pi:Z:, sam file malformed")
-                        #     error_count += 1
-                    else:
-                        print("ERROR: filetype not recognised and parsed to read_worker, contact developers")
-                        sys.exit(1)
+    arena = None
+    if args.shm_arena_name is not None:
+        nslices = args.reader_procs if fq is not None else 1
+        arena = SignalArena(args.shm_arena_name, sq, index=index, nslices=nslices)
 
-                    if error_count >= 5:
-                        print("ERROR: error count of 5 or more detected, please check or trim file and try again:", file)
-                        sys.exit(1)
+    # this adds a limit to how many reads it will load into memory so we
+    # don't blow the ram up
+    max_limit = int(args.max_read_queue_size / args.slow5_batchsize)
 
-            print("INFO: Read of resume file {} complete. Number of reads detected:".format(file), len(p_IDs)-prev_count)
-            prev_count = len(p_IDs)
-        print("INFO: Total number of reads detected:", len(p_IDs))
-                
-
-    header_array = {}
+    meta = MetaRegistry(mqs, index=index, stride=args.reader_procs if fq is not None else 1)
     # is dir, so reading recursivley
     if os.path.isdir(args.input):
-        # this adds a limit to how many reads it will load into memory so we
-        # don't blow the ram up
-        max_limit = int(args.max_read_queue_size / args.slow5_batchsize)
-        for dirpath, _, files in os.walk(args.input):
-            for sfile in files:
-                if sfile.endswith(('.blow5', '.slow5')):
-                    s5 = pyslow5.Open(os.path.join(dirpath, sfile), 'r')
-                    reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
-                    # if args.seq_sum:
-                    num_read_groups = s5.get_num_read_groups()
-                    for read_group in range(num_read_groups):
-                        header_array[read_group] = s5.get_all_headers(read_group=read_group)
-                    batches = _get_slow5_batch(args, s5, reads, size=args.slow5_batchsize, slow5_filename=sfile, header_array=header_array, IDs=p_IDs)
-                    # put batches of reads onto the queue
-                    for batch in chain(batches):
-                        # print(iq.qsize())
-                        if iq.qsize() < max_limit:
-                            batch_samples = 0
-                            for rd in batch:
-                                batch_samples += rd['len_raw_signal']
-                            with total_samples.get_lock():
-                                total_samples.value += batch_samples
-                            iq.put(batch)
-                        else:
-                            while iq.qsize() >= max_limit:
-                                time.sleep(0.01)
-                            batch_samples = 0
-                            for rd in batch:
-                                batch_samples += rd['len_raw_signal']
-                            with total_samples.get_lock():
-                                total_samples.value += batch_samples
-                            iq.put(batch)
+        if fq is not None:
+            files = iter(fq.get, None)
+        else:
+            files = get_slow5_files(args)
+        batches = _prefetch(_get_dir_batches(args, files, meta, IDs=p_IDs))
+        if args.length_bins is not None or args.ultra_long_samples > 0:
+            batches = _length_binned(args, batches)
+        # put batches of reads onto the queue
+        for batch in batches:
+            if arena is not None:
+                batch = arena.pack(batch)
+            _put_batch(args, iq, batch, total_samples, max_limit, queued_samples)
         
     else:
         s5 = pyslow5.Open(args.input, 'r')
         filename_slow5 = args.input.split("/")[-1]
-        reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
-        # if args.seq_sum:
-        num_read_groups = s5.get_num_read_groups()
-        for read_group in range(num_read_groups):
-            header_array[read_group] = s5.get_all_headers(read_group=read_group)
-        batches = _get_slow5_batch(args, s5, reads, size=args.slow5_batchsize, slow5_filename=filename_slow5, header_array=header_array, IDs=p_IDs)
-        # this adds a limit to how many reads it will load into memory so we
-        # don't blow the ram up
-        max_limit = int(args.max_read_queue_size / args.slow5_batchsize)
+        reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=get_file_aux_fields(s5, args.aux_fields))
+        meta_keys = meta.register(s5, filename_slow5)
+        batches = _get_slow5_batch(args, reads, size=args.slow5_batchsize, meta_keys=meta_keys, IDs=p_IDs, max_samples=args.slow5_batch_samples)
+        if args.length_bins is not None or args.ultra_long_samples > 0:
+            batches = _length_binned(args, batches)
         # put batches of reads onto the queue
         for batch in chain(batches):
-            # print(iq.qsize())
-            if iq.qsize() < max_limit:
-                batch_samples = 0
-                for rd in batch:
-                    batch_samples += rd['len_raw_signal']
-                with total_samples.get_lock():
-                    total_samples.value += batch_samples
-                iq.put(batch)
-            else:
-                while iq.qsize() >= max_limit:
-                    time.sleep(0.01)
-                batch_samples = 0
-                for rd in batch:
-                    batch_samples += rd['len_raw_signal']
-                with total_samples.get_lock():
-                    total_samples.value += batch_samples
-                iq.put(batch)
-    for _ in range(args.procs):
-        iq.put(None)
+            if arena is not None:
+                batch = arena.pack(batch)
+            _put_batch(args, iq, batch, total_samples, max_limit, queued_samples)
+
+    # a pool of readers is shut down by the supervisor in the main proc
+    if fq is None:
+        for _ in range(args.procs):
+            iq.put(None)
+
+    if arena is not None:
+        arena.close()
+
+    name = "read_worker" if fq is None else "read_worker_{}".format(index)
+    if args.stats:
+        print_proc_stats(name)
     
     # if profiling, dump info into log files in current dir
     if args.profile:
@@ -268,10 +434,48 @@ def read_worker(args, iq, total_samples):
         sortby = 'cumulative'
         ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
         ps.print_stats()
-        with open("read_worker.log", 'w') as f:
+        with open("{}.log".format(name), 'w') as f:
             print(s.getvalue(), file=f)
 
-def duplex_read_worker(args, dq, pre_dq):
+def retry_read_worker(args, iq, total_samples, mqs, read_ids, queued_samples=None, sk=None):
+    '''
+    reader for a retry pass, fetching the reads skipped in the main pass by read_id
+    each file's index is checked for the read ids, and the ones it has are read with random access
+    read ids not found are put on the skip queue sk, so they aren't taken as recovered
+    '''
+    wanted = set(read_ids)
+    max_limit = int(args.max_read_queue_size / args.slow5_batchsize)
+    meta = MetaRegistry(mqs)
+    if os.path.isdir(args.input):
+        files = get_slow5_files(args)
+    else:
+        files = [args.input]
+    for sfile in files:
+        if len(wanted) == 0:
+            break
+        s5 = pyslow5.Open(sfile, 'r')
+        file_ids, _ = s5.get_read_ids()
+        read_list = [read_id for read_id in file_ids if read_id in wanted]
+        del file_ids
+        if len(read_list) == 0:
+            continue
+        wanted.difference_update(read_list)
+        meta_keys = meta.register(s5, os.path.basename(sfile))
+        reads = s5.get_read_list_multi(read_list, threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=get_file_aux_fields(s5, args.aux_fields))
+        for batch in _get_slow5_batch(args, reads, size=args.slow5_batchsize, meta_keys=meta_keys, max_samples=args.slow5_batch_samples):
+            _put_batch(args, iq, batch, total_samples, max_limit, queued_samples)
+    if len(wanted) > 0:
+        print("WARNING: {} skipped reads to retry were not found in the input".format(len(wanted)))
+        if sk is not None:
+            for read_id in wanted:
+                sk.put([read_id, "not-found", "read not found in the input"])
+    for _ in range(args.procs):
+        iq.put(None)
+
+    if args.stats:
+        print_proc_stats("retry_read_worker")
+
+def duplex_read_worker(args, dq, pre_dq, total_samples, mqs):
     '''
     single threaded worker to read slow5 (with multithreading)
     organises data by channel for duplex calling
@@ -308,10 +512,9 @@ def duplex_read_worker(args, dq, pre_dq):
 
     s5 = pyslow5.Open(args.input, 'r')
     filename_slow5 = args.input.split("/")[-1]
-    header_array = {}
-    num_read_groups = s5.get_num_read_groups()
-    for read_group in range(num_read_groups):
-        header_array[read_group] = s5.get_all_headers(read_group=read_group)
+    meta = MetaRegistry(mqs)
+    meta_keys = meta.register(s5, filename_slow5)
+    aux_fields = get_file_aux_fields(s5, args.aux_fields)
     # reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
 
     readers = {}
@@ -333,6 +536,11 @@ def duplex_read_worker(args, dq, pre_dq):
                         free_names.append(qname)
                         taken_names.remove(qname)
                     else:
+                        batch_samples = 0
+                        for rd in batch:
+                            batch_samples += rd['len_raw_signal']
+                        with total_samples.get_lock():
+                            total_samples.value += batch_samples
                         dq[qname].put(batch)
                 else:
                     continue
@@ -355,8 +563,8 @@ def duplex_read_worker(args, dq, pre_dq):
             q = free_names[0]
             free_names.pop(0)
             taken_names.append(q)
-            reads = s5.get_read_list_multi(read_list, threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
-            batches = _get_slow5_batch(args, s5, reads, size=args.slow5_batchsize, slow5_filename=filename_slow5, header_array=header_array)
+            reads = s5.get_read_list_multi(read_list, threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=aux_fields)
+            batches = _get_slow5_batch(args, reads, size=args.slow5_batchsize, meta_keys=meta_keys)
             readers[q] = batches
         else:
             print("Some end state not known!")
@@ -364,6 +572,9 @@ def duplex_read_worker(args, dq, pre_dq):
     for qname in dq_names:
         dq[qname].put(None)
 
+    if args.stats:
+        print_proc_stats("duplex_read_worker")
+
     # if profiling, dump info into log files in current dir
     if args.profile:
         pr.disable()
@@ -375,7 +586,7 @@ def duplex_read_worker(args, dq, pre_dq):
             print(s.getvalue(), file=f)
 
 
-def duplex_read_worker_single(args, dq, pre_dq):
+def duplex_read_worker_single(args, dq, pre_dq, total_samples, mqs):
     '''
     Single proc method
     '''
@@ -388,10 +599,9 @@ def duplex_read_worker_single(args, dq, pre_dq):
 
     s5 = pyslow5.Open(args.input, 'r')
     filename_slow5 = args.input.split("/")[-1]
-    header_array = {}
-    num_read_groups = s5.get_num_read_groups()
-    for read_group in range(num_read_groups):
-        header_array[read_group] = s5.get_all_headers(read_group=read_group)
+    meta = MetaRegistry(mqs)
+    meta_keys = meta.register(s5, filename_slow5)
+    aux_fields = get_file_aux_fields(s5, args.aux_fields)
     # reads = s5.seq_reads_multi(threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
 
     # readers = {}
@@ -406,9 +616,14 @@ def duplex_read_worker_single(args, dq, pre_dq):
         print("[READER] - processing channel: {}".format(channel))
         data = ch[1]
         read_list = [i for i, _ in data]
-        reads = s5.get_read_list_multi(read_list, threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux='all')
-        batches = _get_slow5_batch(args, s5, reads, size=args.slow5_batchsize, slow5_filename=filename_slow5, header_array=header_array)
+        reads = s5.get_read_list_multi(read_list, threads=args.slow5_threads, batchsize=args.slow5_batchsize, aux=aux_fields)
+        batches = _get_slow5_batch(args, reads, size=args.slow5_batchsize, meta_keys=meta_keys)
         for batch in chain(batches):
+            batch_samples = 0
+            for rd in batch:
+                batch_samples += rd['len_raw_signal']
+            with total_samples.get_lock():
+                total_samples.value += batch_samples
             if dq.qsize() < 5:
                 dq.put(batch)
             else:
@@ -416,6 +631,9 @@ def duplex_read_worker_single(args, dq, pre_dq):
 
     dq.put(None)
 
+    if args.stats:
+        print_proc_stats("duplex_read_worker_single")
+
     # if profiling, dump info into log files in current dir
     if args.profile:
         pr.disable()
@@ -0,0 +1,188 @@
+# rendering of the sam/fastq records of basecalled reads
+# done by the worker procs, so the writer only has to write them out
+
+import numpy as np
+
+from .encode import encode_int_arrays
+from .bam import sam_to_bam
+
+def _sam_tags(args, read):
+    '''
+    sam tags for servers >= 7.4.12
+    '''
+    sam_tags = "MN:i:{}\tqs:f:{}\tmx:i:{}\tch:i:{}\tns:i:{}\tts:i:{}\tsm:f:{}\tsd:f:{}\tsv:Z:{}\tdu:f:{}".format(read["sequence_length"],
+                                                                                                                read["float_read_qscore"],
+                                                                                                                read["mux"],
+                                                                                                                read["channel"],
+                                                                                                                read["num_samples"],
+                                                                                                                read["trimmed_samples"],
+                                                                                                                read["scaling_median"],
+                                                                                                                read["scaling_med_abs_dev"],
+                                                                                                                read["scaling_version"],
+                                                                                                                read["duration"])
+    if args.above_768:
+        if args.estimate_poly_a:
+            sam_tags = "{}\tpt:i:{}\tpa:B:i,{}".format(sam_tags, read["poly_tail_length"], read["pa_str"])
+        if read["split_read"]:
+            sam_tags = "{}\tsp:i:{}".format(sam_tags, read["split_point"])
+    return sam_tags
+
+def render_output(args, read):
+    '''
+    the sam/fastq record of a basecalled read
+    '''
+    read_id = read["read_id"]
+    if args.sam_out:
+        if args.above_7412:
+            sam_tags = _sam_tags(args, read)
+            if args.duplex:
+                duplex_tag = "0"
+                if read["duplex_strand_1"] is not None:
+                    duplex_tag = "1"
+                if read["duplex_parent"]:
+                    duplex_tag = "-1"
+                if args.call_mods:
+                    return "{}\tpi:Z:{}\tdx:i:{}\n".format(read["sam_record"], read["parent_read_id"], duplex_tag)
+                # elif args.moves_out or args.above_798:
+                elif args.moves_out:
+                    move_str = read["move_str"]
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\t{}\tdx:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], sam_tags, duplex_tag)
+                else:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\tqs:f:{}\tdx:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], read["float_read_qscore"], duplex_tag)
+            else:
+                if args.call_mods:
+                    return "{}\n".format(read["sam_record"])
+                # elif args.moves_out or args.above_798:
+                elif args.moves_out:
+                    move_str = read["move_str"]
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\t{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], sam_tags)
+                else:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\t{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], sam_tags)
+        else:
+            if args.call_mods:
+                if args.do_read_splitting:
+                    return "{}\tpi:Z:{}\n".format(read["sam_record"], read["parent_read_id"])
+                else:
+                    return "{}\n".format(read["sam_record"])
+            elif args.moves_out:
+                move_str = read["move_str"]
+                if args.do_read_splitting:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\tqs:f:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], read["float_read_qscore"])
+                else:
+                    # do ns and ts tags
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tns:i:{}\tts:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["num_samples"], read["trimmed_samples"])
+            else:
+                if args.do_read_splitting:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\tqs:f:{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], read["float_read_qscore"])
+                else:
+                    # do ns and ts tags
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tns:i:{}\tts:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["float_read_qscore"], read["num_samples"], read["trimmed_samples"])
+    else:
+        # fastq
+        return "{} basecall_gpu={}\n{}\n+\n{}\n".format(read["header"], "_".join(args.gpu_name.split(" ")), read["sequence"], read["qscore"])
+
+
+def render_barcode_output(args, read):
+    '''
+    the sam/fastq record of a basecalled read for its barcode file, with the barcode added
+    '''
+    barcode = read["barcode_arrangement"]
+    if args.sam_out:
+        # TODO: Add duplex calling to the barcoded output
+        if args.above_7412:
+            sam_tags = _sam_tags(args, read)
+            if args.call_mods:
+                return "{}\tBC:Z:{}\n".format(read["sam_record"], barcode)
+            # elif args.moves_out or args.above_798:
+            elif args.moves_out:
+                move_str = read["move_str"]
+                return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\t{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, sam_tags, read["parent_read_id"], barcode)
+            else:
+                return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\t{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], sam_tags, read["parent_read_id"], barcode)
+
+        else:
+            if args.call_mods:
+                if args.do_read_splitting:
+                    return "{}\tpi:Z:{}\tBC:Z:{}\n".format(read["sam_record"], read["parent_read_id"], barcode)
+                else:
+                    return "{}\tBC:Z:{}\n".format(read["sam_record"], barcode)
+            elif args.moves_out:
+                move_str = read["move_str"]
+                if args.do_read_splitting:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["parent_read_id"], barcode)
+                else:
+                    # do ns and ts tags
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tns:i:{}\tts:i:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["num_samples"], read["trimmed_samples"], barcode)
+            else:
+                if args.do_read_splitting:
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["float_read_qscore"], read["parent_read_id"], barcode)
+                else:
+                    # do ns and ts tags
+                    return "{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tns:i:{}\tts:i:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["float_read_qscore"], read["num_samples"], read["trimmed_samples"], barcode)
+
+    else:
+        return "{} barcode={} basecall_gpu={}\n{}\n+\n{}\n".format(read["header"], barcode, "_".join(args.gpu_name.split(" ")), read["sequence"], read["qscore"])
+
+
+# fields only used to render the records, so they don't need to be sent to the writer
+RENDERED_FIELDS = ["sequence", "qscore", "move_table", "move_str", "pa_str", "sam_record"]
+
+
+def render_reads(args, reads):
+    '''
+    render a batch of basecalled reads, with the move tables (and poly-A info) of the whole batch encoded together
+    '''
+    if args.sam_out and args.moves_out and not args.call_mods and not args.bam_out:
+        move_strs = encode_int_arrays([read["move_table"] for read in reads])
+        for read, move_str in zip(reads, move_strs):
+            read["move_str"] = move_str.decode()
+    if args.sam_out and args.above_768 and args.estimate_poly_a and not args.bam_out:
+        pa_strs = encode_int_arrays([_poly_tail_values(read) for read in reads])
+        for read, pa_str in zip(reads, pa_strs):
+            read["pa_str"] = pa_str.decode()
+    for read in reads:
+        render_read(args, read)
+
+
+def _poly_tail_values(read):
+    '''
+    the values of the pa array tag, from the poly-A info of a read
+    '''
+    return np.array([int(i) for i in read["poly_tail_info"].split("|")], dtype=np.int64)
+
+
+def _bam_arrays(args, read):
+    '''
+    array tags of a read to pack into bam straight from their values, rather than from text
+    '''
+    arrays = {}
+    if args.moves_out and not args.call_mods:
+        arrays["mv"] = ("c", np.concatenate(([read["model_stride"]], read["move_table"])))
+    if args.above_768 and args.estimate_poly_a:
+        arrays["pa"] = ("i", _poly_tail_values(read))
+    return arrays
+
+
+def render_read(args, read):
+    '''
+    add the encoded output records to a basecalled read, read["record"] for the main
+    output and read["bc_record"] for its barcode file, and drop the fields used to make them
+    '''
+    if args.bam_out:
+        # the move table and poly-A info go into the bam record from the arrays, so they aren't made into text
+        read["move_str"] = ""
+        read["pa_str"] = ""
+        arrays = _bam_arrays(args, read)
+        read["record"] = sam_to_bam(render_output(args, read)[:-1], arrays)
+        if args.barcode_kits:
+            read["bc_record"] = sam_to_bam(render_barcode_output(args, read)[:-1], arrays)
+    else:
+        if args.sam_out and args.moves_out and not args.call_mods and "move_str" not in read:
+            read["move_str"] = encode_int_arrays([read["move_table"]])[0].decode()
+        if args.sam_out and args.above_768 and args.estimate_poly_a and "pa_str" not in read:
+            read["pa_str"] = encode_int_arrays([_poly_tail_values(read)])[0].decode()
+        read["record"] = render_output(args, read).encode()
+        if args.barcode_kits:
+            read["bc_record"] = render_barcode_output(args, read).encode()
+    for field in RENDERED_FIELDS:
+        read.pop(field, None)
@@ -0,0 +1,177 @@
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# keep regions aligned so int16 views are always valid
+ALIGN = 64
+
+
+def create_arena(size_mb):
+    """
+    create the shared memory block used to pass signals from the reader to the workers
+    called by the main process, which owns it and unlinks it at the end of the run
+    returns None if it can't be created (eg, /dev/shm too small)
+    """
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=int(size_mb * 1024 * 1024))
+    except (OSError, ValueError) as error:
+        print("WARNING: could not create shared memory arena of {} MB, falling back to queue transport: {} - {}".format(size_mb, type(error).__name__, error))
+        return None
+    return shm
+
+
+def close_arena(shm):
+    """
+    close and unlink the shared memory block
+    """
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SignalArena():
+    """
+    Reader side of the shared memory signal transport.
+
+    The shared block is used as a ring. Each batch gets one contiguous region, the
+    signals are copied into it and each read carries a small descriptor in
+    read["signal_shm"] = (region_start, region_reads, offset, length, index) instead of the signal.
+    Workers send region_start back on the release queue (rq) once every read of the
+    region has been submitted. Regions can be released out of order, space is only
+    reclaimed once the oldest region is released.
+
+    With more than one reader, the block is split into nslices equal slices and each
+    reader uses the slice and release queue of its index.
+    """
+    def __init__(self, name, rq, index=0, nslices=1):
+        self.shm = shared_memory.SharedMemory(name=name)
+        slice_size = self.shm.size // nslices // ALIGN * ALIGN
+        self.base = index * slice_size
+        self.end = self.base + slice_size
+        self.size = slice_size
+        self.index = index
+        self.rq = rq
+        self.head = self.base
+        # [start, end, released] in allocation order
+        self.regions = deque()
+        self.lookup = {}
+
+    def _drain(self, timeout=None):
+        """
+        mark released regions, blocking for up to timeout seconds for the first one
+        """
+        got = False
+        while True:
+            try:
+                if timeout is not None and not got:
+                    start = self.rq.get(timeout=timeout)
+                else:
+                    start = self.rq.get_nowait()
+            except Exception:
+                break
+            got = True
+            self.lookup.pop(start)[2] = True
+        while self.regions and self.regions[0][2]:
+            self.regions.popleft()
+        if not self.regions:
+            self.head = self.base
+        return got
+
+    def _alloc(self, nbytes):
+        """
+        find space for nbytes in the ring, returns start or None if full
+        """
+        if not self.regions:
+            return self.base
+        tail = self.regions[0][0]
+        if self.head > tail:
+            # free space is [head, end) and [base, tail)
+            if self.end - self.head >= nbytes:
+                return self.head
+            if tail - self.base >= nbytes:
+                return self.base
+        elif self.head < tail:
+            # wrapped, free space is [head, tail)
+            if tail - self.head >= nbytes:
+                return self.head
+        # head == tail with regions in use means the ring is full
+        return None
+
+    def pack(self, batch):
+        """
+        copy the signals of a batch into the arena and replace them with descriptors
+        batches that can never fit are returned untouched and go through the queue as normal
+        """
+        nbytes = 0
+        for read in batch:
+            nbytes += -(-read["signal"].nbytes // ALIGN) * ALIGN
+        if nbytes == 0 or nbytes > self.size:
+            return batch
+        self._drain()
+        start = self._alloc(nbytes)
+        while start is None:
+            # wait for workers to release regions
+            self._drain(timeout=1)
+            start = self._alloc(nbytes)
+        region = [start, start + nbytes, False]
+        self.regions.append(region)
+        self.lookup[start] = region
+        self.head = start + nbytes
+
+        offset = start
+        for read in batch:
+            signal = read["signal"]
+            length = len(signal)
+            view = np.ndarray((length,), dtype=np.int16, buffer=self.shm.buf, offset=offset)
+            view[:] = signal
+            del view
+            read["signal"] = None
+            read["signal_shm"] = (start, len(batch), offset, length, self.index)
+            offset += -(-signal.nbytes // ALIGN) * ALIGN
+        return batch
+
+    def close(self):
+        self.shm.close()
+
+
+class SignalArenaView():
+    """
+    Worker side of the shared memory signal transport.
+    Builds numpy views over the arena for each read and releases a region back to
+    the reader once all of its reads have been submitted.
+    rqs is the list of release queues, one per reader
+    """
+    def __init__(self, name, rqs):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.rqs = rqs
+        # region_start: reads left to submit
+        self.remaining = {}
+
+    def get_signal(self, read):
+        """
+        int16 view of the read signal, without copying
+        """
+        start, region_reads, offset, length, index = read["signal_shm"]
+        return np.ndarray((length,), dtype=np.int16, buffer=self.shm.buf, offset=offset)
+
+    def done(self, read):
+        """
+        mark a read as submitted (or skipped), releasing its region when it is the last one
+        """
+        start, region_reads, offset, length, index = read["signal_shm"]
+        left = self.remaining.get(start, region_reads) - 1
+        if left == 0:
+            self.remaining.pop(start, None)
+            self.rqs[index].put(start)
+        else:
+            self.remaining[start] = left
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # a view is still held somewhere, the main process unlinks it anyway
+            pass
@@ -0,0 +1,115 @@
+import threading
+
+# stages whose reads are worth trying again: the read was never taken by the server (stage-0).
+# stage-1 skips are not retried, they are keyed by the parent read id, so retrying one would write
+# any split reads of the parent already written a second time, and the server gives the same result again
+RETRY_STAGES = ["stage-0"]
+# --submit_deadline is multiplied by this for a retry pass
+RETRY_DEADLINE_FACTOR = 4
+# put on the skip queue by the main proc to start a retry pass
+RETRY_MARK = "retry"
+
+
+def get_skipped_path(args):
+    """
+    skipped_reads.txt is written next to the output
+    """
+    if "/" in args.output:
+        return "{}/skipped_reads.txt".format("/".join(args.output.split("/")[:-1]))
+    return "./skipped_reads.txt"
+
+
+class SkipLog():
+    """
+    Consumer of the skip queue, run as a thread in the main proc.
+
+    Skipped reads are written to skipped_reads.txt as they come in, and flushed after each
+    lot, so they aren't lost if the run dies. The read ids of stage-0 skips are kept
+    for a retry pass. retry_ids() marks the start of a pass on the queue, so skips from the
+    pass are told apart (their stage is written as retry-<stage>).
+
+    The last skip of each read is kept as well, and if there were retry passes, close() writes
+    this run's part of the file again with one line per read: its last skip if it is still
+    unresolved, or a recovered line if a retry pass basecalled it.
+    """
+    def __init__(self, args, sk):
+        self.path = get_skipped_path(args)
+        self.sk = sk
+        self.SKIPPED = None
+        # where this run's lines start, the file is appended to
+        self.start = 0
+        # read_id: [stage, error] of its last skip
+        self.reads = {}
+        # read ids in a retry pass that haven't been skipped again
+        self.retrying = set()
+        self.retry = []
+        self.passes = 0
+        self.marked = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        print("Skipped reads detected, writing details to file: {}".format(self.path))
+        self.SKIPPED = open(self.path, "a")
+        # if the read pointer is at the start of the file, write a header, otherwise skip it cause we are appending
+        if self.SKIPPED.tell() == 0:
+            self.SKIPPED.write("read_id\tstage\terror\n")
+        self.start = self.SKIPPED.tell()
+
+    def _run(self):
+        while True:
+            lot = [self.sk.get()]
+            # take whatever else is waiting, to write and flush it together
+            while lot[-1] is not None and lot[-1] != RETRY_MARK and not self.sk.empty():
+                lot.append(self.sk.get())
+            for read in lot:
+                if read is None or read == RETRY_MARK:
+                    break
+                read_id, stage, error = read
+                if stage in RETRY_STAGES:
+                    self.retry.append(read_id)
+                if self.passes > 0:
+                    stage = "retry-{}".format(stage)
+                self.reads[read_id] = [stage, error]
+                self.retrying.discard(read_id)
+                if self.SKIPPED is None:
+                    self._open()
+                self.SKIPPED.write("{}\t{}\t{}\n".format(read_id, stage, error))
+            if self.SKIPPED is not None:
+                self.SKIPPED.flush()
+            if lot[-1] == RETRY_MARK:
+                self.passes += 1
+                self.marked.set()
+            elif lot[-1] is None:
+                break
+
+    def retry_ids(self):
+        """
+        read ids to retry, skipped at stage-0 since the last pass
+        called once the workers have exited, so all their skips are already on the queue
+        """
+        self.marked.clear()
+        self.sk.put(RETRY_MARK)
+        self.marked.wait()
+        ids = list(dict.fromkeys(self.retry))
+        self.retry = []
+        self.retrying.update(ids)
+        return ids
+
+    def close(self):
+        self.sk.put(None)
+        self.thread.join()
+        if self.SKIPPED is None:
+            return
+        if self.passes > 0:
+            # the final state of this run's skipped reads, in place of the lines written as they came in
+            self.SKIPPED.truncate(self.start)
+            for read_id, (stage, error) in self.reads.items():
+                if read_id in self.retrying:
+                    self.SKIPPED.write("{}\trecovered\tbasecalled in a retry pass after {}: {}\n".format(read_id, stage, error))
+                else:
+                    self.SKIPPED.write("{}\t{}\t{}\n".format(read_id, stage, error))
+        self.SKIPPED.close()
+        print("Skipped reads total: {}".format(len(self.reads) - len(self.retrying)))
+        if self.passes > 0:
+            print("Skipped reads recovered by retry passes: {}".format(len(self.retrying)))
@@ -0,0 +1,61 @@
+import sys
+import platform
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def get_peak_rss():
+    """
+    peak resident set size of the current process in kB
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, linux reports kB
+    if platform.system() == "Darwin":
+        peak = int(peak / 1024)
+    return peak
+
+
+def print_proc_stats(name, **counters):
+    """
+    print a [STATS] line for a process, used with --stats
+    values are written as key=value pairs so they are easy to parse
+    """
+    fields = ["peak_rss_kb={}".format(get_peak_rss())]
+    for key, value in counters.items():
+        fields.append("{}={}".format(key, value))
+    # one write, so lines from the client threads of a worker don't interleave
+    sys.stdout.write("[STATS] {} {}\n".format(name, " ".join(fields)))
+    sys.stdout.flush()
+
+
+def queue_monitor(queues, samples, stop, interval=0.5):
+    """
+    thread target to sample the size of each queue until stop is set
+    queues = {name: queue}, samples = {name: [sizes]}
+    """
+    while not stop.is_set():
+        for name, q in queues.items():
+            try:
+                size = q.qsize()
+            except NotImplementedError:
+                # macOS mp.Queue doesn't support qsize
+                continue
+            samples.setdefault(name, []).append(size)
+        stop.wait(interval)
+
+
+def print_queue_stats(samples):
+    """
+    print max and mean occupancy of each sampled queue
+    """
+    for name, sizes in samples.items():
+        if len(sizes) == 0:
+            continue
+        print("[STATS] {} queue_max={} queue_mean={:.2f} queue_samples={}".format(name, max(sizes), sum(sizes) / len(sizes), len(sizes)))
+    sys.stdout.flush()
@@ -0,0 +1,105 @@
+import time
+import heapq
+import random
+
+# the longest wait between tries of a read refused by the server
+MAX_BACKOFF = 1.0
+
+# submission counters, shared by the workers as an mp.Array('d', SUBMIT_STATS_SIZE)
+SUBMIT_REJECTED = 0
+SUBMIT_DEFERRED = 1
+SUBMIT_BACKOFF_TIME = 2
+SUBMIT_TIMED_OUT = 3
+SUBMIT_STATS_SIZE = 4
+
+
+def backoff_delay(base, attempts):
+    """
+    exponential backoff with jitter, so workers refused at the same time don't all retry together
+    """
+    delay = min(MAX_BACKOFF, base * (2 ** attempts))
+    return delay / 2 + random.random() * delay / 2
+
+
+class RetryQueue():
+    """
+    Reads pass_read refused, waiting to be tried again.
+
+    Each refusal pushes the read back by an exponential backoff with jitter, starting at base
+    seconds. A read that still hasn't been taken deadline seconds after it was first refused
+    is given up on. Reads are kept in a heap by the time they are next due, so the rest of a
+    batch is submitted while a refused read waits.
+    """
+    def __init__(self, base, deadline):
+        self.base = base
+        self.deadline = deadline
+        self.heap = []
+        # read_id: [attempts, first refused]
+        self.attempts = {}
+        self.count = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.backoff_time = 0.0
+        self.timed_out = 0
+
+    def defer(self, read):
+        """
+        queue a refused read to be tried again
+        returns False if the read is past its deadline, and should be skipped
+        """
+        read_id = read['read_id']
+        now = time.perf_counter()
+        self.rejected += 1
+        if read_id not in self.attempts:
+            self.attempts[read_id] = [0, now]
+            self.deferred += 1
+        attempt = self.attempts[read_id]
+        if now - attempt[1] >= self.deadline:
+            del self.attempts[read_id]
+            self.timed_out += 1
+            return False
+        delay = backoff_delay(self.base, attempt[0])
+        attempt[0] += 1
+        self.backoff_time += delay
+        # count breaks ties, so reads are never compared
+        heapq.heappush(self.heap, (now + delay, self.count, read))
+        self.count += 1
+        return True
+
+    def done(self, read_id):
+        """
+        a read was taken by the server
+        """
+        self.attempts.pop(read_id, None)
+
+    def due(self):
+        """
+        take the reads that are due to be tried again
+        """
+        now = time.perf_counter()
+        reads = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            reads.append(heapq.heappop(self.heap)[2])
+        return reads
+
+    def wait(self):
+        """
+        sleep until the next read is due
+        """
+        if len(self.heap) > 0:
+            time.sleep(max(0.0, self.heap[0][0] - time.perf_counter()))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add_stats(self, submit_stats):
+        """
+        add this worker's counters to the shared submission counters
+        """
+        if submit_stats is None:
+            return
+        with submit_stats.get_lock():
+            submit_stats[SUBMIT_REJECTED] += self.rejected
+            submit_stats[SUBMIT_DEFERRED] += self.deferred
+            submit_stats[SUBMIT_BACKOFF_TIME] += self.backoff_time
+            submit_stats[SUBMIT_TIMED_OUT] += self.timed_out
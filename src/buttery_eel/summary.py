@@ -0,0 +1,235 @@
+import os, sys
+import zipfile
+import numpy as np
+
+# columnar sequencing summary, --seq_sum_format npz
+# each column is a typed numpy array, saved in sequencing_summary.npz (np.load() it)
+# text columns with few values (file names, run ids etc) are saved as int32 codes in <column>,
+# and the values they index in <column>_categories. read ids are fixed width bytes
+
+# (column, type) for the values of a summary row, in the order of the text summary after filename_out
+# None columns are always "." and aren't saved
+SUMMARY_COLUMNS = [("filename_slow5", "cat"), ("parent_read_id", "id"), ("read_id", "id"), ("run_id", "cat"),
+                   ("channel", "<i4"), ("mux", "<i4"), ("minknow_events", "<i8"), ("start_time", "<f8"), ("duration", "<f8"),
+                   ("passes_filtering", "cat"), (None, None), ("num_events_template", "<i8"), (None, None),
+                   ("sequence_length_template", "<i8"), ("mean_qscore_template", "<f8"), ("strand_score_template", "<f8"),
+                   ("median_template", "<f8"), ("mad_template", "<f8"), ("experiment_id", "cat"), ("sample_id", "cat"),
+                   ("end_reason", "cat")]
+# rows kept in memory before they are added to the column files
+CHUNK_ROWS = 100000
+# width of the read id columns, a UUID
+READ_ID_WIDTH = 36
+
+
+def set_summary(args, read, values):
+    """
+    add the sequencing summary of a read, in the formats asked for
+    values are the summary row, after filename_out, which the writer adds
+    """
+    if args.seq_sum_format in ["txt", "both"]:
+        read["sum_out"] = "\t".join([str(i) for i in values])
+    if args.seq_sum_format in ["npz", "both"]:
+        read["sum_row"] = values
+
+
+def _column_array(kind, values, categories=None):
+    """
+    a chunk of values of a column as a numpy array
+    """
+    if kind == "cat":
+        codes = []
+        for value in values:
+            value = str(value)
+            if value not in categories:
+                categories[value] = len(categories)
+            codes.append(categories[value])
+        return np.array(codes, dtype="<i4")
+    if kind == "id":
+        return np.array(values, dtype="S{}".format(READ_ID_WIDTH))
+    if kind[1] == "i":
+        return np.array([-1 if value == "." else int(value) for value in values], dtype=kind)
+    return np.array([np.nan if value == "." else float(value) for value in values], dtype=kind)
+
+
+def _npy_header(dtype, shape):
+    """
+    .npy header of an array, written ahead of its data
+    """
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape}
+    return header
+
+
+class ColumnarSummary():
+    """
+    Writer side of the columnar sequencing summary.
+
+    Rows are held for CHUNK_ROWS reads, then each column is turned into a numpy array and
+    appended to its own raw file next to the summary, so memory doesn't grow with the run.
+    close() packs the column files into the .npz (an uncompressed zip of .npy files) and removes them.
+    If the .npz is already there (--resume), the new rows are added after the ones in it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.resumed = os.path.isfile(path)
+        if self.resumed:
+            self.path = "{}.new".format(path)
+        self.final_path = path
+        self.columns = [("filename_out", "cat")] + [column for column in SUMMARY_COLUMNS if column[0] is not None]
+        # index of each saved column in a summary row, filename_out is added by the writer
+        self.index = [i for i, column in enumerate(SUMMARY_COLUMNS) if column[0] is not None]
+        self.categories = {name: {} for name, kind in self.columns if kind == "cat"}
+        self.rows = []
+        self.count = 0
+        self.long_ids = False
+        try:
+            self.files = {name: open(self.column_path(name), 'wb') for name, kind in self.columns}
+        except Exception as error:
+            # handle the exception
+            print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
+            sys.exit(1)
+
+    def column_path(self, name):
+        return "{}.{}.tmp".format(self.path, name)
+
+    def add(self, filename_out, row):
+        self.rows.append([filename_out] + [row[i] for i in self.index])
+        if len(self.rows) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        for c, (name, kind) in enumerate(self.columns):
+            values = [row[c] for row in self.rows]
+            if kind == "id" and not self.long_ids and max(len(value) for value in values) > READ_ID_WIDTH:
+                self.long_ids = True
+                print("WARNING: read ids longer than {} characters are cut short in the columnar summary".format(READ_ID_WIDTH))
+            self.files[name].write(_column_array(kind, values, self.categories.get(name)).tobytes())
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        write_columns(self.path, self.count,
+                      [(name, kind, self.column_path(name)) for name, kind in self.columns],
+                      self.categories)
+        if self.resumed:
+            merge_columnar_summaries(self.final_path, [self.final_path, self.path])
+
+
+def write_columns(path, count, columns, categories):
+    """
+    pack raw column files into a .npz, removing them
+    columns is [(name, type, raw file)], categories is {name: {value: code}} of the cat columns
+    """
+    try:
+        npz = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+    except Exception as error:
+        # handle the exception
+        print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
+        sys.exit(1)
+    with npz:
+        for name, kind, column_file in columns:
+            dtype = "<i4" if kind == "cat" else "S{}".format(READ_ID_WIDTH) if kind == "id" else kind
+            with npz.open("{}.npy".format(name), 'w', force_zip64=True) as f:
+                np.lib.format.write_array_header_1_0(f, _npy_header(dtype, (count,)))
+                with open(column_file, 'rb') as raw:
+                    while True:
+                        data = raw.read(16 * 1024 * 1024)
+                        if len(data) == 0:
+                            break
+                        f.write(data)
+            os.remove(column_file)
+            if kind == "cat":
+                values = sorted(categories[name], key=categories[name].get)
+                with npz.open("{}_categories.npy".format(name), 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.array(values, dtype=str), allow_pickle=False)
+
+
+def _read_npy_header(f):
+    """
+    shape and dtype of a .npy file, leaving f at the start of its data
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def _column_chunks(npz, name):
+    """
+    the values of a column of a .npz, CHUNK_ROWS at a time, so the whole column is never in memory
+    """
+    with npz.open("{}.npy".format(name)) as f:
+        shape, dtype = _read_npy_header(f)
+        left = shape[0]
+        while left > 0:
+            rows = min(left, CHUNK_ROWS)
+            yield np.frombuffer(f.read(rows * dtype.itemsize), dtype=dtype)
+            left -= rows
+
+
+def merge_columnar_summaries(path, shard_paths):
+    """
+    join columnar summaries into path, in order, removing them, eg, the shards of --writers N
+    path itself can be one of them, for a resumed run
+    like write_columns, each column is copied across a chunk at a time, with the category
+    codes of each summary mapped onto the merged categories as it goes
+    """
+    shards = [shard for shard in shard_paths if os.path.isfile(shard)]
+    if len(shards) == 0:
+        return
+    npzs = [zipfile.ZipFile(shard) for shard in shards]
+    names = [name[:-len(".npy")] for name in npzs[0].namelist()]
+    columns = [name for name in names if not name.endswith("_categories")]
+    # the categories are small, so they are loaded to work out each summary's code mapping
+    categories = {}
+    mappings = {}
+    for name in columns:
+        if name + "_categories" not in names:
+            continue
+        cats = {}
+        mappings[name] = []
+        for npz in npzs:
+            with npz.open("{}_categories.npy".format(name)) as f:
+                shard_cats = np.lib.format.read_array(f, allow_pickle=False)
+            for value in shard_cats:
+                if value not in cats:
+                    cats[value] = len(cats)
+            mappings[name].append(np.array([cats[value] for value in shard_cats], dtype="<i4"))
+        categories[name] = cats
+    merged_path = "{}.merge.tmp".format(path)
+    try:
+        merged = zipfile.ZipFile(merged_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+    except Exception as error:
+        # handle the exception
+        print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
+        sys.exit(1)
+    with merged:
+        for name in columns:
+            count = 0
+            for npz in npzs:
+                with npz.open("{}.npy".format(name)) as f:
+                    shape, dtype = _read_npy_header(f)
+                count += shape[0]
+            with merged.open("{}.npy".format(name), 'w', force_zip64=True) as f:
+                np.lib.format.write_array_header_1_0(f, _npy_header(dtype, (count,)))
+                for i, npz in enumerate(npzs):
+                    for chunk in _column_chunks(npz, name):
+                        if name in mappings:
+                            chunk = mappings[name][i][chunk]
+                        f.write(chunk.tobytes())
+            if name in categories:
+                values = sorted(categories[name], key=categories[name].get)
+                with merged.open("{}_categories.npy".format(name), 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.array(values, dtype=str), allow_pickle=False)
+    for npz in npzs:
+        npz.close()
+    os.replace(merged_path, path)
+    for shard in shards:
+        if shard != path:
+            os.remove(shard)
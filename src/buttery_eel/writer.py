@@ -1,9 +1,20 @@
 import sys, os
 import time
+import glob
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from ._version import __version__
 
 import cProfile, pstats, io
 
+from .stats import print_proc_stats
+from .journal import get_journal_path, open_journal, write_journal, read_journal
+from .bgzf import BGZFWriter
+from .bam import bam_header
+from .demux import BarcodeFiles, DEMUX_BUFFER_SIZE
+from .summary import ColumnarSummary, merge_columnar_summaries
+from .index import ReadIndex, get_index_path, merge_indexes
+
 
 try:
     import pybasecall_client_lib
@@ -19,11 +30,58 @@ total_reads = 0
 div = 50
 skipped = 0
 
+# with --writers N, writer i writes <file>.shard<i> for each of its output files
+SHARD_EXT = ".shard"
+# buffer size used when merging shards
+MERGE_BUFSIZE = 16 * 1024 * 1024
+
+SUMMARY_HEADER = "\t".join(["filename_out", "filename_slow5", "parent_read_id",
+                            "read_id", "run_id", "channel", "mux", "minknow_events", "start_time", "duration",
+                            "passes_filtering", "template_start", "num_events_template", "template_duration",
+                            "sequence_length_template", "mean_qscore_template", "strand_score_template",
+                            "median_template", "mad_template", "experiment_id", "sample_id", "end_reason"])
+BARCODE_SUMMARY_HEADER = "\t".join(["parent_read_id", "read_id", "barcode_arrangement", "barcode_full_arrangement", "barcode_kit", "barcode_variant", "barcode_score",
+                                    "barcode_front_id", "barcode_front_score", "barcode_front_refseq", "barcode_front_foundseq", "barcode_front_foundseq_length",
+                                    "barcode_front_begin_index", "barcode_rear_id", "barcode_rear_score", "barcode_rear_refseq", "barcode_rear_foundseq", "barcode_rear_foundseq_length",
+                                    "barcode_rear_end_index"])
+
+
+def get_shard_path(path, shard):
+    """
+    filename of a writer's shard of an output file, or the file itself with a single writer
+    """
+    if shard is None:
+        return path
+    return "{}{}{}".format(path, SHARD_EXT, shard)
+
+
+def split_output(output):
+    """
+    name and extension of an output filename, keeping .gz with the extension, eg, reads.fastq.gz -> reads, fastq.gz
+    """
+    parts = output.split(".")
+    n = 2 if parts[-1] == "gz" and len(parts) > 2 else 1
+    return ".".join(parts[:-n]), ".".join(parts[-n:])
+
+
+def get_summary_path(args, name, compress=True):
+    """
+    summary files are written next to the output, and are compressed too for .fastq.gz output
+    """
+    if args.gz_out and compress:
+        name = name + ".gz"
+    if "/" in args.output:
+        return "{}/{}".format("/".join(args.output.split("/")[:-1]), name)
+    return "./{}".format(name)
+
 def write_summary(summary, data):
     """
     write summary file output
     """
-    summary.write("{}\n".format(data))
+    if isinstance(summary, BGZFWriter):
+        summary.write("{}\n".format(data).encode())
+    else:
+        summary.write("{}\n".format(data))
 
 def sam_header(OUT, model_version_id, model_config_name, sep='\t'):
     """
@@ -92,86 +150,151 @@ def sam_header(OUT, model_version_id, model_config_name, sep='\t'):
         'CL:buttery-eel %s' % ' '.join(sys.argv[1:]),
         'DS:ont basecaller wrapper model_version_id={} model_config_name={}'.format(model_version_id, model_config_name),
     ])
-    OUT.write("{}\n".format(HD))
-    OUT.write("{}\n".format(PG1))
-    OUT.write("{}\n".format(PG2))
+    header = "{}\n{}\n{}\n".format(HD, PG1, PG2)
+    if isinstance(OUT, BGZFWriter):
+        OUT.write(bam_header(header))
+    else:
+        OUT.write(header.encode())
+
+
+def open_output(args, path, pool=None, shard=None, mode='xb', buffering=-1):
+    """
+    create an output file, bgzf compressed for bam and .fastq.gz
+    the shards of --writers N are joined later, so they get no EOF block
+    """
+    if args.bam_out or args.gz_out:
+        return BGZFWriter(path, pool, mode=mode, eof=shard is None, track=args.read_index)
+    return open(path, mode, buffering=buffering)
+
+
+def get_barcode_path(args, barcode, fkey):
+    """
+    output file of a barcode, split on pass/fail with --qscore
+    """
+    name, ext = split_output(args.output)
+    if fkey in ["pass", "fail"]:
+        return ".".join([name, fkey, barcode, ext])
+    return ".".join([name, barcode, ext])
+
+
+def open_summary(args, path, pool=None, shard=None):
+    """
+    open a summary file to add to, bgzf compressed for .fastq.gz output
+    """
+    if args.gz_out:
+        return BGZFWriter(path, pool, mode='ab', eof=shard is None)
+    return open(path, "a")
 
 
-def write_worker(args, q, files, SAM_OUT, model_version_id, model_config_name, gpu_name):
+def write_worker(args, q, files, SAM_OUT, model_version_id, model_config_name, gpu_name, shard=None):
     '''
     single threaded worker to process results queue
+    with --writers N, shard is the writer's index, and it writes shards of the outputs with no headers
     '''
     if args.profile:
         pr = cProfile.Profile()
         pr.enable()
+
+    # threads shared by the compressed outputs to compress bgzf blocks
+    pool = None
+    if (args.bam_out or args.gz_out) and args.compress_threads > 1:
+        pool = ThreadPoolExecutor(args.compress_threads)
     
-    if args.seq_sum:
+    if args.seq_sum and args.seq_sum_format in ["txt", "both"]:
+        summary_path = get_summary_path(args, "sequencing_summary.txt")
         try:
-            if "/" in args.output:
-                SUMMARY = open("{}/sequencing_summary.txt".format("/".join(args.output.split("/")[:-1])), "a")
-                print("Writing summary file to: {}/sequencing_summary.txt".format("/".join(args.output.split("/")[:-1])))
-            else:
-                SUMMARY = open("./sequencing_summary.txt", "a")
-                print("Writing summary file to: ./sequencing_summary.txt")
+            SUMMARY = open_summary(args, get_shard_path(summary_path, shard), pool, shard)
+            if not shard:
+                print("Writing summary file to: {}".format(summary_path))
         except Exception as error:
             # handle the exception
             print("ERROR: An exception occurred in file opening:", type(error).__name__, "-", error)
             sys.exit(1)
-        if SUMMARY is not None and SUMMARY.tell() == 0:
-            SUMMARY_HEADER = "\t".join(["filename_out", "filename_slow5", "parent_read_id",
-                                        "read_id", "run_id", "channel", "mux", "minknow_events", "start_time", "duration",
-                                        "passes_filtering", "template_start", "num_events_template", "template_duration",
-                                        "sequence_length_template", "mean_qscore_template", "strand_score_template",
-                                        "median_template", "mad_template", "experiment_id", "sample_id", "end_reason"])
+        if shard is None and SUMMARY.tell() == 0:
             write_summary(SUMMARY, SUMMARY_HEADER)
     else:
         SUMMARY = None
+
+    if args.seq_sum and args.seq_sum_format in ["npz", "both"]:
+        columns_path = get_summary_path(args, "sequencing_summary.npz", compress=False)
+        COLUMNS = ColumnarSummary(get_shard_path(columns_path, shard))
+        if not shard:
+            print("Writing columnar summary file to: {}".format(columns_path))
+    else:
+        COLUMNS = None
     
     if args.barcode_kits:
-        bc_files = {}
+        barcode_summary_path = get_summary_path(args, "barcoding_summary.txt")
         try:
-            if "/" in args.output:
-                BARCODE_SUMMARY = open("{}/barcoding_summary.txt".format("/".join(args.output.split("/")[:-1])), "a")
-                print("Writing summary file to: {}/barcoding_summary.txt".format("/".join(args.output.split("/")[:-1])))
-            else:
-                BARCODE_SUMMARY = open("./barcoding_summary.txt", "a")
-                print("Writing summary file to: ./barcoding_summary.txt")
+            BARCODE_SUMMARY = open_summary(args, get_shard_path(barcode_summary_path, shard), pool, shard)
+            if not shard:
+                print("Writing summary file to: {}".format(barcode_summary_path))
         except Exception as error:
             # handle the exception
             print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
             sys.exit(1)
-        if BARCODE_SUMMARY is not None and BARCODE_SUMMARY.tell() == 0:
-            BARCODE_SUMMARY_HEADER = "\t".join(["parent_read_id", "read_id", "barcode_arrangement", "barcode_full_arrangement", "barcode_kit", "barcode_variant", "barcode_score",
-                                                "barcode_front_id", "barcode_front_score", "barcode_front_refseq", "barcode_front_foundseq", "barcode_front_foundseq_length",
-                                                "barcode_front_begin_index", "barcode_rear_id", "barcode_rear_score", "barcode_rear_refseq", "barcode_rear_foundseq", "barcode_rear_foundseq_length",
-                                                "barcode_rear_end_index"])
+        if shard is None and BARCODE_SUMMARY.tell() == 0:
             write_summary(BARCODE_SUMMARY, BARCODE_SUMMARY_HEADER)
 
     try:
-        if SAM_OUT:
+        if args.barcode_kits and args.barcode_split_only:
+            # only the barcode files are written
+            OUT = {}
+        elif SAM_OUT:
             if args.qscore:
-                PASS = open(files["pass"], 'x') 
-                FAIL = open(files["fail"], 'x')
-                sam_header(PASS, model_version_id, model_config_name)
-                sam_header(FAIL, model_version_id, model_config_name)
+                PASS = open_output(args, get_shard_path(files["pass"], shard), pool, shard)
+                FAIL = open_output(args, get_shard_path(files["fail"], shard), pool, shard)
+                if shard is None:
+                    sam_header(PASS, model_version_id, model_config_name)
+                    sam_header(FAIL, model_version_id, model_config_name)
                 OUT = {"pass": PASS, "fail": FAIL}
             else:
-                single = open(files["single"], 'x')
-                sam_header(single, model_version_id, model_config_name)
+                single = open_output(args, get_shard_path(files["single"], shard), pool, shard)
+                if shard is None:
+                    sam_header(single, model_version_id, model_config_name)
                 OUT = {"single": single}
         else:
             if args.qscore:
-                PASS = open(files["pass"], 'x') 
-                FAIL = open(files["fail"], 'x')
+                PASS = open_output(args, get_shard_path(files["pass"], shard), pool, shard)
+                FAIL = open_output(args, get_shard_path(files["fail"], shard), pool, shard)
                 OUT = {"pass": PASS, "fail": FAIL}
             else:
-                single = open(files["single"], 'x')
+                single = open_output(args, get_shard_path(files["single"], shard), pool, shard)
                 OUT = {"single": single}
     except Exception as error:
         # handle the exception
         print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
         sys.exit(1)
 
+    if args.barcode_kits:
+        def open_barcode_file(path, new):
+            try:
+                bc_file = open_output(args, get_shard_path(path, shard), pool, shard, mode='xb' if new else 'ab', buffering=DEMUX_BUFFER_SIZE)
+            except Exception as error:
+                # handle the exception
+                print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
+                sys.exit(1)
+            if new and SAM_OUT and shard is None:
+                sam_header(bc_file, model_version_id, model_config_name)
+            return bc_file
+        bc_files = BarcodeFiles(open_barcode_file, args.barcode_max_open)
+
+    # read id -> file and offset index of the records written
+    INDEX = None
+    if args.read_index:
+        INDEX = ReadIndex(get_shard_path(get_index_path(args.output), shard))
+        # reads are found in the combined output, so the barcode files are only indexed when it isn't written
+        if args.barcode_kits and args.barcode_split_only:
+            bc_files.index = INDEX
+
+    # journal of completed parent read ids, so --resume doesn't need to parse the outputs
+    # not used for duplex, where parent ids are pairs of reads
+    JOURNAL = None
+    if args.journal and not args.duplex:
+        JOURNAL = open_journal(get_journal_path(get_shard_path(args.output, shard)))
+        if JOURNAL is not None and args.barcode_kits:
+            bc_files.sync = True
+
     batch_start_time = time.perf_counter()
     while True:
         bcalled_list = []
@@ -186,6 +309,9 @@ def write_worker(args, q, files, SAM_OUT, model_version_id, model_config_name, g
         batch_start_time = time.perf_counter()
         if bcalled_list is None:
             break
+        # records of the batch for each output, written with one write each
+        out_records = {fkey: [] for fkey in OUT}
+        out_reads = {fkey: [] for fkey in OUT}
         for read in bcalled_list:
             fkey = "single"
             if args.qscore:
@@ -193,117 +319,83 @@ def write_worker(args, q, files, SAM_OUT, model_version_id, model_config_name, g
                     fkey = "pass"
                 else:
                     fkey = "fail"
-            # write sequencing_summary file
-            if SUMMARY is not None:
-                summary_str = read["sum_out"]
-                sum_out = files[fkey] + "\t" + summary_str
-                write_summary(SUMMARY, sum_out)
-            
+            out_file = files[fkey]
+
             if args.barcode_kits:
                 # write barcode summary
                 bc_summary_str = read["bc_sum_out"]
                 write_summary(BARCODE_SUMMARY, bc_summary_str)
-                
-                # prep barcode writing
-                barcode = read["barcode_arrangement"]
-                barcode_name = barcode
-                if fkey == "pass":
-                    barcode_name = barcode + "_" + "pass"
-                elif fkey == "fail":
-                    barcode_name = barcode + "_" + "fail"
-                
-                # create file for new detected barcodes
-                if barcode_name not in bc_files:
-                    fff = args.output.split(".")
-                    # doing [-1:] rather than [-1] gives a list back
-                    name, ext = [".".join(fff[:-1])], fff[-1:]
-                    # if just a single output
-                    bcod_file = ".".join(name + [barcode] + ext)
-                    # otherwise split on pass/fail
-                    if fkey == "pass":
-                        bcod_file = ".".join(name + ["pass"] + [barcode] + ext)
-                    elif fkey == "fail":
-                        bcod_file = ".".join(name + ["fail"] + [barcode] + ext)
-                    try:
-                        bc_files[barcode_name] = open(bcod_file, 'x')
-                    except Exception as error:
-                        # handle the exception
-                        print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
-                        sys.exit(1)
-                    if SAM_OUT:
-                        bc_writer = bc_files[barcode_name]
-                        sam_header(bc_writer, model_version_id, model_config_name)
-
-                # write the barcode split sam/fastq
-                bc_writer = bc_files[barcode_name]
-                if SAM_OUT:
-                    # TODO: Add duplex calling to the barcoded output
-                    if args.above_7412:
-                        sam_tags = "MN:i:{}\tqs:f:{}\tmx:i:{}\tch:i:{}\tns:i:{}\tts:i:{}\tsm:f:{}\tsd:f:{}\tsv:Z:{}\tdu:f:{}".format(read["sequence_length"],
-                                                                                                                        read["float_read_qscore"],
-                                                                                                                        read["mux"],
-                                                                                                                        read["channel"],
-                                                                                                                        read["num_samples"],
-                                                                                                                        read["trimmed_samples"],
-                                                                                                                        read["scaling_median"],
-                                                                                                                        read["scaling_med_abs_dev"],
-                                                                                                                        read["scaling_version"],
-                                                                                                                        read["duration"])
-                        if args.above_768:
-                            if args.estimate_poly_a:
-                                sam_tags = "{}\tpt:i:{}\tpa:B:i:{}".format(sam_tags, read["poly_tail_length"], read["poly_tail_info"])
-                            if read["split_read"]:
-                                sam_tags = "{}\tsp:i:{}".format(sam_tags, read["split_point"])
-                        if args.call_mods:
-                            bc_writer.write("{}\tBC:Z:{}\n".format(read["sam_record"], barcode))
-                        # elif args.moves_out or args.above_798:
-                        elif args.moves_out:
-                            m = read["move_table"].tolist()
-                            move_str = ','.join(map(str, m))
-                            bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\t{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, sam_tags, read["parent_read_id"], barcode))
-                        else:
-                            bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\t{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], sam_tags, read["parent_read_id"], barcode))
-
-                    else:
-                        if args.call_mods:
-                            if args.do_read_splitting:
-                                bc_writer.write("{}\tpi:Z:{}\tBC:Z:{}\n".format(read["sam_record"], read["parent_read_id"], barcode))
-                            else:
-                                bc_writer.write("{}\tBC:Z:{}\n".format(read["sam_record"], barcode))
-                        elif args.moves_out:
-                            m = read["move_table"].tolist()
-                            move_str = ','.join(map(str, m))
-                            if args.do_read_splitting:
-                                bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["parent_read_id"], barcode))
-                            else:
-                                # do ns and ts tags
-                                bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tns:i:{}\tts:i:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["num_samples"], read["trimmed_samples"], barcode))
-                        else:
-                            if args.do_read_splitting:
-                                bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tpi:Z:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["float_read_qscore"], read["parent_read_id"], barcode))
-                            else:
-                                # do ns and ts tags
-                                bc_writer.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tns:i:{}\tts:i:{}\tBC:Z:{}\n".format(read["read_id"], read["sequence"], read["qscore"], read["float_read_qscore"], read["num_samples"], read["trimmed_samples"], barcode))
 
-                else:
-                    bc_writer.write("{} barcode={} basecall_gpu={}\n".format(read["header"], barcode, "_".join(gpu_name.split(" "))))
-                    bc_writer.write("{}\n".format(read["sequence"]))
-                    bc_writer.write("+\n")
-                    bc_writer.write("{}\n".format(read["qscore"]))
+                # the barcode split sam/fastq
+                bcod_file = get_barcode_path(args, read["barcode_arrangement"], fkey)
+                bc_files.add(bcod_file, read["bc_record"], read)
+                if args.barcode_split_only:
+                    out_file = bcod_file
 
-            write_output(args, read, OUT[fkey], SAM_OUT, gpu_name)
+            # write sequencing_summary file
+            if SUMMARY is not None:
+                summary_str = read["sum_out"]
+                sum_out = out_file + "\t" + summary_str
+                write_summary(SUMMARY, sum_out)
+            if COLUMNS is not None:
+                COLUMNS.add(out_file, read["sum_row"])
+
+            if fkey in out_records:
+                out_records[fkey].append(read["record"])
+                out_reads[fkey].append(read)
+
+        for fkey in out_records:
+            if INDEX is not None:
+                INDEX.add(get_shard_path(files[fkey], shard), OUT[fkey], out_records[fkey], out_reads[fkey])
+            write_output(args, out_records[fkey], OUT[fkey])
+        if args.barcode_kits:
+            bc_files.write()
+            if args.barcode_split_only:
+                count_reads(args, len(bcalled_list))
+        if JOURNAL is not None or INDEX is not None:
+            # flush the outputs first, and fsync them if there is a journal, so a journaled read
+            # is always in the output, even if the system goes down
+            for OUTFILE in OUT.values():
+                OUTFILE.flush()
+                if JOURNAL is not None:
+                    os.fsync(OUTFILE.fileno())
+            if args.barcode_kits:
+                bc_files.flush()
+        if INDEX is not None:
+            INDEX.flush()
+        if JOURNAL is not None:
+            parent_ids = set(read["parent_read_id"] for read in bcalled_list)
+            JOURNAL = write_journal(JOURNAL, parent_ids)
+            if JOURNAL is None and args.barcode_kits:
+                bc_files.sync = False
         q.task_done()
     
-    if len(OUT.keys()) > 1:
-        OUT["pass"].close()
-        OUT["fail"].close()
-    else:
-        OUT["single"].close()
+    for OUTFILE in OUT.values():
+        OUTFILE.close()
+    if args.barcode_kits:
+        bc_files.close()
+    if JOURNAL is not None:
+        JOURNAL.close()
+    if INDEX is not None:
+        INDEX.close()
+    if SUMMARY is not None:
+        SUMMARY.close()
+    if COLUMNS is not None:
+        COLUMNS.close()
     if args.barcode_kits:
-        for fffile in bc_files:
-            bc_files[fffile].close()
+        BARCODE_SUMMARY.close()
+    if pool is not None:
+        pool.shutdown()
     
-    print("Total reads: {}".format(total_reads))
+    worker_name = "write_worker"
+    if shard is None:
+        print("Total reads: {}".format(total_reads))
+    else:
+        worker_name = "write_worker_{}".format(shard)
+        print("Writer {} total reads: {}".format(shard, total_reads))
+
+    if args.stats:
+        print_proc_stats(worker_name, reads=total_reads)
     
     if args.profile:
         pr.disable()
@@ -311,90 +403,137 @@ def write_worker(args, q, files, SAM_OUT, model_version_id, model_config_name, g
         sortby = 'cumulative'
         ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
         ps.print_stats()
-        with open("write_worker.log", 'w') as f:
+        with open("{}.log".format(worker_name), 'w') as f:
             print(s.getvalue(), file=f)
 
-def write_output(args, read, OUT, SAM_OUT, gpu_name):
+def write_output(args, records, OUT):
     '''
-    write the ouput to the file
+    write the ouput records of a batch to the file
+    the records were rendered by the workers that basecalled the reads (see render.py)
+    '''
+    if len(records) == 0:
+        return
+    OUT.write(b"".join(records))
+    count_reads(args, len(records))
+
+def count_reads(args, n):
+    '''
+    count reads written, and print the progress
     '''
-    read_id = read["read_id"]
-    if SAM_OUT:
-        if args.above_7412:
-            sam_tags = "MN:i:{}\tqs:f:{}\tmx:i:{}\tch:i:{}\tns:i:{}\tts:i:{}\tsm:f:{}\tsd:f:{}\tsv:Z:{}\tdu:f:{}".format(read["sequence_length"],
-                                                                                                                        read["float_read_qscore"],
-                                                                                                                        read["mux"],
-                                                                                                                        read["channel"],
-                                                                                                                        read["num_samples"],
-                                                                                                                        read["trimmed_samples"],
-                                                                                                                        read["scaling_median"],
-                                                                                                                        read["scaling_med_abs_dev"],
-                                                                                                                        read["scaling_version"],
-                                                                                                                        read["duration"])
-            if args.above_768:
-                if args.estimate_poly_a:
-                    sam_tags = "{}\tpt:i:{}\tpa:B:i:{}".format(sam_tags, read["poly_tail_length"], read["poly_tail_info"])
-                if read["split_read"]:
-                    sam_tags = "{}\tsp:i:{}".format(sam_tags, read["split_point"])
-            if args.duplex:
-                duplex_tag = "0"
-                if read["duplex_strand_1"] is not None:
-                    duplex_tag = "1"
-                if read["duplex_parent"]:
-                    duplex_tag = "-1"
-                if args.call_mods:
-                    OUT.write("{}\tpi:Z:{}\tdx:i:{}\n".format(read["sam_record"], read["parent_read_id"], duplex_tag))
-                # elif args.moves_out or args.above_798:
-                elif args.moves_out:
-                    m = read["move_table"].tolist()
-                    move_str = ','.join(map(str, m))
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\t{}\tdx:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], sam_tags, duplex_tag))
-                else:
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\tqs:f:{}\tdx:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], read["float_read_qscore"], duplex_tag))
-            else:
-                if args.call_mods:
-                    OUT.write("{}\n".format(read["sam_record"]))
-                # elif args.moves_out or args.above_798:
-                elif args.moves_out:
-                    m = read["move_table"].tolist()
-                    move_str = ','.join(map(str, m))
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\t{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], sam_tags))
-                else:
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\t{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], sam_tags))
-        else:
-            if args.call_mods:
-                if args.do_read_splitting:
-                    OUT.write("{}\tpi:Z:{}\n".format(read["sam_record"], read["parent_read_id"]))
-                else:
-                    OUT.write("{}\n".format(read["sam_record"]))
-            elif args.moves_out:
-                m = read["move_table"].tolist()
-                move_str = ','.join(map(str, m))
-                if args.do_read_splitting:
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tpi:Z:{}\tqs:f:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["parent_read_id"], read["float_read_qscore"]))
-                else:
-                    # do ns and ts tags
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tmv:B:c,{},{}\tqs:f:{}\tns:i:{}\tts:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["model_stride"], move_str, read["float_read_qscore"], read["num_samples"], read["trimmed_samples"]))
-            else:
-                if args.do_read_splitting:
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tpi:Z:{}\tqs:f:{}\n".format(read_id, read["sequence"], read["qscore"], read["parent_read_id"], read["float_read_qscore"]))
-                else:
-                    # do ns and ts tags
-                    OUT.write("{}\t4\t*\t0\t0\t*\t*\t0\t0\t{}\t{}\tqs:f:{}\tns:i:{}\tts:i:{}\n".format(read_id, read["sequence"], read["qscore"], read["float_read_qscore"], read["num_samples"], read["trimmed_samples"]))
-    else:
-        # write fastq
-        OUT.write("{} basecall_gpu={}\n".format(read["header"], "_".join(gpu_name.split(" "))))
-        OUT.write("{}\n".format(read["sequence"]))
-        OUT.write("+\n")
-        OUT.write("{}\n".format(read["qscore"]))
     global total_reads
     global div
-    total_reads += 1
+    prev_reads = total_reads
+    total_reads += n
     if not args.quiet:
-        if total_reads % div == 0:
+        if total_reads // div > prev_reads // div:
             print("processed reads: %d" % total_reads)
             # TODO: Add duplex read count here as well with (%)
             sys.stdout.flush()
         # don't make div larger than 500K
         if total_reads >= div*10 and div <= 50000:
             div = div*10
+
+
+def merge_files(OUT, paths):
+    """
+    append each file in paths that exists to OUT, in order, removing them once OUT is fsynced
+    returns {path: position in OUT where it starts}
+    """
+    starts = {}
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        starts[path] = OUT.tell()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, OUT, MERGE_BUFSIZE)
+    OUT.flush()
+    os.fsync(OUT.fileno())
+    for path in starts:
+        os.remove(path)
+    return starts
+
+
+def merge_shards(args, files, writers, SAM_OUT, model_version_id, model_config_name):
+    """
+    merge the shards written by --writers N into the usual output, barcode, summary and journal files
+    shards are always concatenated in writer order, and headers are written once, here
+    """
+    name, ext = split_output(args.output)
+    outputs = set(files.values())
+    if args.barcode_kits and args.barcode_split_only:
+        outputs = set()
+    if args.barcode_kits:
+        # barcode files are only made by the writers that saw the barcode
+        for shard in range(writers):
+            for path in glob.glob("{}.*.{}".format(glob.escape(name), glob.escape(get_shard_path(ext, shard)))):
+                outputs.add(path[:-len(get_shard_path("", shard))])
+
+    # where each shard starts in its merged file, for the read index
+    bases = {}
+    for output in sorted(outputs):
+        try:
+            OUT = open_output(args, output)
+        except Exception as error:
+            # handle the exception
+            print("ERROR: An exception occurred file opening:", type(error).__name__, "-", error)
+            sys.exit(1)
+        if SAM_OUT:
+            sam_header(OUT, model_version_id, model_config_name)
+        shards = [get_shard_path(output, shard) for shard in range(writers)]
+        if args.bam_out or args.gz_out:
+            # the shards are already bgzf blocks, so they are copied as they are after the header
+            OUT.flush()
+            starts = merge_files(OUT.f, shards)
+        else:
+            starts = merge_files(OUT, shards)
+        OUT.close()
+        for shard, shard_path in enumerate(shards):
+            if shard_path in starts:
+                bases[(os.path.abspath(output), shard)] = starts[shard_path]
+
+    summaries = []
+    if args.seq_sum and args.seq_sum_format in ["txt", "both"]:
+        summaries.append((get_summary_path(args, "sequencing_summary.txt"), SUMMARY_HEADER))
+    if args.barcode_kits:
+        summaries.append((get_summary_path(args, "barcoding_summary.txt"), BARCODE_SUMMARY_HEADER))
+    for summary_path, header in summaries:
+        shards = [get_shard_path(summary_path, shard) for shard in range(writers)]
+        if args.gz_out:
+            SUMMARY = open_summary(args, summary_path)
+            if SUMMARY.tell() == 0:
+                write_summary(SUMMARY, header)
+            SUMMARY.flush()
+            merge_files(SUMMARY.f, shards)
+            SUMMARY.close()
+        else:
+            with open(summary_path, "ab") as SUMMARY:
+                if SUMMARY.tell() == 0:
+                    SUMMARY.write("{}\n".format(header).encode())
+                merge_files(SUMMARY, shards)
+    if args.seq_sum and args.seq_sum_format in ["npz", "both"]:
+        columns_path = get_summary_path(args, "sequencing_summary.npz", compress=False)
+        shards = [get_shard_path(columns_path, shard) for shard in range(writers)]
+        # a resumed run adds to the summary of the run before it
+        if os.path.isfile(columns_path):
+            shards = [columns_path] + shards
+        merge_columnar_summaries(columns_path, shards)
+
+    if args.read_index:
+        index_path = get_index_path(args.output)
+        merge_indexes(index_path, [get_shard_path(index_path, shard) for shard in range(writers)], bases)
+
+    if args.journal and not args.duplex:
+        journals = [get_journal_path(get_shard_path(args.output, shard)) for shard in range(writers)]
+        # a writer drops its journal if the read ids aren't UUIDs, so then there is no journal for the run
+        JOURNAL = None
+        if all(os.path.isfile(journal) for journal in journals):
+            JOURNAL = open_journal(get_journal_path(args.output))
+        if JOURNAL is not None:
+            for journal in journals:
+                JOURNAL.write(read_journal(journal))
+            JOURNAL.flush()
+            os.fsync(JOURNAL.fileno())
+            JOURNAL.close()
+        for journal in journals:
+            if os.path.isfile(journal):
+                os.remove(journal)
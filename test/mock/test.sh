@@ -0,0 +1,120 @@
+#!/bin/bash
+
+# MIT License
+
+# Copyright (c) 2023 Hasindu Gamaarachchi
+# Copyright (c) 2023 James Ferguson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# script to execute buttery-eel with the built-in mock server on a small generated dataset
+# no GPU, guppy/dorado or test data needed, so it can run in CI
+
+die() {
+    echo "Error: $@" >&2
+    exit 1
+}
+
+# parent read ids in a fastq file, one per line, sorted
+fastq_ids() {
+    awk '{if(NR%4==1) {print $2}}' $1 | cut -d "=" -f 2 | sort
+}
+
+#defaults if not set
+test -z "$EEL" && EEL=buttery-eel
+test -z $NUM_READS && NUM_READS=200
+test -z $EEL_OUT_TMP && EEL_OUT_TMP=buttery_eel_mock_tmp
+
+#cleanups
+test -d ${EEL_OUT_TMP} && rm -r ${EEL_OUT_TMP}
+mkdir ${EEL_OUT_TMP} || die "Failed to create ${EEL_OUT_TMP}"
+
+echo "Generating ${NUM_READS} reads"
+python3 - ${EEL_OUT_TMP}/reads.blow5 ${NUM_READS} <<'EOF' || die "Failed to generate the test blow5"
+import sys
+import uuid
+import numpy as np
+import pyslow5
+
+s = pyslow5.Open(sys.argv[1], 'w')
+header, end_reason_labels = s.get_empty_header(aux=True)
+header = {k: "mock" for k in header}
+header["run_id"] = "mock_run"
+s.write_header(header, end_reason_labels=end_reason_labels)
+rng = np.random.default_rng(1)
+records = {}
+auxs = {}
+for i in range(int(sys.argv[2])):
+    record, aux = s.get_empty_record(aux=True)
+    read_id = str(uuid.UUID(int=int(rng.integers(0, 2**63))))
+    length = int(rng.integers(1000, 20000))
+    record.update(read_id=read_id, read_group=0, digitisation=8192.0, offset=10.0, range=1400.0,
+                  sampling_rate=5000.0, len_raw_signal=length, signal=rng.integers(300, 700, length).astype(np.int16))
+    aux.update(channel_number=str(i % 512 + 1), median_before=200.0, read_number=i, start_mux=1, start_time=i * 1000,
+               end_reason=4, tracked_scaling_shift=0.0, tracked_scaling_scale=1.0, predicted_scaling_shift=0.0,
+               predicted_scaling_scale=1.0, num_reads_since_mux_change=0, time_since_mux_change=0.0, num_minknow_events=1,
+               open_pore_level=0.0, expected_open_pore_level=0.0, selected_read_level=0.0)
+    records[read_id] = record
+    auxs[read_id] = aux
+s.write_record_batch(records, threads=1, batchsize=100, aux=auxs)
+s.close()
+EOF
+
+echo "Running buttery-eel fastq"
+mkdir ${EEL_OUT_TMP}/fastq || die "Failed to create ${EEL_OUT_TMP}/fastq"
+${EEL} --mock_server -i ${EEL_OUT_TMP}/reads.blow5 -o ${EEL_OUT_TMP}/fastq/reads.fastq --procs 2 --slow5_batchsize 50 --seq_sum --journal ${OPTS_EEL} &> ${EEL_OUT_TMP}/fastq.log || { cat ${EEL_OUT_TMP}/fastq.log; die "buttery-eel fastq run failed"; }
+fastq_ids ${EEL_OUT_TMP}/fastq/reads.fastq > ${EEL_OUT_TMP}/fastq/reads.ids
+test $(wc -l < ${EEL_OUT_TMP}/fastq/reads.ids) -eq ${NUM_READS} || die "fastq: expected ${NUM_READS} reads"
+test -z "$(uniq -d ${EEL_OUT_TMP}/fastq/reads.ids)" || die "fastq: duplicate reads found"
+test $(wc -l < ${EEL_OUT_TMP}/fastq/sequencing_summary.txt) -eq $((NUM_READS + 1)) || die "fastq: sequencing summary does not match the reads"
+test -s ${EEL_OUT_TMP}/fastq/reads.fastq.journal || die "fastq: journal not written"
+
+echo "Running buttery-eel fastq.gz"
+mkdir ${EEL_OUT_TMP}/fastq_gz || die "Failed to create ${EEL_OUT_TMP}/fastq_gz"
+${EEL} --mock_server -i ${EEL_OUT_TMP}/reads.blow5 -o ${EEL_OUT_TMP}/fastq_gz/reads.fastq.gz --procs 2 --slow5_batchsize 50 ${OPTS_EEL} &> ${EEL_OUT_TMP}/fastq_gz.log || { cat ${EEL_OUT_TMP}/fastq_gz.log; die "buttery-eel fastq.gz run failed"; }
+gzip -t ${EEL_OUT_TMP}/fastq_gz/reads.fastq.gz || die "fastq.gz: output is not valid gzip"
+gzip -dc ${EEL_OUT_TMP}/fastq_gz/reads.fastq.gz > ${EEL_OUT_TMP}/fastq_gz/reads.fastq
+diff <(sort ${EEL_OUT_TMP}/fastq/reads.fastq) <(sort ${EEL_OUT_TMP}/fastq_gz/reads.fastq) > /dev/null || die "fastq.gz: reads differ from the fastq run"
+
+echo "Running buttery-eel bam"
+mkdir ${EEL_OUT_TMP}/bam || die "Failed to create ${EEL_OUT_TMP}/bam"
+${EEL} --mock_server -i ${EEL_OUT_TMP}/reads.blow5 -o ${EEL_OUT_TMP}/bam/reads.bam --procs 2 --slow5_batchsize 50 --seq_sum ${OPTS_EEL} &> ${EEL_OUT_TMP}/bam.log || { cat ${EEL_OUT_TMP}/bam.log; die "buttery-eel bam run failed"; }
+gzip -t ${EEL_OUT_TMP}/bam/reads.bam || die "bam: output is not valid bgzf"
+test "$(gzip -dc ${EEL_OUT_TMP}/bam/reads.bam | head -c 3)" = "BAM" || die "bam: missing BAM magic"
+test $(wc -l < ${EEL_OUT_TMP}/bam/sequencing_summary.txt) -eq $((NUM_READS + 1)) || die "bam: sequencing summary does not match the reads"
+
+echo "Running buttery-eel fastq with 2 writers"
+mkdir ${EEL_OUT_TMP}/writers || die "Failed to create ${EEL_OUT_TMP}/writers"
+${EEL} --mock_server -i ${EEL_OUT_TMP}/reads.blow5 -o ${EEL_OUT_TMP}/writers/reads.fastq --procs 2 --slow5_batchsize 50 --writers 2 --journal ${OPTS_EEL} &> ${EEL_OUT_TMP}/writers.log || { cat ${EEL_OUT_TMP}/writers.log; die "buttery-eel --writers 2 run failed"; }
+diff <(sort ${EEL_OUT_TMP}/fastq/reads.fastq) <(sort ${EEL_OUT_TMP}/writers/reads.fastq) > /dev/null || die "writers: reads differ from the fastq run"
+test $(python3 -c "import os, sys; print((os.path.getsize(sys.argv[1]) - 8) // 16)" ${EEL_OUT_TMP}/writers/reads.fastq.journal) -eq ${NUM_READS} || die "writers: merged journal does not hold every read"
+
+echo "truncating the journal to simulate an unfinished run"
+mkdir ${EEL_OUT_TMP}/resume || die "Failed to create ${EEL_OUT_TMP}/resume"
+# 8 byte magic, then 16 bytes per read id
+head -c $((8 + 16 * NUM_READS / 2)) ${EEL_OUT_TMP}/fastq/reads.fastq.journal > ${EEL_OUT_TMP}/resume/truncated.journal
+
+echo "Running buttery-eel with resume"
+${EEL} --mock_server -i ${EEL_OUT_TMP}/reads.blow5 -o ${EEL_OUT_TMP}/resume/reads.fastq --procs 2 --slow5_batchsize 50 --resume ${EEL_OUT_TMP}/resume/truncated.journal ${OPTS_EEL} &> ${EEL_OUT_TMP}/resume.log || { cat ${EEL_OUT_TMP}/resume.log; die "buttery-eel --resume run failed"; }
+fastq_ids ${EEL_OUT_TMP}/resume/reads.fastq > ${EEL_OUT_TMP}/resume/reads.ids
+test $(wc -l < ${EEL_OUT_TMP}/resume/reads.ids) -eq $((NUM_READS - NUM_READS / 2)) || die "resume: expected $((NUM_READS - NUM_READS / 2)) reads"
+python3 -c "import sys, uuid; d = open(sys.argv[1], 'rb').read()[8:]; print('\n'.join(str(uuid.UUID(bytes=d[i:i + 16])) for i in range(0, len(d), 16)))" ${EEL_OUT_TMP}/resume/truncated.journal > ${EEL_OUT_TMP}/resume/journal.ids
+diff ${EEL_OUT_TMP}/fastq/reads.ids <(sort ${EEL_OUT_TMP}/resume/journal.ids ${EEL_OUT_TMP}/resume/reads.ids) > /dev/null || die "resume: journal and resumed reads do not add up to the full run"
+
+echo "Test passed"
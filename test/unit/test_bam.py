@@ -0,0 +1,80 @@
+import struct
+
+import numpy as np
+import pytest
+
+from buttery_eel.bam import sam_to_bam, bam_header, bam_parent_ids
+from buttery_eel.bgzf import BGZFWriter
+
+HEADER = "@HD\tVN:1.6\tSO:unknown\n@PG\tID:basecaller\tPN:test\n"
+SEQ = "ACGTNACGTAC"
+QUAL = "5+&'()*+,-."
+RECORD = "\t".join(["read_1", "4", "*", "0", "0", "*", "*", "0", "0", SEQ, QUAL,
+                    "pi:Z:parent_1", "qs:i:300", "du:f:1.5", "ch:i:-7", "ML:B:C,1,255,0", "pa:B:i,-1,20,300"])
+
+
+def test_sam_to_bam_fields():
+    data = sam_to_bam(RECORD)
+    block_size = struct.unpack_from("<i", data)[0]
+    assert block_size == len(data) - 4
+    ref_id, pos, l_read_name, mapq, bin_, n_cigar_op, flag, l_seq, next_ref_id, next_pos, tlen = struct.unpack_from("<iiBBHHHiiii", data, 4)
+    assert (ref_id, pos, mapq, n_cigar_op, flag, l_seq, next_ref_id, next_pos, tlen) == (-1, -1, 0, 0, 4, len(SEQ), -1, -1, 0)
+    assert bin_ == 4680
+    i = 36
+    assert data[i:i + l_read_name] == b"read_1\x00"
+    i += l_read_name
+    packed = data[i:i + (l_seq + 1) // 2]
+    codes = "=ACMGRSVTWYHKDBN"
+    seq = "".join(codes[b >> 4] + codes[b & 0xf] for b in packed)[:l_seq]
+    assert seq == SEQ
+    i += (l_seq + 1) // 2
+    assert bytes(q + 33 for q in data[i:i + l_seq]).decode() == QUAL
+    i += l_seq
+    tags = data[i:]
+    assert tags.startswith(b"piZparent_1\x00")
+    assert b"qsS" + struct.pack("<H", 300) in tags
+    assert b"duf" + struct.pack("<f", 1.5) in tags
+    assert b"chc" + struct.pack("<b", -7) in tags
+    assert b"MLBC" + struct.pack("<i", 3) + bytes([1, 255, 0]) in tags
+    assert b"paBi" + struct.pack("<iiii", 3, -1, 20, 300) in tags
+
+
+def test_sam_to_bam_arrays_and_empty():
+    arrays = {"mv": ("c", np.array([6, 1, 0, 1], dtype=np.int8))}
+    record = "\t".join(["read_2", "4", "*", "0", "0", "*", "*", "0", "0", "*", "*", "mv:B:c,6,1,0,1", "ML:B:C"])
+    data = sam_to_bam(record, arrays)
+    assert struct.unpack_from("<i", data, 20)[0] == 0
+    assert data.endswith(b"mvBc" + struct.pack("<i", 4) + bytes([6, 1, 0, 1]) + b"MLBC" + struct.pack("<i", 0))
+
+
+def test_sam_to_bam_rejects_aligned():
+    record = RECORD.replace("\t*\t0\t0\t*", "\tchr1\t10\t0\t11M", 1)
+    with pytest.raises(ValueError):
+        sam_to_bam(record)
+
+
+def test_bam_round_trip(tmp_path):
+    path = str(tmp_path / "reads.bam")
+    records = [RECORD.replace("read_1", "read_{}".format(i)).replace("parent_1", "parent_{}".format(i // 2)) for i in range(10)]
+    records.append("\t".join(["read_no_pi", "4", "*", "0", "0", "*", "*", "0", "0", SEQ, QUAL, "qs:i:10"]))
+    out = BGZFWriter(path)
+    out.write(bam_header(HEADER))
+    for record in records:
+        out.write(sam_to_bam(record))
+    out.close()
+    assert list(bam_parent_ids(path)) == ["parent_{}".format(i // 2) for i in range(10)] + ["read_no_pi"]
+
+    pysam = pytest.importorskip("pysam")
+    with pysam.AlignmentFile(path, "rb", check_sq=False) as bam:
+        assert bam.header.to_dict()["PG"][0]["ID"] == "basecaller"
+        read = next(bam.fetch(until_eof=True))
+        assert read.query_name == "read_0"
+        assert read.is_unmapped
+        assert read.query_sequence == SEQ
+        assert pysam.qualities_to_qualitystring(read.query_qualities) == QUAL
+        assert read.get_tag("pi") == "parent_0"
+        assert read.get_tag("ch") == -7
+        assert read.get_tag("du") == pytest.approx(1.5)
+        assert list(read.get_tag("ML")) == [1, 255, 0]
+        assert list(read.get_tag("pa")) == [-1, 20, 300]
+        assert sum(1 for _ in bam.fetch(until_eof=True)) == len(records) - 1
@@ -0,0 +1,86 @@
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from buttery_eel.bgzf import BGZFWriter, BGZFReader, BGZF_BLOCK_SIZE, BGZF_EOF
+
+
+def make_records(n, seed=1):
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n):
+        seq = "".join(rng.choice(list("ACGT"), int(rng.integers(1, 3000))))
+        records.append("@read_{}\n{}\n+\n{}\n".format(i, seq, "5" * len(seq)).encode())
+    return records
+
+
+@pytest.mark.parametrize("threads", [0, 3])
+def test_virtual_offsets_round_trip(tmp_path, threads):
+    path = str(tmp_path / "reads.fastq.gz")
+    records = make_records(300)
+    pool = ThreadPoolExecutor(threads) if threads > 0 else None
+    out = BGZFWriter(path, pool=pool, max_pending=2, track=True)
+    offsets = []
+    # in batches, as the writer does, flushing before asking for the offsets
+    for i in range(0, len(records), 40):
+        batch = records[i:i + 40]
+        positions = []
+        for record in batch:
+            positions.append(out.utell())
+            out.write(record)
+        out.flush()
+        offsets += out.virtual_offsets(positions)
+    out.close()
+    if pool is not None:
+        pool.shutdown()
+
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == b"".join(records)
+    with open(path, 'rb') as f:
+        assert f.read().endswith(BGZF_EOF)
+
+    reader = BGZFReader(path)
+    # in a different order to how they were written, and across block boundaries
+    for i in list(range(len(records)))[::-7] + [0, len(records) - 1]:
+        reader.seek_virtual(offsets[i])
+        assert b"".join(reader.readline() for _ in range(4)) == records[i]
+    reader.seek_virtual(offsets[10])
+    assert reader.read(len(records[10]) + len(records[11])) == records[10] + records[11]
+    reader.close()
+
+
+def test_blocks_are_at_most_block_size(tmp_path):
+    path = str(tmp_path / "big.gz")
+    data = np.random.default_rng(2).integers(0, 256, BGZF_BLOCK_SIZE * 3 + 100, dtype=np.uint8).tobytes()
+    out = BGZFWriter(path)
+    out.write(data)
+    out.close()
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == data
+    reader = BGZFReader(path)
+    sizes = []
+    while reader._read_block() and len(reader.block) > 0:
+        sizes.append(len(reader.block))
+    reader.close()
+    assert sizes == [BGZF_BLOCK_SIZE] * 3 + [100]
+
+
+def test_no_eof_parts_join(tmp_path):
+    # shards are written without the EOF block and joined by the merge
+    parts = [b"first part\n" * 1000, b"second part\n" * 1000]
+    paths = []
+    for i, data in enumerate(parts):
+        paths.append(str(tmp_path / "part{}.gz".format(i)))
+        out = BGZFWriter(paths[-1], eof=False)
+        out.write(data)
+        out.close()
+    joined = str(tmp_path / "joined.gz")
+    with open(joined, 'wb') as f:
+        for path in paths:
+            with open(path, 'rb') as part:
+                f.write(part.read())
+        f.write(BGZF_EOF)
+    with gzip.open(joined, 'rb') as f:
+        assert f.read() == b"".join(parts)
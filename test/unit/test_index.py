@@ -0,0 +1,110 @@
+import os
+import uuid
+
+import numpy as np
+
+from buttery_eel.bgzf import BGZFWriter, BGZFReader
+from buttery_eel.index import ReadIndex, write_index, load_index, find_reads, read_record, merge_indexes
+from buttery_eel.read_ids import uuids_to_array
+
+
+def make_reads(n, seed=1):
+    rng = np.random.default_rng(seed)
+    reads = []
+    records = []
+    for i in range(n):
+        read_id = str(uuid.UUID(int=int(rng.integers(0, 2**63))))
+        seq = "".join(rng.choice(list("ACGT"), int(rng.integers(1, 2000))))
+        reads.append({"read_id": read_id, "parent_read_id": read_id})
+        records.append("@{} parent_read_id={}\n{}\n+\n{}\n".format(read_id, read_id, seq, "5" * len(seq)).encode())
+    return reads, records
+
+
+def test_write_index_find_reads(tmp_path):
+    path = str(tmp_path / "reads.fastq.idx")
+    reads, _ = make_reads(50)
+    read_ids = [read["read_id"] for read in reads]
+    ids, _ = uuids_to_array(read_ids + [read_ids[3]])
+    file_codes = np.array([i % 2 for i in range(50)] + [1], dtype="<u4")
+    offsets = np.arange(51, dtype=np.uint64) * 100
+    write_index(path, ["a.fastq", "b.fastq.gz"], [False, True], ids, file_codes, offsets)
+
+    index = load_index(path)
+    assert index[0] == ["a.fastq", "b.fastq.gz"]
+    assert index[1] == [False, True]
+    # sorted by UUID
+    assert np.array_equal(np.sort(index[2]), index[2])
+    found = find_reads(index, [read_ids[7], read_ids[3], "not-a-uuid", str(uuid.UUID(int=1))])
+    # a read id with two entries finds both, in the order they were written
+    assert found == [(read_ids[7], 1, 700), (read_ids[3], 1, 300), (read_ids[3], 1, 5000)]
+
+
+def test_read_index_plain_and_bgzf(tmp_path):
+    reads, records = make_reads(200)
+    # a read split in two, found by its own id and by its parent id
+    parent = reads[5]["read_id"]
+    child = str(uuid.UUID(int=12345))
+    reads.append({"read_id": child, "parent_read_id": parent})
+    records.append("@{} parent_read_id={}\nACGT\n+\n5555\n".format(child, parent).encode())
+
+    index_path = str(tmp_path / "reads.fastq.idx")
+    plain_path = str(tmp_path / "reads.fastq")
+    gz_path = str(tmp_path / "reads.fastq.gz")
+    index = ReadIndex(index_path)
+    plain = open(plain_path, 'wb')
+    gz = BGZFWriter(gz_path, track=True)
+    for i in range(0, len(records), 30):
+        for path, OUT in [(plain_path, plain), (gz_path, gz)]:
+            index.add(path, OUT, records[i:i + 30], reads[i:i + 30])
+            OUT.write(b"".join(records[i:i + 30]))
+            OUT.flush()
+        index.flush()
+    plain.close()
+    gz.close()
+    index.close()
+
+    loaded = load_index(index_path)
+    assert loaded[0] == ["reads.fastq", "reads.fastq.gz"]
+    assert loaded[1] == [False, True]
+    handles = [open(plain_path, 'rb'), BGZFReader(gz_path)]
+    wanted = [reads[i]["read_id"] for i in (0, 29, 30, 150, 200)]
+    found = find_reads(loaded, wanted + [parent])
+    assert len(found) == 2 * len(wanted) + 4
+    for read_id, code, offset in found:
+        f = handles[code]
+        if loaded[1][code]:
+            f.seek_virtual(offset)
+        else:
+            f.seek(offset)
+        record = read_record(f, "fastq")
+        assert record in records
+        assert record.startswith("@{} ".format(read_id).encode()) or read_id == parent
+    for f in handles:
+        f.close()
+
+
+def test_read_index_non_uuid(tmp_path, capsys):
+    index_path = str(tmp_path / "reads.fastq.idx")
+    index = ReadIndex(index_path)
+    with open(str(tmp_path / "reads.fastq"), 'wb') as OUT:
+        index.add(OUT.name, OUT, [b"@read_1\nA\n+\n5\n"], [{"read_id": "read_1", "parent_read_id": "read_1"}])
+    index.close()
+    assert not os.path.exists(index_path)
+    assert "no read index will be written" in capsys.readouterr().out
+
+
+def test_merge_indexes(tmp_path):
+    reads, _ = make_reads(20)
+    read_ids = [read["read_id"] for read in reads]
+    shards = []
+    for shard in range(2):
+        shards.append(str(tmp_path / "reads.fastq.idx.shard{}".format(shard)))
+        ids, _ = uuids_to_array(read_ids[shard * 10:shard * 10 + 10])
+        write_index(shards[-1], ["reads.fastq.shard{}".format(shard)], [False], ids,
+                    np.zeros(10, dtype="<u4"), np.arange(10, dtype=np.uint64) * 10)
+    path = str(tmp_path / "reads.fastq.idx")
+    merge_indexes(path, shards, {(str(tmp_path / "reads.fastq"), 1): 1000})
+    assert not any(os.path.exists(shard) for shard in shards)
+    index = load_index(path)
+    assert index[0] == ["reads.fastq"]
+    assert find_reads(index, [read_ids[2], read_ids[12]]) == [(read_ids[2], 0, 20), (read_ids[12], 0, 1020)]
@@ -0,0 +1,54 @@
+import os
+import uuid
+
+from buttery_eel.journal import open_journal, write_journal, read_journal, find_journal, get_journal_path
+from buttery_eel.read_ids import ReadIDSet
+
+
+def make_ids(n):
+    return [str(uuid.UUID(int=i * 7919 + 1)) for i in range(n)]
+
+
+def test_journal_round_trip(tmp_path):
+    path = get_journal_path(str(tmp_path / "reads.fastq"))
+    ids = make_ids(30)
+    journal = open_journal(path)
+    journal = write_journal(journal, ids[:10])
+    journal = write_journal(journal, ids[10:])
+    journal.close()
+    s = ReadIDSet()
+    s.update_bytes(read_journal(path))
+    assert len(s) == 30
+    assert s.contains(ids).all()
+
+
+def test_journal_cut_short(tmp_path):
+    path = str(tmp_path / "reads.fastq.journal")
+    journal = write_journal(open_journal(path), make_ids(5))
+    # killed mid write of the next record
+    journal.write(b"\x01" * 7)
+    journal.close()
+    assert len(read_journal(path)) == 5 * 16
+    with open(path, 'wb') as f:
+        pass
+    assert read_journal(path) == b""
+
+
+def test_journal_non_uuid(tmp_path, capsys):
+    path = str(tmp_path / "reads.fastq.journal")
+    journal = write_journal(open_journal(path), make_ids(5))
+    ids = make_ids(2)
+    # dashless ids can't be looked up by --resume, so the journal is dropped
+    assert write_journal(journal, [ids[0], ids[1].replace("-", "")]) is None
+    assert not os.path.exists(path)
+    assert "no resume journal will be written" in capsys.readouterr().out
+
+
+def test_find_journal(tmp_path):
+    fastq = str(tmp_path / "reads.fastq")
+    assert find_journal(fastq) is None
+    open(fastq + ".journal", 'wb').close()
+    assert find_journal(fastq) == fastq + ".journal"
+    assert find_journal(fastq + ".journal") == fastq + ".journal"
+    # the journal of a pass/fail run holds the fail reads too, so it isn't used for the pass file
+    assert find_journal(str(tmp_path / "reads.pass.fastq")) is None
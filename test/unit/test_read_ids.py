@@ -0,0 +1,78 @@
+import pickle
+import uuid
+
+import numpy as np
+
+from buttery_eel.read_ids import ReadIDSet, uuids_to_array, UUID_DTYPE
+
+
+def make_ids(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return [str(uuid.UUID(int=int(rng.integers(0, 2**63)) << 64 | int(rng.integers(0, 2**63)))) for _ in range(n)]
+
+
+def test_uuids_to_array_round_trip():
+    ids = make_ids(100)
+    arr, valid = uuids_to_array(ids)
+    assert arr.dtype == UUID_DTYPE
+    assert valid.all()
+    assert [str(uuid.UUID(bytes=arr[i:i + 1].tobytes())) for i in range(len(ids))] == ids
+
+
+def test_uuids_to_array_invalid():
+    good = make_ids(1)[0]
+    ids = [good, good.replace("-", ""), good[:-1], good + "a", good.replace("-", "_", 1), "read_1", good.upper()]
+    arr, valid = uuids_to_array(ids)
+    assert valid.tolist() == [True, False, False, False, False, False, True]
+    # upper case hex is the same UUID
+    assert arr[6] == arr[0]
+
+
+def test_read_id_set_contains():
+    ids = make_ids(1000)
+    s = ReadIDSet()
+    s.update(ids[:300])
+    s.update(ids[300:500])
+    assert len(s) == 500
+    found = s.contains(ids)
+    assert found[:500].all()
+    assert not found[500:].any()
+    assert ids[0] in s
+    assert ids[999] not in s
+
+
+def test_read_id_set_non_uuids():
+    ids = make_ids(10)
+    s = ReadIDSet()
+    s.update(ids[:5] + ["read_1", "read_2"])
+    assert len(s) == 7
+    assert s.contains(ids[4:6] + ["read_1", "read_3"]).tolist() == [True, False, True, False]
+
+
+def test_read_id_set_update_bytes_and_duplicates():
+    ids = make_ids(50)
+    arr, _ = uuids_to_array(ids[:20])
+    s = ReadIDSet()
+    s.update_bytes(arr.tobytes())
+    s.update(ids[10:30])
+    assert len(s) == 30
+    assert s.contains(ids).tolist() == [True] * 30 + [False] * 20
+
+
+def test_read_id_set_empty():
+    s = ReadIDSet()
+    assert not s
+    assert len(s) == 0
+    assert s.contains(make_ids(3)).tolist() == [False, False, False]
+    assert s.contains([]).tolist() == []
+
+
+def test_read_id_set_pickle():
+    ids = make_ids(100)
+    s = ReadIDSet()
+    s.update(ids[:60] + ["read_1"])
+    # pending ids are merged before pickling, as sent to the reader procs
+    t = pickle.loads(pickle.dumps(s))
+    assert t.pending == []
+    assert len(t) == 61
+    assert t.contains(ids + ["read_1"]).tolist() == [True] * 60 + [False] * 40 + [True]